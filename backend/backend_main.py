@@ -1,28 +1,71 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import logging
+import os
 
 # Import services and models
-from services.ml_service import MLService
-from models.farmer_models import SoilData
+from services.analytics_service import UsageAnalyticsMiddleware
+from services.container import ServiceContainer
+from services.ml_service import load_crop_model
+from utils.auth import auth_enabled
+from utils.firestore_writer import get_firestore_writer
+from utils.metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware
+from utils.profiler import get_request_profiler, install_signal_handler, RequestProfilerMiddleware
+from utils.responses import FastJSONResponse, NegotiationMiddleware, CompressionMiddleware
 
 # Import routes
-from routes import weather_routes, soil_routes, ml_routes, alert_routes, market_routes
-# Later: market_routes, voice_routes, pest_routes, farmer_routes
-
-# Initialize ML service
-ml_service = MLService()
+from routes import (
+    weather_routes, soil_routes, ml_routes, alert_routes, market_routes,
+    chatbot_routes, pest_routes, voice_routes, farmer_routes, admin_routes,
+    content_routes, sync_routes, notification_routes, analytics_routes, feedback_routes
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Load the crop model at import so a preloading server shares it across workers
+try:
+    load_crop_model()
+except FileNotFoundError as e:
+    logger.warning(f"{e} ML routes will return 503.")
+
+# -----------------------------
+# Lifespan (runs in each worker, after fork)
+# -----------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not auth_enabled():
+        logger.warning("Authentication disabled (no FIREBASE_PROJECT_ID); all requests run as the dev user")
+    if request_profiler:
+        install_signal_handler()
+        request_profiler.install(asyncio.get_running_loop())
+    writer = get_firestore_writer()
+    if writer:
+        await writer.start()
+    # Services are built once per worker, lazily unless listed in EAGER_SERVICES
+    container = ServiceContainer(overrides=getattr(app.state, "service_overrides", None))
+    app.state.container = container
+    await container.startup([name for name in os.getenv("EAGER_SERVICES", "ml").split(",") if name])
+    try:
+        yield
+    finally:
+        await container.shutdown()
+        # Flush buffered logs/analytics/results before the worker exits
+        if writer:
+            await writer.stop()
+
 # Initialize FastAPI
 app = FastAPI(
     title="Smart Crop Advisory System API",
     description="Backend API for Smart Crop Advisory System for Small and Marginal Farmers",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS Middleware (allow frontend access)
@@ -34,12 +77,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# -----------------------------
-# Utility placeholder
-# -----------------------------
-async def verify_user():
-    # Later replace with Firebase JWT verification
-    return "user_123"
+# Negotiated encoding: MessagePack, then brotli or gzip
+app.add_middleware(NegotiationMiddleware)
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "512")))
+
+# Opt-in profiling (PROFILING_ENABLED): per-route stack sampling + SIGUSR2 stack capture
+request_profiler = get_request_profiler()
+if request_profiler:
+    app.add_middleware(RequestProfilerMiddleware, profiler=request_profiler)
+
+# Per-route latency histograms and in-flight gauge (served at /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Per-feature usage rollups (served at /analytics)
+app.add_middleware(UsageAnalyticsMiddleware)
 
 # -----------------------------
 # Health check
@@ -51,6 +102,10 @@ async def root():
         "status": "healthy"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 # -----------------------------
 # Register routers
 # -----------------------------
@@ -59,29 +114,19 @@ app.include_router(soil_routes.router)
 app.include_router(ml_routes.router)
 app.include_router(alert_routes.router)
 app.include_router(market_routes.router)
+app.include_router(chatbot_routes.router)
+app.include_router(pest_routes.router)
+app.include_router(voice_routes.router)
+app.include_router(farmer_routes.router)
+app.include_router(admin_routes.router)
+app.include_router(content_routes.router)
+app.include_router(sync_routes.router)
+app.include_router(notification_routes.router)
+app.include_router(analytics_routes.router)
+app.include_router(feedback_routes.router)
 
 # -----------------------------
-# ML direct test route (optional)
-# -----------------------------
-@app.post("/ml/recommend-crop")
-async def recommend_crop_ml(soil_data: SoilData, user_id: str = Depends(verify_user)):
-    try:
-        features = [
-            soil_data.ph_level or soil_data.ph,
-            soil_data.nitrogen,
-            soil_data.phosphorus,
-            soil_data.potassium,
-            soil_data.temperature or 25,
-            soil_data.humidity or 60,
-            soil_data.rainfall or 200
-        ]
-        recommendation = ml_service.recommend_crop(features)
-        return {"recommended_crop": recommendation}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# -----------------------------
-# Run app
+# Run app (development; production: python serve.py)
 # -----------------------------
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("backend_main:app", host="0.0.0.0", port=8000, reload=True)
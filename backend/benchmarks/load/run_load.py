@@ -0,0 +1,239 @@
+# benchmarks/load/run_load.py
+"""
+Mixed-traffic load benchmark for every API router.
+
+Boots the app in-process behind httpx.ASGITransport (or targets --url),
+with a stub OpenWeather server and the in-memory Firestore backend, and
+reports throughput plus p50/p95/p99 latency per route.
+
+Run from backend/:
+    python -m benchmarks.load.run_load --concurrency 32 --requests 5000
+    python -m benchmarks.load.run_load --save-baseline release-1.2
+    python -m benchmarks.load.run_load --compare release-1.2 --threshold 15
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.load.stubs import StubOpenWeatherServer
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "baselines")
+
+SOIL = {"ph": 6.8, "nitrogen": 90, "phosphorus": 42, "potassium": 43,
+        "temperature": 21.0, "humidity": 80.0, "rainfall": 200.0,
+        "soil_type": "loamy", "moisture_level": 45, "organic_carbon": 0.6}
+LOCATIONS = [(30.90, 75.85), (31.63, 74.87), (30.21, 74.94), (29.39, 76.96)]
+CROPS = ["wheat", "rice", "maize", "cotton"]
+
+# Tiny valid PNG (1x1) for pest uploads
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082")
+
+Request = Tuple[str, str, Dict]  # (route label, method, httpx kwargs)
+
+
+def _soil(rng: random.Random) -> Dict:
+    soil = dict(SOIL)
+    soil["nitrogen"] = rng.randint(20, 140)
+    soil["ph"] = round(rng.uniform(5.0, 8.0), 1)
+    return soil
+
+
+def _loc(rng: random.Random) -> Dict:
+    lat, lon = rng.choice(LOCATIONS)
+    return {"lat": lat, "lon": lon}
+
+
+# route label -> (weight, request builder)
+TRAFFIC_MIX: Dict[str, Tuple[int, Callable[[random.Random], Request]]] = {
+    "POST /ml/recommend-crop": (10, lambda r: ("POST", "/ml/recommend-crop", {"json": _soil(r)})),
+    "POST /soil/recommend-crop": (10, lambda r: ("POST", "/soil/recommend-crop", {"json": _soil(r)})),
+    "GET /soil/seasonal-recommendations": (5, lambda r: (
+        "GET", "/soil/seasonal-recommendations", {"params": {"season": r.choice(["rabi", "kharif"])}})),
+    "GET /weather/current": (10, lambda r: ("GET", "/weather/current", {"params": _loc(r)})),
+    "GET /weather/forecast": (10, lambda r: (
+        "GET", "/weather/forecast", {"params": {**_loc(r), "days": 5, "crop": r.choice(["wheat", "rice"])}})),
+    "POST /alerts/soil-weather": (8, lambda r: (
+        "POST", "/alerts/soil-weather",
+        {"json": _soil(r), "params": {**_loc(r), "crop": r.choice(["wheat", "rice"]), "days": 3}})),
+    "GET /market/price": (12, lambda r: ("GET", "/market/price", {"params": {"crop": r.choice(CROPS)}})),
+    "GET /market/all": (5, lambda r: ("GET", "/market/all", {})),
+    "POST /pest/detect": (3, lambda r: (
+        "POST", "/pest/detect",
+        {"files": {"image": ("leaf.png", io.BytesIO(PNG_BYTES), "image/png")},
+         "data": {"crop_type": r.choice(CROPS)}})),
+    "POST /chatbot/query": (12, lambda r: (
+        "POST", "/chatbot/query",
+        {"json": {"message": r.choice(["What is the wheat price?", "Will it rain this week?",
+                                       "Which crop should I sow?", "How to control aphids?"]),
+                  "language": "en", "context": {"location": _loc(r), "crop": r.choice(CROPS)}}})),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def run_load(client: httpx.AsyncClient, total_requests: int, concurrency: int,
+                   seed: int, routes: List[str]) -> Dict:
+    rng = random.Random(seed)
+    labels = routes
+    weights = [TRAFFIC_MIX[label][0] for label in labels]
+    plan = rng.choices(labels, weights=weights, k=total_requests)
+    builders = [(label, TRAFFIC_MIX[label][1](rng)) for label in plan]
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    queue = iter(builders)
+
+    async def worker():
+        for label, (method, path, kwargs) in queue:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                if response.status_code >= 400:
+                    errors[label] += 1
+            except Exception:
+                errors[label] += 1
+            latencies[label].append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for label in labels:
+        values = sorted(latencies.get(label, []))
+        if not values:
+            continue
+        results[label] = {
+            "requests": len(values),
+            "errors": errors.get(label, 0),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+    return {
+        "total_requests": total_requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 2),
+        "routes": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold_pct: float) -> List[str]:
+    """Return regression messages for routes slower than baseline by more than threshold."""
+    regressions = []
+    for label, stats in current["routes"].items():
+        base = baseline["routes"].get(label)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[key] and stats[key] > base[key] * (1 + threshold_pct / 100):
+                regressions.append(f"{label} {key}: {base[key]:.2f} -> {stats[key]:.2f} ms")
+    if current["throughput_rps"] < baseline["throughput_rps"] * (1 - threshold_pct / 100):
+        regressions.append(f"throughput: {baseline['throughput_rps']} -> {current['throughput_rps']} rps")
+    return regressions
+
+
+def print_report(report: Dict) -> None:
+    print(f"\n{report['total_requests']} requests, concurrency {report['concurrency']}, "
+          f"{report['elapsed_s']}s, {report['throughput_rps']} req/s")
+    print(f"{'route':<38}{'n':>7}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for label, s in sorted(report["routes"].items()):
+        print(f"{label:<38}{s['requests']:>7}{s['errors']:>6}{s['throughput_rps']:>9}"
+              f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+
+
+def _configure_environment(weather_base_url: str) -> None:
+    os.environ.setdefault("OPENWEATHER_API_KEY", "benchmark")
+    os.environ["OPENWEATHER_BASE_URL"] = weather_base_url
+    os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+    os.environ.setdefault("AUTH_MODE", "disabled")
+
+
+async def main_async(args) -> Dict:
+    routes = [r for r in TRAFFIC_MIX if not args.routes or any(p in r for p in args.routes)]
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            return await run_load(client, args.requests, args.concurrency, args.seed, routes)
+
+    with StubOpenWeatherServer(latency=args.weather_latency_ms / 1000) as stub:
+        _configure_environment(stub.base_url)
+        from backend_main import app
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+                # Warm-up so imports, model load and caches are not timed
+                await run_load(client, min(200, args.requests), args.concurrency, args.seed + 1, routes)
+                return await run_load(client, args.requests, args.concurrency, args.seed, routes)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Mixed-traffic API load benchmark")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--routes", nargs="*", help="Only routes containing these substrings")
+    parser.add_argument("--url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--weather-latency-ms", type=float, default=20.0,
+                        help="Artificial latency of the stub OpenWeather server")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression in percent")
+    parser.add_argument("--json", action="store_true", help="Print the JSON report")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    report["meta"] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "in_process": not args.url,
+    }
+    print(json.dumps(report, indent=2) if args.json else "", end="")
+    print_report(report)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {path}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions vs '{args.compare}' (>{args.threshold}%):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions vs '{args.compare}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
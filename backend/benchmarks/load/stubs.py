@@ -0,0 +1,79 @@
+# benchmarks/load/stubs.py
+"""Local stand-in for the OpenWeather API so load runs never leave the machine."""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _current_payload(lat: float, lon: float) -> dict:
+    return {
+        "main": {"temp": 24.5, "humidity": 62, "pressure": 1011},
+        "weather": [{"description": "clear sky"}],
+        "wind": {"speed": 3.1},
+        "name": f"Stub {lat:.2f},{lon:.2f}",
+    }
+
+
+def _forecast_payload(lat: float, lon: float) -> dict:
+    start = datetime(2024, 1, 1)
+    entries = []
+    for i in range(40):  # 5 days of 3-hourly entries, like the real API
+        ts = start + timedelta(hours=3 * i)
+        entries.append({
+            "dt_txt": ts.strftime("%Y-%m-%d %H:%M:%S"),
+            "main": {"temp": 18 + (i % 8) * 2.0, "humidity": 55 + (i % 5) * 8},
+            "rain": {"3h": 2.5 if i % 6 == 0 else 0},
+        })
+    return {"city": {"name": f"Stub {lat:.2f},{lon:.2f}"}, "list": entries}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        lat, lon = float(query.get("lat", 0)), float(query.get("lon", 0))
+        if url.path.endswith("/weather"):
+            body = _current_payload(lat, lon)
+        elif url.path.endswith("/forecast"):
+            body = _forecast_payload(lat, lon)
+        else:
+            self.send_error(404)
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubOpenWeatherServer:
+    """Threaded HTTP server on 127.0.0.1 with optional artificial latency."""
+
+    def __init__(self, latency: float = 0.02):
+        handler = type("StubHandler", (_Handler,), {"latency": latency})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/data/2.5"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,112 @@
+# benchmarks/micro/bench_kernels.py
+"""
+Micro-benchmarks for the CPU kernels behind the hot routes, each at
+1 / 100 / 10k rows (or days). See benchmarks/README.md for tracking runs.
+"""
+import pytest
+
+from benchmarks.micro.datagen import (
+    SIZES, make_daily_forecast, make_leaf_jpeg, make_pest_references, make_soil_samples,
+    make_three_hourly_entries
+)
+
+
+# -----------------------------
+# MLService
+# -----------------------------
+@pytest.fixture(scope="module")
+def ml_service():
+    from services.ml_service import MLService
+    return MLService()
+
+
+@pytest.mark.benchmark(group="ml.predict_crop (per call)")
+@pytest.mark.parametrize("n", [1, 100])
+def bench_predict_crop_loop(benchmark, ml_service, n):
+    samples = make_soil_samples(n)
+    benchmark(lambda: [ml_service.predict_crop(s) for s in samples])
+
+
+@pytest.mark.benchmark(group="ml.predict_crops (batched)")
+@pytest.mark.parametrize("n", SIZES)
+def bench_predict_crops_batch(benchmark, ml_service, n):
+    samples = make_soil_samples(n)
+    result = benchmark(ml_service.predict_crops, samples)
+    assert len(result) == n
+
+
+# -----------------------------
+# SoilService
+# -----------------------------
+@pytest.mark.benchmark(group="soil.suitability_score")
+@pytest.mark.parametrize("n", SIZES)
+def bench_suitability_score(benchmark, n):
+    from services.soil_service import SoilService
+
+    service = SoilService()
+    normalized = [service._normalize_input(s) for s in make_soil_samples(n)]
+    crops = list(service.crop_database.values())
+
+    def score_all():
+        return [service._calculate_suitability_score(soil, crop) for soil in normalized for crop in crops]
+
+    assert len(benchmark(score_all)) == n * len(crops)
+
+
+# -----------------------------
+# AlertService
+# -----------------------------
+@pytest.mark.benchmark(group="alerts.soil_weather")
+@pytest.mark.parametrize("crop", ["wheat", "rice"])
+@pytest.mark.parametrize("n_days", SIZES)
+def bench_soil_weather_alerts(benchmark, n_days, crop):
+    from services.alert_service import AlertService
+
+    service = AlertService()
+    soil = make_soil_samples(1)[0]
+    forecast = make_daily_forecast(n_days)
+    benchmark(service.generate_soil_weather_alerts, soil, forecast, crop)
+
+
+# -----------------------------
+# WeatherService
+# -----------------------------
+@pytest.mark.benchmark(group="weather.aggregate_daily")
+@pytest.mark.parametrize("n_days", SIZES)
+def bench_forecast_aggregation(benchmark, n_days):
+    from services.weather_service import WeatherService
+
+    entries = make_three_hourly_entries(n_days)
+    result = benchmark(WeatherService.aggregate_daily, entries, n_days)
+    assert len(result) <= n_days
+
+
+# -----------------------------
+# Pest detection stages
+# -----------------------------
+@pytest.mark.benchmark(group="pest.image_features")
+def bench_pest_image_features(benchmark):
+    from services.pest_learning import image_features
+
+    data = make_leaf_jpeg()
+    assert benchmark(image_features, data).shape == (200,)
+
+
+@pytest.mark.benchmark(group="pest.reference_match")
+@pytest.mark.parametrize("n", [100, 10_000])
+def bench_pest_reference_match(benchmark, n):
+    from services.pest_index import PestReferenceIndex
+
+    features, labels = make_pest_references(n)
+    index = PestReferenceIndex.build(features, labels)
+    result = benchmark(index.match, features[0])
+    assert result["distance"] < 1e-3   # the query is itself a reference
+
+
+@pytest.mark.benchmark(group="pest.classifier")
+def bench_pest_classifier(benchmark):
+    from sklearn.linear_model import SGDClassifier
+
+    features, labels = make_pest_references(2000)
+    model = SGDClassifier(loss="log_loss", random_state=0).fit(features, labels)
+    benchmark(model.predict_proba, features[:1])
@@ -0,0 +1,10 @@
+# benchmarks/micro/conftest.py
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# MLService resolves models/crop_model.pkl relative to the backend directory
+os.chdir(BACKEND_DIR)
@@ -0,0 +1,80 @@
+# benchmarks/micro/datagen.py
+"""Deterministic synthetic inputs for the micro-benchmarks."""
+import random
+from datetime import datetime, timedelta
+
+SIZES = [1, 100, 10_000]
+
+
+def make_soil_samples(n, seed=1234):
+    from models.farmer_models import SoilData
+
+    r = random.Random(seed)
+    return [SoilData(
+        ph=round(r.uniform(4.5, 8.5), 2),
+        nitrogen=r.uniform(0, 140),
+        phosphorus=r.uniform(5, 145),
+        potassium=r.uniform(5, 205),
+        temperature=r.uniform(8, 44),
+        humidity=r.uniform(14, 100),
+        rainfall=r.uniform(20, 300),
+        soil_type=r.choice(["loamy", "clay", "sandy loam", "clay loam", "silt"]),
+        moisture_level=r.uniform(5, 95),
+        organic_carbon=r.uniform(0.1, 1.5),
+    ) for _ in range(n)]
+
+
+def make_daily_forecast(n_days, seed=1234):
+    r = random.Random(seed)
+    forecast = []
+    for day in range(n_days):
+        t_min = r.uniform(2, 30)
+        forecast.append({
+            "date": f"day-{day}",
+            "temperature": {"min": t_min, "max": t_min + r.uniform(3, 15)},
+            "rainfall": r.choice([0, 0, 0, r.uniform(0, 60)]),
+            "humidity": r.uniform(30, 98),
+        })
+    return forecast
+
+
+def make_three_hourly_entries(n_days, seed=1234):
+    r = random.Random(seed)
+    entries = []
+    start = datetime(2000, 1, 1)
+    for day in range(n_days):
+        date = (start + timedelta(days=day)).strftime("%Y-%m-%d")
+        for slot in range(8):
+            entry = {
+                "dt_txt": f"{date} {slot * 3:02d}:00:00",
+                "main": {"temp": r.uniform(5, 40), "humidity": r.randint(20, 100)},
+            }
+            if r.random() < 0.3:
+                entry["rain"] = {"3h": round(r.uniform(0, 12), 1)}
+            entries.append(entry)
+    return entries
+
+
+def make_pest_references(n, n_classes=5, seed=1234):
+    """Clustered unit-norm 200-value descriptors (like pest_learning.image_features) and labels."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.random((n_classes * 8, 200)).astype(np.float32)
+    groups = rng.integers(0, len(centers), n)
+    features = centers[groups] + rng.normal(0, 0.1, (n, 200)).astype(np.float32)
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    return features, [f"pest_{g % n_classes}" for g in groups]
+
+
+def make_leaf_jpeg(width=1600, height=1200, seed=1234):
+    import io
+
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    pixels = np.clip(np.array([70, 140, 50]) + rng.normal(0, 40, (height, width, 3)), 0, 255)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels.astype(np.uint8)).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
@@ -0,0 +1,154 @@
+# build_climate_normals.py
+"""
+Build the historical weather archive and climate normals (offline job).
+
+    python build_climate_normals.py ingest history.csv [--archive data/climate]
+    python build_climate_normals.py normals [--archive data/climate]
+
+`ingest` streams a daily CSV (one row per grid point and day):
+
+    lat,lon,date,temp,humidity,rain
+
+into compressed per-cell series, merging with what is already archived,
+so new years can be appended without re-reading old files. It then
+recomputes normals, unless --skip-normals is given. The grid is taken from the
+first ingest (grid.json) and must stay the same for later ones.
+
+Memory use is bounded by --chunk-rows (CSV rows held at once) and by one
+cell's full series during compaction and normals computation.
+"""
+import argparse
+import csv
+import glob
+import logging
+import os
+import sys
+import time
+from datetime import date
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from services.climate_archive import (
+    DEFAULT_ARCHIVE_DIR, GridSpec, build_normals, compact_cell, write_part
+)
+
+logger = logging.getLogger("build_climate_normals")
+
+COLUMNS = ("lat", "lon", "date", "temp", "humidity", "rain")
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _chunks(path: str, chunk_rows: int) -> Iterator[List[Dict[str, str]]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in COLUMNS if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"❌ {path} is missing columns: {missing}")
+        chunk: List[Dict[str, str]] = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _float(value: Optional[str]) -> float:
+    return float(value) if value not in ("", None) else np.nan
+
+
+def _grid_from_csv(path: str, chunk_rows: int) -> GridSpec:
+    lats, lons = set(), set()
+    for chunk in _chunks(path, chunk_rows):
+        lats.update(round(float(r["lat"]), 4) for r in chunk)
+        lons.update(round(float(r["lon"]), 4) for r in chunk)
+    if not lats:
+        raise ValueError(f"❌ {path} has no rows")
+    lat_axis, lon_axis = sorted(lats), sorted(lons)
+    return GridSpec(
+        lat0=lat_axis[0], lon0=lon_axis[0],
+        dlat=lat_axis[1] - lat_axis[0] if len(lat_axis) > 1 else 1.0,
+        dlon=lon_axis[1] - lon_axis[0] if len(lon_axis) > 1 else 1.0,
+        nlat=len(lat_axis), nlon=len(lon_axis),
+    )
+
+
+def ingest(path: str, archive: str, chunk_rows: int) -> int:
+    start = time.perf_counter()
+    if os.path.exists(os.path.join(archive, "grid.json")):
+        spec = GridSpec.load(archive)
+    else:
+        spec = _grid_from_csv(path, chunk_rows)
+        spec.save(archive)
+
+    # Spill each chunk as per-cell part files
+    touched = set()
+    part = int(time.time() * 1000)
+    rows = skipped = 0
+    for chunk in _chunks(path, chunk_rows):
+        lat = np.array([float(r["lat"]) for r in chunk])
+        lon = np.array([float(r["lon"]) for r in chunk])
+        cells = spec.cells_for(lat, lon)
+        inside = (cells >= 0) & (cells < spec.cells)
+        skipped += int((~inside).sum())
+        days = np.array([date.fromisoformat(r["date"][:10]).toordinal() - EPOCH_ORDINAL for r in chunk])
+        values = np.array([[_float(r["temp"]), _float(r["humidity"]), _float(r["rain"])] for r in chunk])
+
+        order = np.argsort(cells[inside], kind="stable")
+        cells_in, days_in, values_in = cells[inside][order], days[inside][order], values[inside][order]
+        boundaries = np.flatnonzero(np.diff(cells_in)) + 1
+        for segment in np.split(np.arange(len(cells_in)), boundaries):
+            if not len(segment):
+                continue
+            cell = int(cells_in[segment[0]])
+            v = values_in[segment]
+            write_part(archive, cell, part, days_in[segment], v[:, 0], v[:, 1], v[:, 2])
+            touched.add(cell)
+        part += 1
+        rows += len(chunk)
+        logger.info(f"Spilled {rows} rows ({len(touched)} cells)")
+
+    # Compact one cell at a time
+    for cell in sorted(touched):
+        compact_cell(archive, cell)
+    if skipped:
+        logger.warning(f"Skipped {skipped} rows outside the archive grid")
+    logger.info(f"✅ Archived {rows} rows into {len(touched)} cells in {time.perf_counter() - start:.1f}s")
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archive", default=os.getenv("CLIMATE_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR))
+    parser.add_argument("--chunk-rows", type=int, default=500_000)
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = sub.add_parser("ingest", help="Append a daily history CSV to the archive")
+    ingest_parser.add_argument("csv_path")
+    ingest_parser.add_argument("--skip-normals", action="store_true")
+    sub.add_parser("normals", help="Recompute normals from the archive")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        if args.command == "ingest":
+            ingest(args.csv_path, args.archive, args.chunk_rows)
+            if args.skip_normals:
+                return 0
+        leftovers = glob.glob(os.path.join(args.archive, "cells", "*.part*.npz"))
+        if leftovers:
+            # An interrupted ingest left parts behind; fold them in first
+            for cell in sorted({int(os.path.basename(p).split(".")[0]) for p in leftovers}):
+                compact_cell(args.archive, cell)
+        start = time.perf_counter()
+        built = build_normals(args.archive)
+        logger.info(f"✅ Built normals for {built} cells in {time.perf_counter() - start:.1f}s")
+    except (OSError, ValueError) as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
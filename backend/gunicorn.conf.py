@@ -0,0 +1,61 @@
+# gunicorn.conf.py
+"""
+Production server configuration.
+
+    gunicorn -c gunicorn.conf.py backend_main:app      (or: python serve.py)
+
+The app (and the crop model it loads at import) is preloaded once in the
+master and shared copy-on-write with every worker. Sockets, threads and the
+Firestore writer are created per worker in the FastAPI lifespan.
+
+Operations:
+    kill -HUP  <master>   reload this config, start a fresh set of workers,
+                          then gracefully stop the old ones. Not a code
+                          reload: with preload_app the new workers fork
+                          from the master's already-imported app.
+    kill -TTIN <master>   add a worker / kill -TTOU <master> remove one
+
+Deploying new code (the master has to re-import it):
+    kill -USR2  <old master>   start a new master and workers on the new code
+    kill -WINCH <old master>   gracefully stop the old workers
+    kill -QUIT  <old master>   then exit the old master
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Load the app and models in the master before forking
+preload_app = True
+
+# Recycle workers after N requests (jittered so they don't restart together)
+max_requests = int(os.getenv("MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "500"))
+
+# Seconds a worker gets to finish in-flight requests and run lifespan shutdown
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    # Everything allocated during preload is now long-lived; move it to the
+    # permanent generation so the collector never touches (and un-shares)
+    # those pages in the workers.
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Preloaded app; froze {gc.get_freeze_count()} objects before forking {workers} workers")
+
+
+def post_worker_init(worker):
+    worker.log.info(f"Worker {worker.pid} ready")
+
+
+def worker_exit(server, worker):
+    server.log.info(f"Worker {worker.pid} exited")
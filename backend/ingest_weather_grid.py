@@ -0,0 +1,146 @@
+# ingest_weather_grid.py
+"""
+Ingest a bulk gridded forecast CSV into the local weather grid store.
+
+    python ingest_weather_grid.py forecast.csv [--out data/weather_grid]
+
+The CSV has one row per (grid point, forecast time):
+
+    lat,lon,time,temp,humidity,rain_3h,pressure,wind_speed[,name]
+
+`time` is ISO 8601 (UTC unless an offset is given) or unix seconds;
+points must form a regular lat/lon grid (missing points are allowed and
+stored as NaN). The file is streamed twice in chunks - once to find the
+grid axes and times, once to fill a disk-backed array - so memory stays
+proportional to one chunk, not to the file. The result is published
+atomically; running API workers pick it up on their next check.
+"""
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from services.weather_grid import DEFAULT_GRID_DIR, VARIABLES, allocate_values, publish_grid
+
+logger = logging.getLogger("ingest_weather_grid")
+
+CHUNK_ROWS = 100_000
+# Coordinates are snapped to this precision before building the axes
+COORD_DECIMALS = 4
+
+
+def _parse_time(value: str, cache: Dict[str, int]) -> int:
+    parsed = cache.get(value)
+    if parsed is None:
+        try:
+            parsed = int(float(value))
+        except ValueError:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            parsed = int(dt.timestamp())
+        cache[value] = parsed
+    return parsed
+
+
+def _chunks(path: str) -> Iterator[List[Dict[str, str]]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in ("lat", "lon", "time", *VARIABLES) if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"❌ {path} is missing columns: {missing}")
+        chunk: List[Dict[str, str]] = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) >= CHUNK_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _axis(values: set, name: str) -> np.ndarray:
+    """
+    Full evenly spaced axis through the observed values. The step is the
+    smallest observed spacing, so whole missing rows or columns become
+    NaN cells instead of breaking the grid.
+    """
+    observed = np.array(sorted(values))
+    if len(observed) < 2:
+        return observed
+    step = float(np.diff(observed).min())
+    positions = (observed - observed[0]) / step
+    if not np.allclose(positions, np.rint(positions), atol=1e-3):
+        raise ValueError(f"❌ {name} values are not on a regular grid (step {step:g})")
+    count = int(np.rint(positions[-1])) + 1
+    return np.round(observed[0] + step * np.arange(count), COORD_DECIMALS)
+
+
+def ingest(path: str, out_dir: str) -> Dict[str, int]:
+    start = time.perf_counter()
+    time_cache: Dict[str, int] = {}
+
+    # Pass 1: grid axes and forecast times
+    lats, lons, times = set(), set(), set()
+    rows = 0
+    for chunk in _chunks(path):
+        rows += len(chunk)
+        lats.update(round(float(r["lat"]), COORD_DECIMALS) for r in chunk)
+        lons.update(round(float(r["lon"]), COORD_DECIMALS) for r in chunk)
+        times.update(_parse_time(r["time"], time_cache) for r in chunk)
+    if not rows:
+        raise ValueError(f"❌ {path} has no rows")
+    lat_axis, lon_axis = _axis(lats, "lat"), _axis(lons, "lon")
+    time_axis = np.array(sorted(times), dtype=np.int64)
+    dlat = lat_axis[1] - lat_axis[0] if len(lat_axis) > 1 else 1.0
+    dlon = lon_axis[1] - lon_axis[0] if len(lon_axis) > 1 else 1.0
+    time_index = {int(t): i for i, t in enumerate(time_axis)}
+
+    # Pass 2: fill the disk-backed (cell, time, variable) array chunk by chunk
+    values = allocate_values(out_dir, len(lat_axis) * len(lon_axis), len(time_axis))
+    names: Optional[List[Optional[str]]] = None
+    for chunk in _chunks(path):
+        lat = np.array([float(r["lat"]) for r in chunk])
+        lon = np.array([float(r["lon"]) for r in chunk])
+        i = np.rint((lat - lat_axis[0]) / dlat).astype(np.int64)
+        j = np.rint((lon - lon_axis[0]) / dlon).astype(np.int64)
+        cells = i * len(lon_axis) + j
+        t = np.array([time_index[_parse_time(r["time"], time_cache)] for r in chunk])
+        data = np.array([[float(r[v]) if r[v] not in ("", None) else np.nan for v in VARIABLES]
+                         for r in chunk], dtype=np.float32)
+        values[cells, t, :] = data
+        if "name" in chunk[0]:
+            if names is None:
+                names = [None] * (len(lat_axis) * len(lon_axis))
+            for cell, row in zip(cells.tolist(), chunk):
+                names[cell] = names[cell] or row.get("name") or None
+
+    publish_grid(out_dir, values, lat_axis.tolist(), lon_axis.tolist(), time_axis.tolist(), names)
+    stats = {"rows": rows, "nlat": len(lat_axis), "nlon": len(lon_axis), "times": len(time_axis)}
+    logger.info(f"✅ Ingested {stats} into {out_dir} in {time.perf_counter() - start:.1f}s")
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_path", help="Gridded forecast CSV")
+    parser.add_argument("--out", default=os.getenv("WEATHER_GRID_DIR", DEFAULT_GRID_DIR),
+                        help="Grid store directory (default: WEATHER_GRID_DIR or data/weather_grid)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        ingest(args.csv_path, args.out)
+    except (OSError, ValueError) as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
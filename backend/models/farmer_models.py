@@ -72,6 +72,8 @@ class ChatbotResponse(BaseModel):
     confidence: float = Field(..., ge=0, le=1)
     suggestions: Optional[List[str]] = None
     follow_up_questions: Optional[List[str]] = None
+    content_ids: Optional[List[str]] = None
+    catalog_version: Optional[str] = None
 
 
 # -----------------------
@@ -195,6 +197,18 @@ class PestDetectionResult(BaseModel):
     treatment_recommendations: List[str]
     preventive_measures: List[str]
     organic_alternatives: Optional[List[str]] = None
+    # Catalog message IDs per list field, for clients rendering from /content/catalog
+    content_ids: Optional[Dict[str, List[str]]] = None
+    catalog_version: Optional[str] = None
+    # For POST /pest/detections/{detection_id}/verdict; feedback_requested marks uncertain results
+    detection_id: Optional[str] = None
+    feedback_requested: Optional[bool] = None
+    model_version: Optional[str] = None
+
+
+class PestVerdict(BaseModel):
+    correct: bool
+    label: Optional[str] = Field(None, description="Actual pest/disease (or 'none') when the detection was wrong")
 
 
 # -----------------------
@@ -261,6 +275,10 @@ class UsageAnalytics(BaseModel):
     usage_count: int
     last_used: datetime
     success_rate: Optional[float] = Field(None, ge=0, le=1)
+    unique_users: Optional[int] = Field(None, ge=0, description="Approximate (HyperLogLog)")
+    latency_p50_ms: Optional[float] = None
+    latency_p95_ms: Optional[float] = None
+    latency_p99_ms: Optional[float] = None
 
 
 class FarmerAnalytics(BaseModel):
@@ -292,6 +310,32 @@ class NotificationData(BaseModel):
     expires_at: Optional[datetime] = None
 
 
+class DeviceRegistration(BaseModel):
+    token: str = Field(..., min_length=8, max_length=4096, description="FCM registration token")
+    platform: str = Field(default="android", max_length=20)
+    quiet_hours_start: Optional[str] = Field(None, pattern=r'^([01]\d|2[0-3]):[0-5]\d$', description="Local time, HH:MM")
+    quiet_hours_end: Optional[str] = Field(None, pattern=r'^([01]\d|2[0-3]):[0-5]\d$', description="Local time, HH:MM")
+    tz_offset_minutes: int = Field(default=330, ge=-720, le=840, description="UTC offset (IST = 330)")
+
+
+class NotificationRequest(BaseModel):
+    notification: NotificationData
+    user_ids: Optional[List[str]] = Field(None, description="Recipients; all registered users if omitted")
+
+
+class WeatherAlertFarm(BaseModel):
+    user_id: str = Field(..., min_length=1, max_length=128)
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    crops: List[str] = Field(..., min_length=1, max_length=20)
+    lang: Optional[str] = Field(None, max_length=10)
+
+
+class WeatherAlertRequest(BaseModel):
+    farms: List[WeatherAlertFarm] = Field(..., min_length=1, max_length=1000)
+    days: int = Field(3, ge=1, le=7, description="Forecast days to check")
+
+
 # -----------------------
 # Error / Success
 # -----------------------
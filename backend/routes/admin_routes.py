@@ -0,0 +1,51 @@
+# routes/admin_routes.py
+import asyncio
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from fastapi.responses import PlainTextResponse
+from utils.profiler import StackSampler, get_request_profiler
+
+router = APIRouter(prefix="/admin", tags=["Admin"], include_in_schema=False)
+
+
+async def verify_admin(x_admin_token: Optional[str] = Header(None)):
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@router.post("/profile", response_class=PlainTextResponse, dependencies=[Depends(verify_admin)])
+async def capture_profile(
+    seconds: float = Query(10, gt=0, le=120, description="Capture window"),
+    interval_ms: float = Query(5, ge=1, le=100, description="Sampling interval")
+):
+    """Sample all threads for a time window; returns collapsed stacks for flamegraphs"""
+    sampler = StackSampler(interval=interval_ms / 1000)
+    try:
+        # Sample from a worker thread so the event loop keeps serving (and gets sampled)
+        return await asyncio.to_thread(sampler.capture, seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/profile/requests", response_class=PlainTextResponse, dependencies=[Depends(verify_admin)])
+async def request_profile():
+    """Stack samples of sampled requests (PROFILE_ROUTES) by route, collapsed format"""
+    request_profiler = get_request_profiler()
+    if request_profiler is None:
+        raise HTTPException(status_code=404, detail="Request profiling is not enabled")
+    return request_profiler.collapsed()
+
+
+@router.delete("/profile/requests", dependencies=[Depends(verify_admin)])
+async def reset_request_profile():
+    request_profiler = get_request_profiler()
+    if request_profiler is None:
+        raise HTTPException(status_code=404, detail="Request profiling is not enabled")
+    profiled = request_profiler.profiled_requests
+    request_profiler.reset()
+    return {"reset": True, "profiled_requests": profiled}
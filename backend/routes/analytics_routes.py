@@ -0,0 +1,47 @@
+# routes/analytics_routes.py
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from models.farmer_models import FarmerAnalytics
+from routes.admin_routes import verify_admin
+from services.analytics_service import UsageAggregator
+from services.container import get_analytics_service, get_container
+from utils.auth import verify_user
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/me", response_model=FarmerAnalytics)
+async def my_analytics(
+    request: Request,
+    days: int = Query(30, ge=1, le=365),
+    user_id: str = Depends(verify_user),
+    aggregator: UsageAggregator = Depends(get_analytics_service)
+):
+    """The caller's feature usage and sessions over the last `days` days"""
+    satisfaction = None
+    try:
+        feedback = await get_container(request).aget("feedback")
+        satisfaction = await asyncio.to_thread(feedback.farmer_satisfaction, user_id)
+    except Exception as e:
+        logger.warning(f"Satisfaction score unavailable for {user_id}: {e}")
+    try:
+        return await asyncio.to_thread(aggregator.farmer, user_id, days, None, satisfaction)
+    except Exception as e:
+        logger.error(f"Error reading farmer analytics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/usage", dependencies=[Depends(verify_admin)])
+async def usage_analytics(
+    hours: int = Query(24, ge=1, le=24 * 90),
+    series: bool = Query(False, description="Include per-bucket request counts"),
+    aggregator: UsageAggregator = Depends(get_analytics_service)
+):
+    """Per-feature usage, success rate, unique users and latency percentiles from the rollups"""
+    try:
+        return await asyncio.to_thread(aggregator.usage, hours, series)
+    except Exception as e:
+        logger.error(f"Error reading usage analytics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
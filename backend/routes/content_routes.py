@@ -0,0 +1,43 @@
+# routes/content_routes.py
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from utils.content_catalog import get_catalog
+from utils.i18n import parse_accept_language, resolve_language
+
+router = APIRouter(prefix="/content", tags=["Content"])
+
+# Clients revalidate with If-None-Match; a new catalog version changes the ETag
+CATALOG_CACHE_CONTROL = "public, max-age=604800, stale-while-revalidate=2592000"
+
+
+def get_language(
+    lang: Optional[str] = Query(None, description="Language for advisory text (e.g. en, hi, pa)"),
+    accept_language: Optional[str] = Header(None)
+) -> str:
+    """Advisory language: ?lang=, then Accept-Language, then the catalog default"""
+    catalog = get_catalog()
+    return resolve_language([lang, *parse_accept_language(accept_language)],
+                            catalog.languages, catalog.default_language)
+
+
+@router.get("/catalog")
+async def get_content_catalog(
+    request: Request,
+    lang: Optional[str] = Query(None, description="Only include text in this language")
+):
+    """Full advisory catalog: message IDs, text per language and content structure"""
+    catalog = get_catalog()
+    if lang and lang not in catalog.languages:
+        raise HTTPException(status_code=404, detail=f"Language '{lang}' not available")
+    etag = catalog.etag if not lang else f'{catalog.etag[:-1]}-{lang}"'
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(catalog.bundle(lang), media_type="application/json", headers=headers)
+
+
+@router.get("/version")
+async def get_content_version():
+    """Cheap check whether the cached catalog is current"""
+    catalog = get_catalog()
+    return {"version": catalog.version, "etag": catalog.etag, "languages": list(catalog.languages)}
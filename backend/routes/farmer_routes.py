@@ -0,0 +1,59 @@
+# routes/farmer_routes.py
+import asyncio
+import logging
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Request
+from models.farmer_models import FarmerProfile
+from services.container import get_container, get_profile_service
+from services.profile_service import FarmerProfileService
+from utils.auth import verify_user
+from utils.firebase_config import get_firestore_backend
+
+router = APIRouter(prefix="/farmer", tags=["Farmer"])
+logger = logging.getLogger(__name__)
+
+def profiles_enabled() -> bool:
+    return get_firestore_backend() != "disabled"
+
+
+async def get_optional_profile(
+    request: Request,
+    user_id: str = Depends(verify_user)
+) -> Optional[FarmerProfile]:
+    """Profile of the caller for personalization, or None if unavailable."""
+    if not profiles_enabled():
+        return None
+    try:
+        profile_service = await get_container(request).aget("profiles")
+        return await profile_service.aget_profile(user_id)
+    except Exception as e:
+        logger.warning(f"Profile lookup failed for {user_id}: {e}")
+        return None
+
+
+@router.get("/profile", response_model=FarmerProfile)
+async def get_profile(
+    user_id: str = Depends(verify_user),
+    profile_service: FarmerProfileService = Depends(get_profile_service)
+):
+    if not profiles_enabled():
+        raise HTTPException(status_code=503, detail="Profile storage is not configured")
+    profile = await profile_service.aget_profile(user_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@router.put("/profile", response_model=FarmerProfile)
+async def save_profile(
+    profile: FarmerProfile,
+    user_id: str = Depends(verify_user),
+    profile_service: FarmerProfileService = Depends(get_profile_service)
+):
+    if not profiles_enabled():
+        raise HTTPException(status_code=503, detail="Profile storage is not configured")
+    try:
+        return await asyncio.to_thread(profile_service.save_profile, user_id, profile)
+    except Exception as e:
+        logger.error(f"Error saving profile: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
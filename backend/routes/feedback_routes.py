@@ -0,0 +1,39 @@
+# routes/feedback_routes.py
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, Depends, Query
+from models.farmer_models import FeedbackData
+from routes.admin_routes import verify_admin
+from services.container import get_feedback_service
+from services.feedback_service import FeedbackService
+from utils.auth import verify_user
+
+router = APIRouter(prefix="/feedback", tags=["Feedback"])
+logger = logging.getLogger(__name__)
+
+
+@router.post("", status_code=202)
+async def submit_feedback(
+    feedback: FeedbackData,
+    user_id: str = Depends(verify_user),
+    service: FeedbackService = Depends(get_feedback_service)
+):
+    """Accept a rating; storage and aggregation happen in the background"""
+    if not service.submit(user_id, feedback):
+        raise HTTPException(status_code=503, detail="Feedback queue is full, please retry",
+                            headers={"Retry-After": "30"})
+    return {"accepted": True}
+
+
+@router.get("/summary", dependencies=[Depends(verify_admin)])
+async def feedback_summary(
+    days: int = Query(30, ge=1, le=30),
+    service: FeedbackService = Depends(get_feedback_service)
+):
+    """Per-category rating histograms, averages and rolling averages"""
+    try:
+        summary = await asyncio.to_thread(service.summary, days)
+    except Exception as e:
+        logger.error(f"Error reading feedback summary: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {**summary, "queued": service.pending}
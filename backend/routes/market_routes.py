@@ -1,17 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+from services.container import get_market_service
 from services.market_service import MarketService
+from utils.auth import verify_user
 
 router = APIRouter(prefix="/market", tags=["Market Prices"])
-market_service = MarketService()
-
-async def verify_user():
-    return "user_123"
 
 # 📌 Get price for a specific crop
 @router.get("/price")
 async def price_for_crop(
     crop: str = Query(..., description="Crop name (e.g., wheat, rice)"),
     user_id: str = Depends(verify_user),
+    market_service: MarketService = Depends(get_market_service),
 ):
     result = await market_service.get_crop_prices(crop)
     if "error" in result:
@@ -20,5 +19,8 @@ async def price_for_crop(
 
 # 📌 Get prices for all crops
 @router.get("/all")
-async def all_prices(user_id: str = Depends(verify_user)):
+async def all_prices(
+    user_id: str = Depends(verify_user),
+    market_service: MarketService = Depends(get_market_service),
+):
     return await market_service.get_all_prices()
\ No newline at end of file
@@ -1,20 +1,20 @@
 # routes/ml_routes.py
 from fastapi import APIRouter, HTTPException, Depends
 from models.farmer_models import SoilData
+from services.container import get_ml_service
 from services.ml_service import MLService
+from utils.auth import verify_user
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ml", tags=["Machine Learning"])
-ml_service = MLService()
-
-# Temporary user verification (avoid circular import for now)
-async def verify_user():
-    return "user_123"
-
 @router.post("/recommend-crop")
-async def recommend_crop_ml(soil_data: SoilData, user_id: str = Depends(verify_user)):
+async def recommend_crop_ml(
+    soil_data: SoilData,
+    user_id: str = Depends(verify_user),
+    ml_service: MLService = Depends(get_ml_service)
+):
     try:
         recommendation = ml_service.predict_crop(soil_data)
         # recommendation is already a dict {"recommended_crop": "rice"}
@@ -0,0 +1,120 @@
+# routes/notification_routes.py
+import asyncio
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from models.farmer_models import DeviceRegistration, NotificationRequest, WeatherAlertFarm, WeatherAlertRequest
+from routes.admin_routes import verify_admin
+from services.alert_service import SEVERITY_RANK, AlertLedger, AlertService
+from services.audience_index import AudienceIndex
+from services.container import (
+    get_alert_ledger, get_alert_service, get_audience_index, get_device_registry,
+    get_notification_dispatcher, get_weather_service
+)
+from services.notification_service import DeviceRegistry, NotificationDispatcher
+from services.weather_service import WeatherService
+from utils.auth import verify_user
+
+router = APIRouter(prefix="/notifications", tags=["Notifications"])
+logger = logging.getLogger(__name__)
+
+
+@router.post("/devices")
+async def register_device(
+    registration: DeviceRegistration,
+    user_id: str = Depends(verify_user),
+    registry: DeviceRegistry = Depends(get_device_registry)
+):
+    """Register (or refresh) this device's push token and quiet hours"""
+    try:
+        await asyncio.to_thread(
+            registry.register, user_id, registration.token, registration.platform,
+            (registration.quiet_hours_start, registration.quiet_hours_end), registration.tz_offset_minutes)
+    except Exception as e:
+        logger.error(f"Error registering device: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"registered": True}
+
+
+@router.delete("/devices/{token}")
+async def unregister_device(
+    token: str,
+    user_id: str = Depends(verify_user),
+    registry: DeviceRegistry = Depends(get_device_registry)
+):
+    if not await asyncio.to_thread(registry.unregister, token, user_id):
+        raise HTTPException(status_code=404, detail="Device not registered")
+    return {"unregistered": True}
+
+
+@router.post("/send", status_code=202, dependencies=[Depends(verify_admin)])
+async def send_notification(
+    request: NotificationRequest,
+    dispatcher: NotificationDispatcher = Depends(get_notification_dispatcher)
+):
+    """Queue a notification; delivery happens in the background (poll /notifications/jobs/{id})"""
+    job = dispatcher.submit(request.notification, request.user_ids)
+    return job.summary()
+
+
+def _farm_episodes(farm: WeatherAlertFarm, days: int, weather_service: WeatherService,
+                   alert_service: AlertService, ledger: AlertLedger) -> List[dict]:
+    ledger.load(farm.user_id)   # what other workers already sent to this farm
+    forecast = weather_service.get_weather_forecast(farm.lat, farm.lon, days)["forecast"]
+    episodes = []
+    for crop in sorted({c.lower() for c in farm.crops}):
+        episodes.extend(alert_service.merge_episodes(
+            alert_service.generate_weather_alerts(forecast, crop, farm.lang), crop))
+    episodes.sort(key=lambda e: (-SEVERITY_RANK.get(e["severity"], 0), e["start_date"], e["type"]))
+    return episodes
+
+
+@router.post("/weather-alerts", status_code=202, dependencies=[Depends(verify_admin)])
+async def send_weather_alerts(
+    request: WeatherAlertRequest,
+    dispatcher: NotificationDispatcher = Depends(get_notification_dispatcher),
+    ledger: AlertLedger = Depends(get_alert_ledger),
+    weather_service: WeatherService = Depends(get_weather_service),
+    alert_service: AlertService = Depends(get_alert_service)
+):
+    """
+    Push weather alert episodes to each farm (e.g. from a scheduled job).
+    A farm is only notified of episodes it has not been sent yet; an
+    ongoing episode is not resent as the forecast window moves.
+    """
+    jobs, skipped, unavailable = [], 0, []
+    for farm in request.farms:
+        try:
+            episodes = await asyncio.to_thread(_farm_episodes, farm, request.days, weather_service, alert_service,
+                                              ledger)
+        except Exception as e:
+            logger.warning(f"Weather alerts unavailable for {farm.user_id}: {e}")
+            unavailable.append(farm.user_id)
+            continue
+        job = dispatcher.submit_episodes(farm.user_id, episodes, ledger)
+        if job is None:
+            skipped += 1
+        else:
+            jobs.append(job.summary())
+    return {"jobs": jobs, "up_to_date": skipped, "unavailable": unavailable}
+
+
+@router.get("/audience", dependencies=[Depends(verify_admin)])
+async def preview_audience(
+    crops: Optional[List[str]] = Query(None),
+    regions: Optional[List[str]] = Query(None),
+    audience: AudienceIndex = Depends(get_audience_index)
+):
+    """How many farmers a target_crops / target_regions pair would reach"""
+    return {"crops": crops, "regions": regions, "farmers": await asyncio.to_thread(audience.count, crops, regions)}
+
+
+@router.get("/jobs/{job_id}", dependencies=[Depends(verify_admin)])
+async def get_notification_job(
+    job_id: str,
+    dispatcher: NotificationDispatcher = Depends(get_notification_dispatcher)
+):
+    job = dispatcher.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.summary()
@@ -1,134 +1,227 @@
 # routes/pest_routes.py
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query
-from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
+from typing import Any, Dict, Optional, List
+import asyncio
 import logging
-from models.farmer_models import PestDetectionResult
+from models.farmer_models import PestDetectionResult, PestVerdict
 import random
-import time
+from datetime import datetime, timezone
+from routes.admin_routes import verify_admin
+from services.container import get_container, get_pest_learning_service
+from services.pest_learning import NO_PEST, PestLearningService
+from utils.auth import verify_user
+from utils.firebase_config import COLLECTIONS, STORAGE_FOLDERS, get_firestore_backend, get_firestore_client, \
+    get_storage_bucket
+from utils.firestore_writer import get_firestore_writer
+from utils.content_catalog import get_catalog
+from routes.content_routes import get_language
 
 router = APIRouter(prefix="/pest", tags=["Pest Detection"])
 logger = logging.getLogger(__name__)
 
-# Mock pest detection data
-MOCK_PESTS = {
-    "aphids": {
-        "severity_level": "moderate",
-        "affected_area_percentage": 35.0,
-        "treatment_recommendations": [
-            "Apply neem oil spray (15ml per liter of water)",
-            "Introduce ladybugs as natural predators",
-            "Remove heavily infested plant parts",
-            "Apply insecticidal soap for severe infestations"
-        ],
-        "preventive_measures": [
-            "Regularly inspect plants for early signs",
-            "Maintain proper plant spacing for air circulation",
-            "Use yellow sticky traps to monitor population",
-            "Plant companion plants like marigold or nasturtium"
-        ],
-        "organic_alternatives": [
-            "Garlic spray (crush 10 cloves in 1L water)",
-            "Diatomaceous earth application",
-            "Soap and water spray (2 tbsp soap in 1L water)"
-        ]
-    },
-    "powdery_mildew": {
-        "severity_level": "high",
-        "affected_area_percentage": 60.0,
-        "treatment_recommendations": [
-            "Apply fungicide with sulfur as active ingredient",
-            "Remove and destroy infected plant parts",
-            "Increase air circulation around plants",
-            "Apply potassium bicarbonate solution"
-        ],
-        "preventive_measures": [
-            "Avoid overhead watering",
-            "Space plants properly",
-            "Use resistant varieties when available",
-            "Rotate crops annually"
-        ],
-        "organic_alternatives": [
-            "Milk spray (1 part milk to 9 parts water)",
-            "Baking soda solution (1 tbsp in 1 gallon water with few drops of soap)",
-            "Neem oil application"
-        ]
-    },
-    "leaf_spot": {
-        "severity_level": "low",
-        "affected_area_percentage": 15.0,
-        "treatment_recommendations": [
-            "Apply copper-based fungicide",
-            "Remove infected leaves",
-            "Improve drainage around plants",
-            "Avoid wetting foliage when watering"
-        ],
-        "preventive_measures": [
-            "Rotate crops",
-            "Use disease-free seeds",
-            "Maintain proper plant spacing",
-            "Clean garden tools between uses"
-        ],
-        "organic_alternatives": [
-            "Compost tea spray",
-            "Garlic and pepper spray",
-            "Apple cider vinegar solution (2 tbsp in 1 gallon water)"
-        ]
-    }
-}
+# Mock pest detection data (advisory text lives in the content catalog)
+catalog = get_catalog()
+MOCK_PESTS = catalog.pests
+
+# Background image uploads (kept referenced until done)
+_uploads: set = set()
+
+
+async def _optional_learning(request: Request) -> Optional[PestLearningService]:
+    """Detection keeps working (mock only) if the learning store is unavailable."""
+    try:
+        return await get_container(request).aget("pest_learning")
+    except Exception as e:
+        logger.warning(f"Pest learning unavailable: {e}")
+        return None
+
+
+def _upload_image(path: str, data: bytes, content_type: Optional[str]) -> None:
+    try:
+        get_storage_bucket().blob(path).upload_from_string(data, content_type=content_type or "image/jpeg")
+    except Exception as e:
+        logger.warning(f"Pest image upload to {path} failed: {e}")
+
+
+def _mock_detection() -> Optional[str]:
+    # Mock detection - randomly select a pest or return no detection
+    detection_options = list(MOCK_PESTS.keys()) + [None]
+    weights = [0.25, 0.25, 0.25, 0.25]  # 75% chance of detection
+    return random.choices(detection_options, weights=weights, k=1)[0]
+
 
 @router.post("/detect", response_model=PestDetectionResult)
 async def detect_pest(
+    request: Request,
     image: UploadFile = File(...),
     crop_type: str = Form(...),
-    location: Optional[str] = Form(None)
+    location: Optional[str] = Form(None),
+    user_id: str = Depends(verify_user),
+    lang: str = Depends(get_language)
 ):
     """
     Upload an image for pest or disease detection.
     This endpoint accepts plant images and returns detection results.
+    Uncertain results (including mock ones, before any model is trained)
+    carry feedback_requested=true; the uploader sends their answer to
+    /pest/detections/{detection_id}/verdict.
     """
     try:
-        # Simulate processing time
-        time.sleep(1)
-        
-        # Mock detection - randomly select a pest or return no detection
-        detection_options = list(MOCK_PESTS.keys()) + [None]
-        weights = [0.25, 0.25, 0.25, 0.25]  # 75% chance of detection
-        
-        detected = random.choices(detection_options, weights=weights, k=1)[0]
-        
+        data = await image.read()
+        learning = await _optional_learning(request)
+        analysis = None
+        if learning is not None:
+            try:
+                analysis = await asyncio.to_thread(learning.analyze, data)
+            except Exception as e:
+                logger.warning(f"Could not analyze pest image: {e}")
+
+        if analysis is not None and analysis["label"] is not None:
+            detected = None if analysis["label"] == NO_PEST else analysis["label"]
+            confidence = round(analysis["confidence"], 2)
+        else:
+            # No trained model yet
+            detected = _mock_detection()
+            confidence = 0.95 if detected is None else round(random.uniform(0.70, 0.98), 2)
+
         if detected is None:
-            return PestDetectionResult(
+            content_ids = {field: list(ids) for field, ids in catalog.no_detection.items()}
+            result = PestDetectionResult(
                 detected_pest=None,
                 detected_disease=None,
-                confidence_score=0.95,
+                confidence_score=confidence,
                 severity_level="none",
                 affected_area_percentage=0,
-                treatment_recommendations=["No treatment needed"],
-                preventive_measures=["Continue regular monitoring"]
+                treatment_recommendations=catalog.texts(content_ids["treatment_recommendations"], lang),
+                preventive_measures=catalog.texts(content_ids["preventive_measures"], lang),
+                content_ids=content_ids,
+                catalog_version=catalog.version
             )
-        
-        pest_info = MOCK_PESTS[detected]
-        confidence = round(random.uniform(0.70, 0.98), 2)
-        
-        # Determine if it's a pest or disease (for demo purposes)
-        is_disease = detected in ["powdery_mildew", "leaf_spot"]
-        
-        return PestDetectionResult(
-            detected_pest=None if is_disease else detected,
-            detected_disease=detected if is_disease else None,
-            confidence_score=confidence,
-            severity_level=pest_info["severity_level"],
-            affected_area_percentage=pest_info["affected_area_percentage"],
-            treatment_recommendations=pest_info["treatment_recommendations"],
-            preventive_measures=pest_info["preventive_measures"],
-            organic_alternatives=pest_info["organic_alternatives"]
-        )
+        else:
+            pest_info = MOCK_PESTS[detected]
+
+            # Determine if it's a pest or disease (for demo purposes)
+            is_disease = detected in ["powdery_mildew", "leaf_spot"]
+
+            result = PestDetectionResult(
+                detected_pest=None if is_disease else detected,
+                detected_disease=detected if is_disease else None,
+                confidence_score=confidence,
+                severity_level=pest_info["severity_level"],
+                affected_area_percentage=pest_info["affected_area_percentage"],
+                treatment_recommendations=catalog.texts(pest_info["treatment_recommendations"], lang),
+                preventive_measures=catalog.texts(pest_info["preventive_measures"], lang),
+                organic_alternatives=catalog.texts(pest_info["organic_alternatives"], lang),
+                content_ids={
+                    field: list(pest_info[field])
+                    for field in ("treatment_recommendations", "preventive_measures", "organic_alternatives")
+                },
+                catalog_version=catalog.version
+            )
+
+        record: Dict[str, Any] = {
+            "user_id": user_id,
+            "crop_type": crop_type,
+            "location": location,
+            "detected": detected,
+            "confidence_score": confidence,
+            "timestamp": datetime.now(timezone.utc)
+        }
+        doc_id = None
+        if analysis is not None:
+            tracked = learning.record_detection(analysis, detected or NO_PEST, confidence, user_id)
+            doc_id = tracked["detection_id"]
+            result.detection_id = doc_id
+            result.feedback_requested = tracked["feedback_requested"]
+            result.model_version = tracked["model_version"]
+            record.update({"image_hash": tracked["hash"], "model_version": tracked["model_version"],
+                           "stage": analysis["stage"] or "mock"})
+            if tracked["feedback_requested"]:
+                # Queued for labelling: enough for the verdict to be applied by any worker
+                record["features"] = [round(float(v), 5) for v in tracked["features"]]
+            if tracked["feedback_requested"] and get_firestore_backend() == "firebase":
+                path = f"{STORAGE_FOLDERS['pest_images']}{tracked['hash']}.jpg"
+                record["image_path"] = path
+                task = asyncio.create_task(asyncio.to_thread(_upload_image, path, data, image.content_type))
+                _uploads.add(task)
+                task.add_done_callback(_uploads.discard)
+
+        writer = get_firestore_writer()
+        if writer:
+            writer.write_nowait(COLLECTIONS["pest_detections"], record, doc_id=doc_id)
+        return result
         
     except Exception as e:
         logger.error(f"Error in pest detection: {e}")
         raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
 
 
+def _stored_detection(detection_id: str) -> Optional[Dict[str, Any]]:
+    if get_firestore_backend() == "disabled":
+        return None
+    snapshot = get_firestore_client().collection(COLLECTIONS["pest_detections"]).document(detection_id).get()
+    data = snapshot.to_dict() if snapshot.exists else None
+    # Only detections that requested feedback keep their features; other verdicts need the detecting worker
+    if not data or "features" not in data:
+        return None
+    return {"hash": data["image_hash"], "features": data["features"], "label": data.get("detected") or NO_PEST,
+            "confidence": data.get("confidence_score"), "model_version": data.get("model_version"),
+            "user_id": data.get("user_id")}
+
+
+@router.post("/detections/{detection_id}/verdict")
+async def submit_pest_verdict(
+    detection_id: str,
+    verdict: PestVerdict,
+    user_id: str = Depends(verify_user),
+    learning: PestLearningService = Depends(get_pest_learning_service)
+):
+    """The farmer who uploaded the image confirms or corrects its detection; it becomes a training example"""
+    if not verdict.correct and not verdict.label:
+        raise HTTPException(status_code=422, detail="label is required when the detection was wrong")
+    entry = learning.detection(detection_id)
+    if entry is None:
+        # Detected by another worker (or before a restart)
+        entry = await asyncio.to_thread(_stored_detection, detection_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired detection")
+        learning.remember(detection_id, entry)
+    if entry.get("user_id") != user_id:
+        raise HTTPException(status_code=403, detail="Only the uploader can give a verdict on this detection")
+    try:
+        label = learning.verdict(detection_id, verdict.correct, verdict.label)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if label is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired detection")
+
+    writer = get_firestore_writer()
+    if writer:
+        writer.write_nowait(COLLECTIONS["pest_detections"], {"verdict": {
+            "correct": verdict.correct, "label": label, "user_id": user_id,
+            "timestamp": datetime.now(timezone.utc)
+        }}, doc_id=detection_id, merge=True)
+    return {"accepted": True, "label": label}
+
+
+@router.get("/model", dependencies=[Depends(verify_admin)])
+async def pest_model_status(learning: PestLearningService = Depends(get_pest_learning_service)):
+    """Serving model version, its training metrics, the reference index and the size of the training store"""
+    _, meta = learning.registry.current()
+    index = learning.reference_index()
+    return {
+        "version": meta.get("version"),
+        "published_at": meta.get("published_at"),
+        "metrics": meta.get("metrics"),
+        "classes": learning.labels,
+        "examples": len(learning.store),
+        "last_trained_at": learning.last_trained_at,
+        "reference_index": index.stats() if index is not None else None,
+        # Which stage answered detections served by this worker
+        "stages": dict(learning.stages),
+    }
+
+
 @router.get("/common-pests")
 async def get_common_pests(crop: Optional[str] = Query(None)):
     """Get list of common pests for a specific crop or general pests"""
@@ -1,29 +1,41 @@
 # routes/soil_routes.py
 import logging
+from datetime import datetime, timezone
 from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import Dict, List, Any
-from models.farmer_models import SoilData, CropRecommendation, CropRecommendationResponse, FertilizerRequest
+from typing import Dict, List, Any, Optional
+from models.farmer_models import SoilData, CropRecommendation, CropRecommendationResponse, FertilizerRequest, FarmerProfile
+from routes.farmer_routes import get_optional_profile
+from services.container import get_soil_service
 from services.soil_service import SoilService
+from routes.content_routes import get_language
+from utils.firebase_config import COLLECTIONS
+from utils.firestore_writer import get_firestore_writer
 
 router = APIRouter(prefix="/soil", tags=["Soil & Crop"])
 logger = logging.getLogger(__name__)
 
-# Initialize service
-soil_service = SoilService()
-
 # API Routes
 
 @router.post("/recommend-crop")
-async def recommend_crop(soil_data: SoilData):
+async def recommend_crop(soil_data: SoilData, soil_service: SoilService = Depends(get_soil_service),
+                         lang: str = Depends(get_language)):
     try:
-        recommendations = await soil_service.get_crop_recommendations(soil_data)
+        recommendations = await soil_service.get_crop_recommendations(soil_data, lang)
+        writer = get_firestore_writer()
+        if writer:
+            # Buffered; committed in batches off the request path
+            writer.write_nowait(COLLECTIONS["soil_recommendations"], {
+                "soil_data": soil_data.model_dump(),
+                "recommendations": recommendations.model_dump(),
+                "timestamp": datetime.now(timezone.utc)
+            })
         return recommendations
     except Exception as e:
         logger.error(f"Error in crop recommendation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/fertilizer")
-async def get_fertilizer_guidance(request: FertilizerRequest):
+async def get_fertilizer_guidance(request: FertilizerRequest, soil_service: SoilService = Depends(get_soil_service)):
     try:
         guidance = await soil_service.get_fertilizer_guidance(request)
         return guidance
@@ -32,7 +44,7 @@ async def get_fertilizer_guidance(request: FertilizerRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/deficiencies")
-async def analyze_soil_deficiencies(soil_data: SoilData):
+async def analyze_soil_deficiencies(soil_data: SoilData, soil_service: SoilService = Depends(get_soil_service)):
     try:
         deficiencies = await soil_service.analyze_soil_deficiencies(soil_data)
         return deficiencies
@@ -43,10 +55,15 @@ async def analyze_soil_deficiencies(soil_data: SoilData):
 @router.get("/seasonal-recommendations")
 async def get_seasonal_recommendations(
     season: str = Query(..., description="Season (e.g., rabi, kharif)"),
-    region: str = Query("ludhiana", description="Region name")
+    region: Optional[str] = Query(None, description="Region name (defaults to the farmer's district)"),
+    profile: Optional[FarmerProfile] = Depends(get_optional_profile),
+    soil_service: SoilService = Depends(get_soil_service),
+    lang: str = Depends(get_language)
 ):
     try:
-        recommendations = await soil_service.get_seasonal_recommendations(season, region)
+        if region is None:
+            region = profile.district if profile and profile.district.lower() in soil_service.seasonal_crops else "ludhiana"
+        recommendations = await soil_service.get_seasonal_recommendations(season, region, lang)
         return recommendations
     except Exception as e:
         logger.error(f"Error in seasonal recommendations: {e}")
@@ -0,0 +1,40 @@
+# routes/sync_routes.py
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from models.farmer_models import FarmerProfile
+from routes.content_routes import get_language
+from routes.farmer_routes import get_optional_profile
+from services.container import get_sync_service
+from services.sync_service import SyncService
+from utils.auth import verify_user
+
+router = APIRouter(prefix="/sync", tags=["Sync"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("")
+async def sync(
+    token: Optional[str] = Query(None, description="sync_token from the previous response; omit for a full sync"),
+    lat: Optional[float] = Query(None, description="Farm latitude (enables forecast and alerts)"),
+    lon: Optional[float] = Query(None, description="Farm longitude"),
+    crops: Optional[List[str]] = Query(None, description="Crops to sync (defaults to the profile's crops)"),
+    days: int = Query(5, ge=1, le=7),
+    user_id: str = Depends(verify_user),
+    profile: Optional[FarmerProfile] = Depends(get_optional_profile),
+    lang: str = Depends(get_language),
+    sync_service: SyncService = Depends(get_sync_service)
+):
+    """
+    Everything that changed for this farmer since the given sync token:
+    prices for their crops, forecast, new alerts and catalog version.
+    Store the returned sync_token and send it with the next call.
+    Responses are compressed when the client sends Accept-Encoding.
+    """
+    if crops is None:
+        crops = profile.crops_grown if profile else ["wheat"]
+    try:
+        return await sync_service.sync(user_id, token, crops, lat=lat, lon=lon, days=days, lang=lang)
+    except Exception as e:
+        logger.error(f"Sync failed for {user_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Sync failed: {str(e)}")
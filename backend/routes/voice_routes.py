@@ -0,0 +1,69 @@
+# routes/voice_routes.py
+import logging
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request, Depends
+from fastapi.responses import StreamingResponse, Response
+from models.farmer_models import TTSRequest, VoiceResponse
+from services.container import get_voice_service
+from services.voice_service import VoiceService
+
+router = APIRouter(prefix="/voice", tags=["Voice"])
+logger = logging.getLogger(__name__)
+
+# Cached audio is content-addressed, so clients may keep it forever
+AUDIO_CACHE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+
+@router.post("/tts", response_model=VoiceResponse)
+async def text_to_speech(request: TTSRequest, voice_service: VoiceService = Depends(get_voice_service)):
+    """Synthesize speech and return a URL to the (cached) audio file"""
+    try:
+        key, path = await voice_service.synthesize(request)
+        return VoiceResponse(audio_url=f"/voice/audio/{key}", duration=voice_service.duration(path))
+    except Exception as e:
+        logger.error(f"Error in text-to-speech: {e}")
+        raise HTTPException(status_code=500, detail=f"Speech synthesis failed: {str(e)}")
+
+
+@router.post("/tts/stream")
+async def text_to_speech_stream(request: TTSRequest, voice_service: VoiceService = Depends(get_voice_service)):
+    """Synthesize speech and stream the audio back in chunks"""
+    try:
+        key, path = await voice_service.synthesize(request)
+    except Exception as e:
+        logger.error(f"Error in text-to-speech: {e}")
+        raise HTTPException(status_code=500, detail=f"Speech synthesis failed: {str(e)}")
+    return StreamingResponse(
+        voice_service.iter_file(path),
+        media_type=voice_service.engine.media_type,
+        headers={**AUDIO_CACHE_HEADERS, "ETag": f'"{key}"'}
+    )
+
+
+@router.get("/audio/{key}")
+async def get_audio(key: str, request: Request, voice_service: VoiceService = Depends(get_voice_service)):
+    """Stream previously synthesized audio"""
+    if request.headers.get("if-none-match") == f'"{key}"':
+        return Response(status_code=304, headers=AUDIO_CACHE_HEADERS)
+    path = voice_service.audio_path(key)
+    if not path:
+        raise HTTPException(status_code=404, detail="Audio not found or expired")
+    return StreamingResponse(
+        voice_service.iter_file(path),
+        media_type=voice_service.engine.media_type,
+        headers={**AUDIO_CACHE_HEADERS, "ETag": f'"{key}"'}
+    )
+
+
+@router.post("/stt")
+async def speech_to_text(
+    audio: UploadFile = File(...),
+    language: str = Form("hi"),
+    voice_service: VoiceService = Depends(get_voice_service)
+):
+    """Transcribe an uploaded audio clip (16-bit mono WAV for the offline engine)"""
+    try:
+        text = await voice_service.transcribe(await audio.read(), language)
+        return {"text": text, "language": language, "engine": voice_service.engine.name}
+    except Exception as e:
+        logger.error(f"Error in speech-to-text: {e}")
+        raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
@@ -1,16 +1,18 @@
 # backend/routes/weather_routes.py
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
+from services.container import get_weather_service, get_alert_service
 from services.weather_service import WeatherService
 from services.alert_service import AlertService
+from routes.content_routes import get_language
 
 router = APIRouter(prefix="/weather", tags=["Weather"])
 
-# Initialize services
-weather_service = WeatherService()
-alert_service = AlertService()
-
 @router.get("/current")
-async def get_current_weather(lat: float = Query(...), lon: float = Query(...)):
+async def get_current_weather(
+    lat: float = Query(...),
+    lon: float = Query(...),
+    weather_service: WeatherService = Depends(get_weather_service)
+):
     """Get current weather conditions"""
     try:
         weather = weather_service.get_current_weather(lat, lon)
@@ -24,7 +26,10 @@ async def get_weather_forecast(
     lat: float = Query(...),
     lon: float = Query(...),
     days: int = Query(5, ge=1, le=7),
-    crop: str = Query("wheat")  # default wheat
+    crop: str = Query("wheat"),  # default wheat
+    weather_service: WeatherService = Depends(get_weather_service),
+    alert_service: AlertService = Depends(get_alert_service),
+    lang: str = Depends(get_language)
 ):
     """
     Get weather forecast + predictive crop-specific alerts
@@ -32,14 +37,16 @@ async def get_weather_forecast(
     try:
         forecast = weather_service.get_weather_forecast(lat, lon, days)
 
-        # Generate predictive alerts for chosen crop
-        alerts = alert_service.generate_weather_alerts(forecast["forecast"], crop)
+        # Generate predictive alerts for chosen crop, merged into multi-day episodes
+        alerts = alert_service.merge_episodes(
+            alert_service.generate_weather_alerts(forecast["forecast"], crop, lang), crop)
 
         return {
             "city": forecast["city"],
             "forecast": forecast["forecast"],
             "crop": crop,
-            "alerts": alerts
+            "alerts": alerts,
+            "catalog_version": alert_service.catalog.version
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,37 @@
+# serve.py
+"""
+Production entry point: `python serve.py`.
+
+Runs gunicorn with gunicorn.conf.py (preloaded app, UvicornWorker). Where
+gunicorn is unavailable (Windows), falls back to uvicorn's own multi-process
+mode, which loads the app separately in every worker.
+"""
+import logging
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP = "backend_main:app"
+
+logger = logging.getLogger("serve")
+
+
+def main() -> None:
+    os.chdir(BASE_DIR)
+    try:
+        from gunicorn.app.wsgiapp import run
+    except ImportError:
+        import uvicorn
+        logging.basicConfig(level=logging.INFO)
+        logger.warning("gunicorn not installed; using uvicorn workers without preload")
+        uvicorn.run(APP, host="0.0.0.0", port=int(os.getenv("PORT", "8000")),
+                    workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+                    timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", "30")))
+        return
+
+    sys.argv = ["gunicorn", "-c", os.path.join(BASE_DIR, "gunicorn.conf.py"), APP, *sys.argv[1:]]
+    run()
+
+
+if __name__ == "__main__":
+    main()
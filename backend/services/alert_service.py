@@ -1,37 +1,106 @@
-from typing import List, Dict
+from typing import Any, Callable, Iterable, List, Dict, NamedTuple, Optional, Tuple
+import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
 from models.farmer_models import SoilData
+from utils.metrics import ALERT_GENERATION_SECONDS, timed
+from utils.content_catalog import ContentCatalog, get_catalog
 
 logger = logging.getLogger(__name__)
 
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+# Alert types from the weather and soil rule paths that describe the same hazard
+ALERT_FAMILIES = {
+    "Heat Stress": "heat",
+    "Frost Risk": "cold",
+    "Cold Stress": "cold",
+    "High Humidity": "humidity_high",
+    "Low Humidity": "humidity_low",
+    "Heavy Rain Risk": "excess_water",
+    "Waterlogging Risk": "excess_water",
+    "Drought Risk": "drought",
+    "Drought Stress": "drought",
+    "Nutrient Leaching": "leaching",
+    "Disease Susceptibility": "disease",
+}
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class EpisodeRef(NamedTuple):
+    """What is kept of a delivered episode: enough to recognise it in a later forecast."""
+    episode_id: str
+    fingerprint: str
+    scope: str    # crop:family
+    start: int    # date ordinals
+    end: int
+
+
+def episode_ref(episode: Dict) -> EpisodeRef:
+    return EpisodeRef(episode["episode_id"], episode["fingerprint"],
+                      f"{episode.get('crop', '')}:{episode['family']}",
+                      date.fromisoformat(episode["start_date"]).toordinal(),
+                      date.fromisoformat(episode["end_date"]).toordinal())
+
+
+def continue_episodes(episodes: Iterable[Dict], previous: Iterable[EpisodeRef]) -> List[Dict]:
+    """
+    Carry identity over from episodes seen earlier.
+
+    The forecast window slides every day, so yesterday's D1-D3 episode
+    comes back as D2-D4. An episode of the same crop and hazard whose
+    dates overlap or touch a previous one is that episode continued: it
+    keeps the previous episode_id and earliest start_date. Each previous
+    episode is continued at most once.
+    """
+    by_scope: Dict[str, List[EpisodeRef]] = {}
+    for ref in previous:
+        by_scope.setdefault(ref.scope, []).append(ref)
+    continued = []
+    for episode in episodes:
+        refs = by_scope.get(f"{episode.get('crop', '')}:{episode['family']}")
+        start = date.fromisoformat(episode["start_date"]).toordinal()
+        end = date.fromisoformat(episode["end_date"]).toordinal()
+        match = next((r for r in refs or () if r.start - 1 <= end and start <= r.end + 1), None)
+        if match is None:
+            continued.append(episode)
+            continue
+        refs.remove(match)
+        start = min(start, match.start)
+        start_date = date.fromordinal(start).isoformat()
+        continued.append({**episode, "episode_id": match.episode_id, "date": start_date,
+                          "start_date": start_date, "days": end - start + 1})
+    return continued
+
+
 class AlertService:
-    def __init__(self):
+    def __init__(self, catalog: ContentCatalog = None):
+        # Thresholds live here; advisory text comes from the content catalog by message ID
+        self.catalog = catalog or get_catalog()
         self.crop_rules = {
             "wheat": {
                 "temp_range": (10, 25),  
                 "humidity_max": 85,      
                 "rainfall_max": 20,      
-                "alerts": {
-                    "heat": "High temp may reduce yield and cause heat stress in wheat.",
-                    "frost": "Low temp may damage wheat seedlings. Consider irrigation to reduce frost.",
-                    "humidity": "High humidity increases rust & fungal disease risk. Apply fungicide if needed.",
-                    "rain": "Heavy rain may cause lodging & waterlogging. Ensure drainage."
-                }
+                "alerts": self.catalog.weather_alerts["wheat"]
             },
             "rice": {
                 "temp_range": (20, 35),  
                 "humidity_min": 60,      
                 "rainfall_min": 5,       
-                "alerts": {
-                    "cold": "Low temp may slow rice growth. Consider transplanting delay.",
-                    "heat": "Excess heat may cause spikelet sterility in rice.",
-                    "humidity": "Low humidity may reduce tillering. Keep fields irrigated.",
-                    "drought": "Insufficient rainfall detected. Ensure irrigation for paddy."
-                }
+                "alerts": self.catalog.weather_alerts["rice"]
             }
         }
+        self.soil_weather_alerts = self.catalog.soil_weather_alerts
 
-    def generate_weather_alerts(self, forecast: List[Dict], crop: str) -> List[Dict]:
+    @timed(ALERT_GENERATION_SECONDS, "weather")
+    def generate_weather_alerts(self, forecast: List[Dict], crop: str, lang: Optional[str] = None) -> List[Dict]:
         crop = crop.lower()
         if crop not in self.crop_rules:
             logger.warning(f"No crop rules defined for {crop}")
@@ -48,28 +117,30 @@ class AlertService:
 
             if crop == "wheat":
                 if temp_max > rules["temp_range"][1]:
-                    alerts.append(self._make_alert(day, "Heat Stress", "high", rules["alerts"]["heat"]))
+                    alerts.append(self._make_alert(day, "Heat Stress", "high", rules["alerts"]["heat"], lang))
                 if temp_min < rules["temp_range"][0]:
-                    alerts.append(self._make_alert(day, "Frost Risk", "medium", rules["alerts"]["frost"]))
+                    alerts.append(self._make_alert(day, "Frost Risk", "medium", rules["alerts"]["frost"], lang))
                 if humidity > rules["humidity_max"]:
-                    alerts.append(self._make_alert(day, "High Humidity", "medium", rules["alerts"]["humidity"]))
+                    alerts.append(self._make_alert(day, "High Humidity", "medium", rules["alerts"]["humidity"], lang))
                 if rainfall > rules["rainfall_max"]:
-                    alerts.append(self._make_alert(day, "Heavy Rain Risk", "high", rules["alerts"]["rain"]))
+                    alerts.append(self._make_alert(day, "Heavy Rain Risk", "high", rules["alerts"]["rain"], lang))
 
             elif crop == "rice":
                 if temp_min < rules["temp_range"][0]:
-                    alerts.append(self._make_alert(day, "Cold Stress", "medium", rules["alerts"]["cold"]))
+                    alerts.append(self._make_alert(day, "Cold Stress", "medium", rules["alerts"]["cold"], lang))
                 if temp_max > rules["temp_range"][1]:
-                    alerts.append(self._make_alert(day, "Heat Stress", "high", rules["alerts"]["heat"]))
+                    alerts.append(self._make_alert(day, "Heat Stress", "high", rules["alerts"]["heat"], lang))
                 if humidity < rules["humidity_min"]:
-                    alerts.append(self._make_alert(day, "Low Humidity", "medium", rules["alerts"]["humidity"]))
+                    alerts.append(self._make_alert(day, "Low Humidity", "medium", rules["alerts"]["humidity"], lang))
                 if rainfall < rules["rainfall_min"]:
-                    alerts.append(self._make_alert(day, "Drought Risk", "high", rules["alerts"]["drought"]))
+                    alerts.append(self._make_alert(day, "Drought Risk", "high", rules["alerts"]["drought"], lang))
 
         return alerts
 
-    def generate_soil_weather_alerts(self, soil_data: SoilData, forecast: List[Dict], crop: str) -> List[Dict]:
-        alerts = self.generate_weather_alerts(forecast, crop)
+    @timed(ALERT_GENERATION_SECONDS, "soil_weather")
+    def generate_soil_weather_alerts(self, soil_data: SoilData, forecast: List[Dict], crop: str,
+                                     lang: Optional[str] = None) -> List[Dict]:
+        alerts = self.generate_weather_alerts(forecast, crop, lang)
 
         for day in forecast:
             rainfall = day["rainfall"]
@@ -77,26 +148,252 @@ class AlertService:
 
             if soil_data.moisture_level and soil_data.moisture_level > 70 and rainfall > 20:
                 alerts.append(self._make_alert(day, "Waterlogging Risk", "high",
-                                               "Soil already moist + heavy rain expected → flooding risk. Ensure proper drainage."))
+                                               self.soil_weather_alerts["waterlogging"], lang))
 
             if soil_data.nitrogen < 50 and rainfall > 30:
                 alerts.append(self._make_alert(day, "Nutrient Leaching", "medium",
-                                               "Low nitrogen + heavy rain → possible nutrient loss. Apply nitrogen fertilizer after rain."))
+                                               self.soil_weather_alerts["leaching"], lang))
 
             if soil_data.moisture_level and soil_data.moisture_level < 30 and rainfall < 5:
                 alerts.append(self._make_alert(day, "Drought Stress", "high",
-                                               "Soil moisture low + no rain expected → drought risk. Irrigation recommended."))
+                                               self.soil_weather_alerts["drought"], lang))
 
             if soil_data.organic_carbon and soil_data.organic_carbon < 0.5 and humidity > 80:
                 alerts.append(self._make_alert(day, "Disease Susceptibility", "medium",
-                                               "Low organic carbon + high humidity may increase fungal disease risk. Use organic matter."))
+                                               self.soil_weather_alerts["disease"], lang))
 
         return alerts
 
-    def _make_alert(self, day: Dict, alert_type: str, severity: str, message: str) -> Dict:
+    def _make_alert(self, day: Dict, alert_type: str, severity: str, message_id: str,
+                    lang: Optional[str] = None) -> Dict:
         return {
             "date": day["date"],
             "type": alert_type,
             "severity": severity,
-            "message": message
-        }
\ No newline at end of file
+            "message": self.catalog.text(message_id, lang),
+            "message_id": message_id
+        }
+    # -----------------------------
+    # Episodes
+    # -----------------------------
+    def merge_episodes(self, alerts: List[Dict], crop: Optional[str] = None) -> List[Dict]:
+        """
+        Collapse per-day alerts into episodes, most severe first.
+
+        Alerts of the same hazard family on the same day (e.g. "Drought Risk"
+        from the weather rules and "Drought Stress" from the soil rules) are
+        deduplicated, keeping the more severe one (the later, more specific
+        rule on ties). Consecutive days of a family then merge into one
+        episode spanning start_date..end_date at its worst severity.
+        """
+        by_day: Dict[Tuple[str, str], Dict] = {}
+        for alert in alerts:
+            family = ALERT_FAMILIES.get(alert["type"], alert["type"])
+            key = (family, alert["date"])
+            current = by_day.get(key)
+            if current is None or SEVERITY_RANK.get(alert["severity"], 0) >= SEVERITY_RANK.get(current["severity"], 0):
+                by_day[key] = alert
+
+        episodes: List[Dict] = []
+        open_episodes: Dict[str, Dict] = {}
+        for (family, day), alert in sorted(by_day.items(), key=lambda item: (item[0][1], item[0][0])):
+            episode = open_episodes.get(family)
+            if episode is not None and date.fromisoformat(day) - date.fromisoformat(episode["end_date"]) == timedelta(days=1):
+                episode["end_date"] = day
+                episode["days"] += 1
+                if SEVERITY_RANK.get(alert["severity"], 0) > SEVERITY_RANK.get(episode["severity"], 0):
+                    episode.update(type=alert["type"], severity=alert["severity"],
+                                   message=alert["message"], message_id=alert["message_id"])
+                continue
+            episode = {
+                "type": alert["type"],
+                "crop": crop or "",
+                "family": family,
+                "severity": alert["severity"],
+                "message": alert["message"],
+                "message_id": alert["message_id"],
+                "date": day,
+                "start_date": day,
+                "end_date": day,
+                "days": 1,
+            }
+            open_episodes[family] = episode
+            episodes.append(episode)
+
+        for episode in episodes:
+            # Same hazard and start date => same episode (continue_episodes() links it to earlier
+            # forecasts); a new severity or message => new fingerprint. A longer or shorter
+            # end date alone is not worth another notification.
+            identity = ":".join((crop or "", episode["family"], episode["start_date"]))
+            state = ":".join((episode["severity"], episode["message_id"]))
+            episode["episode_id"] = f"{_hash64(identity):016x}"
+            episode["fingerprint"] = f"{_hash64(state):016x}"
+
+        episodes.sort(key=lambda e: (-SEVERITY_RANK.get(e["severity"], 0), e["start_date"], e["type"]))
+        return episodes
+
+
+class AlertLedger:
+    """
+    Episodes already sent to each farm, as {episode_id: EpisodeRef}, plus
+    episodes reserved by a notification job that has not finished yet.
+    filter_unsent() first links episodes to the sent and reserved ones
+    (continue_episodes), then returns only new episodes or ones whose
+    severity or message changed; the dates of the unchanged sent ones are
+    kept current. A reservation ends with mark_sent() or release(), or
+    lapses after `reserve_seconds` if its job never reports back.
+    Episodes that ended before yesterday are pruned (yesterday's can
+    still be continued by today's); farms are LRU-capped.
+
+    With a writer and client_factory the ledger is shared by all workers:
+    every change rewrites the farm's document (`alert_ledger/<farm_id>`)
+    through the write-behind writer, and load() re-reads it once the
+    worker's copy is older than `refresh_seconds`. Callers load() a farm
+    (blocking, off the event loop) before filter_unsent(). Workers can
+    still disagree for up to `refresh_seconds` plus a writer flush, so
+    rounds for the same farms should run further apart than that.
+    """
+
+    def __init__(self, max_farms: int = 100_000, reserve_seconds: float = 12 * 3600, writer=None,
+                 client_factory: Optional[Callable[[], Any]] = None, collection: str = "alert_ledger",
+                 refresh_seconds: float = 60.0):
+        self.max_farms = max_farms
+        self.reserve_seconds = reserve_seconds
+        self.writer = writer
+        self._client_factory = client_factory
+        self._client = None
+        self.collection = collection
+        self.refresh_seconds = refresh_seconds
+        self._sent: "OrderedDict[str, Dict[str, EpisodeRef]]" = OrderedDict()
+        self._pending: Dict[str, Dict[str, Tuple[EpisodeRef, float]]] = {}   # farm -> id -> (ref, reserved until)
+        self._fresh: Dict[str, float] = {}   # farm -> monotonic time of the last load or change
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sent)
+
+    @property
+    def client(self):
+        if self._client is None and self._client_factory is not None:
+            self._client = self._client_factory()
+        return self._client
+
+    # Persistence ---------------------------------------------------
+    def load(self, farm_id: str) -> None:
+        """Refresh a farm's entry from its document unless this worker's copy is recent."""
+        if self.client is None:
+            return
+        with self._lock:
+            fresh = self._fresh.get(farm_id)
+            if fresh is not None and time.monotonic() - fresh < self.refresh_seconds:
+                return
+        snapshot = self.client.collection(self.collection).document(farm_id).get()
+        data = (snapshot.to_dict() if snapshot.exists else None) or {}
+        sent = {k: EpisodeRef(k, *v) for k, v in (data.get("sent") or {}).items()}
+        pending = {k: (EpisodeRef(k, *v[:4]), v[4]) for k, v in (data.get("pending") or {}).items()}
+        with self._lock:
+            self._sent[farm_id] = sent
+            if pending:
+                self._pending[farm_id] = pending
+            else:
+                self._pending.pop(farm_id, None)
+            self._touch(farm_id)
+
+    def _touch(self, farm_id: str) -> None:
+        self._fresh[farm_id] = time.monotonic()
+        self._sent.move_to_end(farm_id)
+        while len(self._sent) > self.max_farms:
+            evicted, _ = self._sent.popitem(last=False)
+            self._pending.pop(evicted, None)
+            self._fresh.pop(evicted, None)
+
+    def _save(self, farm_id: str) -> None:
+        """Record a change (under the lock) and queue the farm's document."""
+        self._sent.setdefault(farm_id, {})
+        self._touch(farm_id)
+        if self.writer is None:
+            return
+        sent = self._sent[farm_id]
+        pending = self._pending.get(farm_id, {})
+        doc = {
+            "farm_id": farm_id,
+            "sent": {k: [r.fingerprint, r.scope, r.start, r.end] for k, r in sent.items()},
+            "pending": {k: [r.fingerprint, r.scope, r.start, r.end, until] for k, (r, until) in pending.items()},
+            "updated_at": datetime.now(timezone.utc),
+        }
+        if not self.writer.write_nowait(self.collection, doc, doc_id=farm_id):
+            logger.warning(f"Alert ledger update for {farm_id} dropped")
+
+    # Ledger --------------------------------------------------------
+    def _reserved(self, farm_id: str, now: float) -> Dict[str, EpisodeRef]:
+        pending = self._pending.get(farm_id, {})
+        for key in [k for k, (_, until) in pending.items() if until <= now]:
+            del pending[key]
+        return {k: ref for k, (ref, _) in pending.items()}
+
+    def filter_unsent(self, farm_id: str, episodes: Iterable[Dict]) -> List[Dict]:
+        """New or changed episodes not already reserved, carrying the ids of the episodes they continue."""
+        with self._lock:
+            sent = self._sent.get(farm_id, {})
+            reserved = self._reserved(farm_id, time.time())
+            unsent = []
+            moved = False
+            for episode in continue_episodes(episodes, [*sent.values(), *reserved.values()]):
+                episode_id, fingerprint = episode["episode_id"], episode["fingerprint"]
+                pending = reserved.get(episode_id)
+                if pending is not None and pending.fingerprint == fingerprint:
+                    continue
+                previous = sent.get(episode_id)
+                if previous is None or previous.fingerprint != fingerprint:
+                    unsent.append(episode)
+                elif previous.end != episode_ref(episode).end:
+                    # Already delivered; only its dates moved. Track them so it stays recognisable.
+                    sent[episode_id] = previous._replace(end=episode_ref(episode).end)
+                    moved = True
+            if moved:
+                self._save(farm_id)
+            return unsent
+
+    def reserve(self, farm_id: str, episodes: Iterable[Dict]) -> None:
+        """Hold episodes a job is about to deliver, so filter_unsent() skips them meanwhile."""
+        until = time.time() + self.reserve_seconds
+        with self._lock:
+            pending = self._pending.setdefault(farm_id, {})
+            for episode in episodes:
+                ref = episode_ref(episode)
+                pending[ref.episode_id] = (ref, until)
+            self._save(farm_id)
+
+    def release(self, farm_id: str, episodes: Iterable[Dict]) -> None:
+        """Drop reservations of episodes whose job delivered nothing, so the next round retries them."""
+        with self._lock:
+            pending = self._pending.get(farm_id, {})
+            for episode in episodes:
+                pending.pop(episode["episode_id"], None)
+            if not pending:
+                self._pending.pop(farm_id, None)
+            self._save(farm_id)
+
+    def mark_sent(self, farm_id: str, episodes: Iterable[Dict], today: Optional[date] = None) -> None:
+        cutoff = (today or date.today()).toordinal() - 1
+        with self._lock:
+            sent = self._sent.setdefault(farm_id, {})
+            pending = self._pending.get(farm_id, {})
+            for episode in episodes:
+                ref = episode_ref(episode)
+                pending.pop(ref.episode_id, None)
+                previous = sent.get(ref.episode_id)
+                if previous is not None:
+                    ref = ref._replace(start=min(ref.start, previous.start))
+                sent[ref.episode_id] = ref
+            if not pending:
+                self._pending.pop(farm_id, None)
+            for key in [k for k, ref in sent.items() if ref.end < cutoff]:
+                del sent[key]
+            self._save(farm_id)
+
+    def forget(self, farm_id: str) -> None:
+        with self._lock:
+            self._sent.pop(farm_id, None)
+            self._pending.pop(farm_id, None)
+            self._fresh.pop(farm_id, None)
@@ -0,0 +1,444 @@
+# services/analytics_service.py
+"""
+Usage analytics from pre-rolled counters.
+
+Every API request is folded into in-memory rollups as it finishes
+(UsageAnalyticsMiddleware) instead of being logged and queried later:
+
+- per feature and time bucket (hourly by default): request count,
+  successes, last use, a HyperLogLog of user ids and a t-digest of
+  latencies
+- per farmer and day: requests and successes per feature, plus sessions
+  (requests closer than ANALYTICS_SESSION_GAP are one session)
+
+Each worker periodically flushes the rollups it changed through the
+Firestore write-behind writer. A worker owns its own shard documents
+(`<bucket>:<shard>` in `analytics`, `<farmer>:<day>:<shard>` in
+`farmer_analytics`) and rewrites them with its cumulative totals, so
+workers never contend on a hot document and a retried flush is
+idempotent. Readers combine the shards of the requested range - counts
+add up, sketches merge - and the dashboard never touches raw request
+logs.
+
+Sessions are tracked per worker; a farmer whose requests are spread over
+several workers may show shorter, more numerous sessions.
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from models.farmer_models import FarmerAnalytics, UsageAnalytics
+from utils.cache import TTLCache
+from utils.sketches import HyperLogLog, TDigest
+
+logger = logging.getLogger(__name__)
+
+# Paths that are not farmer-facing features
+EXCLUDED_FEATURES = {"metrics", "analytics", "admin", "docs", "redoc", "openapi.json"}
+
+
+def route_feature(route_path: str) -> Optional[str]:
+    """Feature name for a route template: its first path segment (/weather/forecast -> weather)."""
+    feature = route_path.strip("/").split("/", 1)[0]
+    if not feature or feature in EXCLUDED_FEATURES or feature.startswith("{"):
+        return None
+    return feature
+
+
+def _day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _iso(ts: float) -> Optional[datetime]:
+    return datetime.fromtimestamp(ts, tz=timezone.utc) if ts else None
+
+
+# -----------------------------
+# Rollups
+# -----------------------------
+@dataclass(slots=True)
+class FeatureRollup:
+    count: int = 0
+    success: int = 0
+    last_used: float = 0.0
+    users: HyperLogLog = field(default_factory=HyperLogLog)
+    latency: TDigest = field(default_factory=TDigest)
+
+    def add(self, user_id: Optional[str], ok: bool, seconds: float, ts: float) -> None:
+        self.count += 1
+        self.success += ok
+        self.last_used = max(self.last_used, ts)
+        if user_id:
+            self.users.add(user_id)
+        self.latency.add(seconds)
+
+    def merge(self, other: "FeatureRollup") -> "FeatureRollup":
+        self.count += other.count
+        self.success += other.success
+        self.last_used = max(self.last_used, other.last_used)
+        self.users.merge(other.users)
+        self.latency.merge(other.latency)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "success": self.success, "last_used": self.last_used,
+                "users": self.users.to_string(), "latency": self.latency.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FeatureRollup":
+        return cls(count=int(data.get("count", 0)), success=int(data.get("success", 0)),
+                   last_used=float(data.get("last_used", 0.0)),
+                   users=HyperLogLog.from_string(data["users"]) if data.get("users") else HyperLogLog(),
+                   latency=TDigest.from_dict(data.get("latency") or {}))
+
+    def summary(self, feature: str) -> Dict[str, Any]:
+        def ms(q: float) -> Optional[float]:
+            value = self.latency.quantile(q)
+            return round(value * 1000, 1) if value is not None else None
+        return UsageAnalytics(
+            feature_name=feature, usage_count=self.count, last_used=_iso(self.last_used),
+            success_rate=round(self.success / self.count, 4) if self.count else None,
+            unique_users=self.users.count(),
+            latency_p50_ms=ms(0.5), latency_p95_ms=ms(0.95), latency_p99_ms=ms(0.99),
+        ).model_dump()
+
+
+@dataclass(slots=True)
+class FarmerDay:
+    features: Dict[str, List[float]] = field(default_factory=dict)   # feature -> [count, success, last_used]
+    sessions: int = 0
+    session_seconds: float = 0.0
+
+    def add(self, feature: str, ok: bool, ts: float) -> None:
+        entry = self.features.setdefault(feature, [0, 0, 0.0])
+        entry[0] += 1
+        entry[1] += ok
+        entry[2] = max(entry[2], ts)
+
+    def merge(self, other: "FarmerDay") -> "FarmerDay":
+        for feature, (count, success, last_used) in other.features.items():
+            entry = self.features.setdefault(feature, [0, 0, 0.0])
+            entry[0] += count
+            entry[1] += success
+            entry[2] = max(entry[2], last_used)
+        self.sessions += other.sessions
+        self.session_seconds += other.session_seconds
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"features": {f: {"count": c, "success": s, "last_used": t} for f, (c, s, t) in self.features.items()},
+                "sessions": self.sessions, "session_seconds": round(self.session_seconds, 3)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FarmerDay":
+        features = {f: [int(v.get("count", 0)), int(v.get("success", 0)), float(v.get("last_used", 0.0))]
+                    for f, v in (data.get("features") or {}).items()}
+        return cls(features, int(data.get("sessions", 0)), float(data.get("session_seconds", 0.0)))
+
+
+# -----------------------------
+# Aggregator
+# -----------------------------
+class UsageAggregator:
+    def __init__(self, writer=None, client_factory: Optional[Callable[[], Any]] = None,
+                 collection: str = "analytics", farmer_collection: str = "farmer_analytics",
+                 bucket_seconds: int = 3600, flush_interval: float = 60.0, session_gap: float = 1800.0,
+                 retention_buckets: int = 24 * 7, max_sessions: int = 200_000, shard: Optional[str] = None):
+        self.writer = writer
+        self._client_factory = client_factory
+        self._client = None
+        self.collection = collection
+        self.farmer_collection = farmer_collection
+        self.bucket_seconds = bucket_seconds
+        self.flush_interval = flush_interval
+        self.session_gap = session_gap
+        self.retention_buckets = retention_buckets
+        self.max_sessions = max_sessions
+        self.shard = shard or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self._buckets: Dict[int, Dict[str, FeatureRollup]] = {}
+        self._farmer_days: Dict[Tuple[str, str], FarmerDay] = {}
+        self._sessions: "OrderedDict[str, List[float]]" = OrderedDict()   # user -> [start, last]
+        self._dirty_buckets: set = set()
+        self._dirty_days: set = set()
+        self._lock = threading.Lock()
+        self._cache = TTLCache(maxsize=256, ttl=flush_interval, name="usage_rollups")
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def client(self):
+        if self._client is None and self._client_factory is not None:
+            self._client = self._client_factory()
+        return self._client
+
+    def _bucket(self, ts: float) -> int:
+        return int(ts // self.bucket_seconds) * self.bucket_seconds
+
+    # -----------------------------
+    # Recording
+    # -----------------------------
+    def record(self, feature: str, user_id: Optional[str], ok: bool, seconds: float,
+               ts: Optional[float] = None) -> None:
+        ts = time.time() if ts is None else ts
+        bucket = self._bucket(ts)
+        with self._lock:
+            rollups = self._buckets.setdefault(bucket, {})
+            rollup = rollups.get(feature)
+            if rollup is None:
+                rollup = rollups[feature] = FeatureRollup()
+            rollup.add(user_id, ok, seconds, ts)
+            self._dirty_buckets.add(bucket)
+            if user_id:
+                key = (user_id, _day(ts))
+                day = self._farmer_days.get(key)
+                if day is None:
+                    day = self._farmer_days[key] = FarmerDay()
+                day.add(feature, ok, ts)
+                self._dirty_days.add(key)
+                self._touch_session(user_id, ts)
+
+    def _touch_session(self, user_id: str, ts: float) -> None:
+        session = self._sessions.get(user_id)
+        if session is not None and ts - session[1] <= self.session_gap:
+            session[1] = max(session[1], ts)
+            self._sessions.move_to_end(user_id)
+            return
+        if session is not None:
+            self._close_session(user_id, session)
+        self._sessions[user_id] = [ts, ts]
+        while len(self._sessions) > self.max_sessions:
+            oldest, old_session = self._sessions.popitem(last=False)
+            self._close_session(oldest, old_session)
+
+    def _close_session(self, user_id: str, session: List[float]) -> None:
+        key = (user_id, _day(session[0]))
+        day = self._farmer_days.get(key)
+        if day is None:
+            day = self._farmer_days[key] = FarmerDay()
+        day.sessions += 1
+        day.session_seconds += session[1] - session[0]
+        self._dirty_days.add(key)
+
+    # -----------------------------
+    # Flushing
+    # -----------------------------
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            for user_id, session in self._sessions.items():
+                self._close_session(user_id, session)
+            self._sessions.clear()
+        self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Usage analytics flush failed: {e}")
+
+    def flush(self, now: Optional[float] = None) -> int:
+        """Write changed shard documents; drop closed buckets and days once written. Returns docs queued."""
+        now = time.time() if now is None else now
+        current_bucket, today = self._bucket(now), _day(now)
+        written = 0
+        with self._lock:
+            idle = [u for u, (_, last) in self._sessions.items() if now - last > self.session_gap]
+            for user_id in idle:
+                self._close_session(user_id, self._sessions.pop(user_id))
+            bucket_docs = [(b, {f: r.to_dict() for f, r in self._buckets[b].items()}) for b in self._dirty_buckets]
+            day_docs = [(k, self._farmer_days[k].to_dict()) for k in self._dirty_days]
+            self._dirty_buckets.clear()
+            self._dirty_days.clear()
+
+        if self.writer is None:
+            # No Firestore: rollups stay in memory, bounded by the retention window
+            with self._lock:
+                for bucket in [b for b in self._buckets if b < current_bucket - self.retention_buckets * self.bucket_seconds]:
+                    del self._buckets[bucket]
+                for key in [k for k in self._farmer_days if k[1] < _day(now - self.retention_buckets * self.bucket_seconds)]:
+                    del self._farmer_days[key]
+            return 0
+
+        updated_at = datetime.now(timezone.utc)
+        failed_buckets, failed_days = set(), set()
+        for bucket, features in bucket_docs:
+            doc = {"bucket": bucket, "bucket_seconds": self.bucket_seconds, "shard": self.shard,
+                   "features": features, "updated_at": updated_at}
+            if self.writer.write_nowait(self.collection, doc, doc_id=f"{bucket}:{self.shard}"):
+                written += 1
+            else:
+                failed_buckets.add(bucket)
+        for (user_id, day), data in day_docs:
+            doc = {"farmer_id": user_id, "day": day, "shard": self.shard, **data, "updated_at": updated_at}
+            if self.writer.write_nowait(self.farmer_collection, doc, doc_id=f"{user_id}:{day}:{self.shard}"):
+                written += 1
+            else:
+                failed_days.add((user_id, day))
+
+        with self._lock:
+            self._dirty_buckets |= failed_buckets
+            self._dirty_days |= failed_days
+            # Closed buckets/days are final once written; keep only what can still change
+            for bucket in [b for b in self._buckets
+                           if b < current_bucket - self.bucket_seconds and b not in self._dirty_buckets]:
+                del self._buckets[bucket]
+            open_days = {_day(start) for start, _ in self._sessions.values()}
+            for key in [k for k in self._farmer_days
+                        if k[1] < today and k not in self._dirty_days and k[1] not in open_days]:
+                del self._farmer_days[key]
+        if failed_buckets or failed_days:
+            logger.warning(f"Usage analytics: writer full, {len(failed_buckets) + len(failed_days)} rollups retried later")
+        return written
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    def _stored(self, collection: str, field_name: str, op: str, value: Any) -> Iterable[Dict[str, Any]]:
+        if self.client is None:
+            return []
+        source = self.client.collection(collection)
+        if hasattr(source, "where"):
+            source = source.where(field_name, op, value)
+            return [s.to_dict() for s in source.stream()]
+        # In-memory fake: filter client-side
+        compare = {">=": lambda a: a >= value, "==": lambda a: a == value}[op]
+        return [d for d in (s.to_dict() for s in source.stream()) if d and d.get(field_name) is not None
+                and compare(d[field_name])]
+
+    def usage(self, hours: int = 24, series: bool = False, now: Optional[float] = None) -> Dict[str, Any]:
+        """Per-feature totals (and optionally per-bucket counts) over the last `hours`."""
+        now = time.time() if now is None else now
+        start = self._bucket(now - hours * 3600 + self.bucket_seconds)
+        cache_key = ("usage", start, series)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            local = {b: {f: r.to_dict() for f, r in rollups.items()}
+                     for b, rollups in self._buckets.items() if b >= start}
+        shards: List[Tuple[int, Dict[str, Any]]] = list(local.items())
+        for doc in self._stored(self.collection, "bucket", ">=", start):
+            # This worker's in-memory buckets are newer than its stored documents
+            if doc.get("shard") != self.shard or int(doc["bucket"]) not in local:
+                shards.append((int(doc["bucket"]), doc.get("features") or {}))
+
+        totals: Dict[str, FeatureRollup] = {}
+        per_bucket: Dict[int, Dict[str, int]] = {}
+        for bucket, features in shards:
+            for feature, data in features.items():
+                rollup = FeatureRollup.from_dict(data)
+                per_bucket.setdefault(bucket, {})[feature] = per_bucket.get(bucket, {}).get(feature, 0) + rollup.count
+                if feature in totals:
+                    totals[feature].merge(rollup)
+                else:
+                    totals[feature] = rollup
+
+        result: Dict[str, Any] = {
+            "from": _iso(start), "to": _iso(now), "bucket_seconds": self.bucket_seconds,
+            "total_requests": sum(r.count for r in totals.values()),
+            "features": sorted((r.summary(f) for f, r in totals.items()), key=lambda s: -s["usage_count"]),
+        }
+        if series:
+            result["series"] = [{"bucket": _iso(b), "counts": per_bucket[b]} for b in sorted(per_bucket)]
+        self._cache.set(cache_key, result)
+        return result
+
+    def farmer(self, user_id: str, days: int = 30, now: Optional[float] = None,
+               satisfaction: Optional[float] = None) -> FarmerAnalytics:
+        """One farmer's usage over the last `days` days."""
+        now = time.time() if now is None else now
+        since = _day(now - (days - 1) * 86400)
+        shards: Dict[Tuple[str, str], FarmerDay] = {}
+        for doc in self._stored(self.farmer_collection, "farmer_id", "==", user_id):
+            if doc.get("day", "") >= since:
+                shards[(doc["day"], doc["shard"])] = FarmerDay.from_dict(doc)
+        open_session = None
+        with self._lock:
+            for (uid, day), data in self._farmer_days.items():
+                if uid == user_id and day >= since:
+                    shards[(day, self.shard)] = FarmerDay.from_dict(data.to_dict())
+            session = self._sessions.get(user_id)
+            if session is not None:
+                open_session = session[1] - session[0]
+
+        total = FarmerDay()
+        for data in shards.values():
+            total.merge(data)
+        if open_session is not None:
+            total.sessions += 1
+            total.session_seconds += open_session
+
+        usage = [
+            UsageAnalytics(feature_name=f, usage_count=int(c), last_used=_iso(t),
+                           success_rate=round(s / c, 4) if c else None)
+            for f, (c, s, t) in sorted(total.features.items(), key=lambda item: -item[1][0])
+        ]
+        return FarmerAnalytics(
+            total_queries=int(sum(u.usage_count for u in usage)),
+            most_used_features=[u.feature_name for u in usage[:3]],
+            avg_session_duration=round(total.session_seconds / total.sessions, 1) if total.sessions else None,
+            satisfaction_score=satisfaction,
+            usage_analytics=usage,
+        )
+
+
+# -----------------------------
+# ASGI middleware
+# -----------------------------
+class UsageAnalyticsMiddleware:
+    """
+    Feeds finished requests to the worker's UsageAggregator (the
+    "analytics" service). Pure ASGI, like MetricsMiddleware; the user id
+    is whatever verify_user left in request.state.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            feature = route_feature(route.path) if getattr(route, "path", None) else None
+            container = getattr(scope["app"].state, "container", None) if "app" in scope else None
+            if feature and container is not None:
+                try:
+                    aggregator = await container.aget("analytics")
+                    aggregator.record(feature, (scope.get("state") or {}).get("user_id"),
+                                      status["code"] < 400, time.perf_counter() - start)
+                except Exception as e:
+                    logger.debug(f"Usage analytics skipped: {e}")
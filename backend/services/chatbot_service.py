@@ -0,0 +1,285 @@
+# services/chatbot_service.py
+import asyncio
+import logging
+import random
+import re
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from models.farmer_models import ChatbotQuery, ChatbotResponse, SoilData
+from utils.content_catalog import get_catalog
+from utils.i18n import resolve_language
+
+logger = logging.getLogger(__name__)
+
+# Keywords used to resolve a message into one or more intents
+INTENT_KEYWORDS = {
+    "weather": ["weather", "rain", "temperature", "forecast", "climate"],
+    "crop": ["crop", "plant", "sow", "grow", "seed", "harvest"],
+    "pest": ["pest", "disease", "insect", "bug", "infection"],
+    "market": ["market", "price", "sell", "buy", "mandi", "cost"],
+    "fertilizer": ["fertilizer", "nutrient", "manure", "compost", "urea"],
+}
+
+# Whole words only ("drain" is not rain, "debug" is not a pest), plus plural and -ed/-ing forms
+INTENT_PATTERNS = {
+    name: re.compile(rf"\b(?:{'|'.join(map(re.escape, words))})(?:s|es|ed|ing)?\b")
+    for name, words in INTENT_KEYWORDS.items()
+}
+
+# Seconds each data source may take before we answer without it
+DEFAULT_SOURCE_TIMEOUTS = {
+    "weather": 3.0,
+    "market": 1.0,
+    "soil": 1.0,
+    "ml": 1.5,
+}
+
+
+class ChatbotService:
+    """
+    Resolves chatbot messages into live lookups against the other services.
+    Lookups for one message run concurrently, each bounded by its own timeout,
+    so a slow source only drops its own part of the answer.
+    """
+
+    def __init__(self, weather_service=None, market_service=None, soil_service=None,
+                 ml_service=None, canned_responses: Optional[Dict[str, List[str]]] = None,
+                 follow_up_questions: Optional[Dict[str, List[str]]] = None,
+                 source_timeouts: Optional[Dict[str, float]] = None, session_store=None,
+                 catalog=None):
+        self.weather_service = weather_service
+        self.market_service = market_service
+        self.soil_service = soil_service
+        self.ml_service = ml_service
+        self.source_timeouts = {**DEFAULT_SOURCE_TIMEOUTS, **(source_timeouts or {})}
+        self.session_store = session_store
+        # Canned replies and follow-ups are catalog message IDs, rendered per language
+        self.catalog = catalog or get_catalog()
+        self.canned_responses = canned_responses or self.catalog.chatbot_responses
+        self.follow_up_questions = follow_up_questions or self.catalog.follow_up_questions
+        self.suggestions = self.catalog.chatbot_suggestions
+
+    # -----------------------------
+    # Intent resolution
+    # -----------------------------
+    def detect_intents(self, message: str) -> List[str]:
+        """Return every intent whose keywords appear in the message, in priority order."""
+        message = message.lower()
+        intents = [name for name, pattern in INTENT_PATTERNS.items() if pattern.search(message)]
+        return intents or ["general"]
+
+    def _extract_crops(self, message: str, context: Dict[str, Any]) -> List[str]:
+        known = list(self.market_service.mock_data.keys()) if self.market_service else []
+        message = message.lower()
+        # Whole words only: "price of wheat" must not also match "rice"
+        crops = [crop for crop in known if re.search(rf"\b{re.escape(crop)}\b", message)]
+        if not crops and context.get("crop"):
+            crops = [str(context["crop"]).lower()]
+        if not crops and context.get("crops_grown"):
+            crops = [str(c).lower() for c in context["crops_grown"]]
+        return crops
+
+    @staticmethod
+    def _extract_location(context: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+        location = context.get("location")
+        if not isinstance(location, dict):
+            # A place name (or nothing): fall back to top-level lat/lon, else the canned answer
+            location = context
+        lat = location.get("lat")
+        lon = location.get("lon", location.get("lng"))
+        if lat is None or lon is None:
+            return None
+        try:
+            return float(lat), float(lon)
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring invalid location in chatbot context: {lat!r}, {lon!r}")
+            return None
+
+    @staticmethod
+    def _extract_soil(context: Dict[str, Any]) -> Optional[SoilData]:
+        soil = context.get("soil_data")
+        if not soil:
+            return None
+        try:
+            return SoilData(**soil)
+        except Exception as e:
+            logger.warning(f"Ignoring invalid soil_data in chatbot context: {e}")
+            return None
+
+    @staticmethod
+    def _current_season() -> str:
+        # Kharif: June-October, Rabi: November-May
+        return "kharif" if 6 <= datetime.now().month <= 10 else "rabi"
+
+    # -----------------------------
+    # Lookup planning
+    # -----------------------------
+    def _plan_lookups(self, intents: List[str], message: str,
+                      context: Dict[str, Any]) -> Dict[str, Callable[[], Awaitable[Any]]]:
+        """Map each required source to a zero-argument coroutine factory."""
+        lookups: Dict[str, Callable[[], Awaitable[Any]]] = {}
+
+        if "weather" in intents and self.weather_service:
+            location = self._extract_location(context)
+            if location:
+                lat, lon = location
+                lookups["weather"] = lambda: asyncio.to_thread(
+                    self.weather_service.get_weather_forecast, lat, lon, 3)
+
+        if "market" in intents and self.market_service:
+            crops = self._extract_crops(message, context)
+            if crops:
+                async def market_lookup():
+                    prices = await asyncio.gather(
+                        *(self.market_service.get_crop_prices(c) for c in crops))
+                    return [p for p in prices if "error" not in p]
+                lookups["market"] = market_lookup
+            else:
+                lookups["market"] = self.market_service.get_all_prices
+
+        if "crop" in intents:
+            soil = self._extract_soil(context)
+            if soil and self.ml_service:
+                lookups["ml"] = lambda: asyncio.to_thread(self.ml_service.predict_crop, soil)
+            if self.soil_service:
+                if soil:
+                    lookups["soil"] = lambda: self.soil_service.get_crop_recommendations(soil)
+                else:
+                    region = str(context.get("region") or context.get("district") or "ludhiana").lower()
+                    if region not in self.soil_service.seasonal_crops:
+                        region = "ludhiana"
+                    season = str(context.get("season") or self._current_season())
+                    lookups["soil"] = lambda: self.soil_service.get_seasonal_recommendations(season, region)
+
+        return lookups
+
+    async def _run_lookups(self, lookups: Dict[str, Callable[[], Awaitable[Any]]]) -> Dict[str, Any]:
+        """
+        Run all lookups concurrently. Sources that time out or fail are left out
+        of the result, so total latency is bounded by the slowest timeout.
+        """
+        async def run(source: str, factory: Callable[[], Awaitable[Any]]):
+            timeout = self.source_timeouts.get(source, 2.0)
+            try:
+                return source, await asyncio.wait_for(factory(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Chatbot lookup '{source}' timed out after {timeout}s")
+            except Exception as e:
+                logger.warning(f"Chatbot lookup '{source}' failed: {e}")
+            return source, None
+
+        results = await asyncio.gather(*(run(s, f) for s, f in lookups.items()))
+        return {source: value for source, value in results if value is not None}
+
+    # -----------------------------
+    # Answer composition
+    # -----------------------------
+    def _format_weather(self, forecast: Dict[str, Any], lang: str) -> str:
+        days = forecast.get("forecast", [])
+        if not days:
+            return self.catalog.text("chat.weather.none", lang)
+        parts = [self.catalog.render("chat.weather.day", lang, date=d["date"],
+                                     temp_min=d["temperature"]["min"], temp_max=d["temperature"]["max"],
+                                     rainfall=d["rainfall"]) for d in days]
+        city = forecast.get("city") or self.catalog.text("chat.weather.your_area", lang)
+        return self.catalog.render("chat.weather.summary", lang, city=city, days="; ".join(parts))
+
+    def _format_market(self, prices: Any, lang: str) -> str:
+        if isinstance(prices, dict):
+            prices = list(prices.values())
+        if not prices:
+            return self.catalog.text("chat.market.none", lang)
+        parts = [self.catalog.render("chat.market.item", lang, crop=p["crop"].title(), price=p["current_price"],
+                                     mandi=p["mandi"], min_price=p["min_price"], max_price=p["max_price"])
+                 for p in prices]
+        return self.catalog.render("chat.market.summary", lang, items=", ".join(parts))
+
+    def _format_crop(self, results: Dict[str, Any], lang: str) -> Optional[str]:
+        parts = []
+        if "ml" in results:
+            parts.append(self.catalog.render("chat.crop.ml", lang, crop=results["ml"]["recommended_crop"]))
+        soil = results.get("soil")
+        if soil is not None:
+            if hasattr(soil, "recommendations"):
+                names = [r.crop_name for r in soil.recommendations]
+                if names:
+                    parts.append(self.catalog.render("chat.crop.soil", lang, crops=", ".join(names),
+                                                     health=soil.soil_health_status))
+            else:
+                names = [c["crop_name"] for c in soil.get("recommended_crops", [])]
+                parts.append(self.catalog.render("chat.crop.seasonal", lang, season=soil["season"].title(),
+                                                 region=soil["region"].title(), crops=", ".join(names)))
+        return " ".join(parts) or None
+
+    def _canned(self, intent: str) -> str:
+        return random.choice(self.canned_responses.get(intent) or self.canned_responses["general"])
+
+    def _compose(self, intents: List[str], planned: List[str], results: Dict[str, Any],
+                 content_ids: Optional[List[str]] = None, lang: Optional[str] = None) -> Tuple[str, float]:
+        sections = []
+        for intent in intents:
+            text = None
+            if intent == "weather" and "weather" in results:
+                text = self._format_weather(results["weather"], lang)
+            elif intent == "market" and "market" in results:
+                text = self._format_market(results["market"], lang)
+            elif intent == "crop":
+                text = self._format_crop(results, lang)
+            if text is None:
+                content_id = self._canned(intent)
+                if content_ids is not None:
+                    content_ids.append(content_id)
+                text = self.catalog.text(content_id, lang)
+                if intent == "weather" and "weather" not in planned:
+                    text += " " + self.catalog.text("chat.weather.share_location", lang)
+            sections.append(text)
+
+        missing = [s for s in planned if s not in results]
+        if missing:
+            sections.append(self.catalog.render("chat.unavailable", lang, sources=", ".join(missing)))
+
+        # Answers backed by live data get higher confidence than canned text
+        if planned:
+            confidence = 0.75 + 0.2 * (len(results) / len(planned))
+        else:
+            confidence = 0.7
+        return " ".join(sections), round(confidence, 2)
+
+    async def answer(self, query: ChatbotQuery, user_id: Optional[str] = None,
+                     lang: Optional[str] = None) -> ChatbotResponse:
+        use_session = self.session_store is not None and user_id is not None
+        if use_session:
+            if self.session_store.shared:
+                await asyncio.to_thread(self.session_store.load, user_id)
+            context = self.session_store.merge_context(user_id, query.context)
+        else:
+            context = query.context or {}
+
+        intents = self.detect_intents(query.message)
+        if intents == ["general"] and use_session:
+            # Follow-ups like "and tomorrow?" continue the previous topic
+            intents = [self.session_store.last_intent(user_id) or "general"]
+
+        lookups = self._plan_lookups(intents, query.message, context)
+        results = await self._run_lookups(lookups) if lookups else {}
+
+        content_ids: List[str] = []
+        lang = lang or resolve_language([query.language], self.catalog.languages, self.catalog.default_language)
+        response, confidence = self._compose(intents, list(lookups), results, content_ids, lang)
+        primary = intents[0]
+        follow_ups = self.follow_up_questions.get(primary) or self.follow_up_questions.get("general", ())
+        follow_ups = random.sample(follow_ups, min(2, len(follow_ups)))
+        suggestions = self.suggestions.get(primary) or self.suggestions.get("general", ())
+
+        if use_session:
+            self.session_store.record_turn(user_id, primary, query.message, response, context)
+
+        return ChatbotResponse(
+            response=response,
+            confidence=confidence,
+            suggestions=self.catalog.texts(suggestions, lang),
+            follow_up_questions=self.catalog.texts(follow_ups, lang),
+            content_ids=content_ids + follow_ups + list(suggestions),
+            catalog_version=self.catalog.version
+        )
@@ -0,0 +1,237 @@
+# services/climate_archive.py
+"""
+Historical weather archive and climatological normals.
+
+Layout of the archive directory:
+
+    grid.json           regular lat/lon grid (origin, spacing, size)
+    cells/<cell>.npz    one compressed columnar daily series per grid cell:
+                        date (days since 1970-01-01), temp, humidity, rain
+    normals.npy         float32 (cells, 365, 3): temperature, humidity and
+                        rainfall normals per cell and day of year
+    normals.json        how the normals were built
+
+Archive building is an offline, chunked job (build_climate_normals.py):
+CSV rows are streamed into per-cell part files, compacted one cell at a
+time, and normals are computed one cell at a time, so decades of data
+never have to fit in memory. At request time ClimateNormals opens
+normals.npy memory-mapped and a lookup is a single array read.
+
+Normals per day of year (Feb 29 is folded into Feb 28):
+- temperature, humidity: mean over a +/-15 day window, all years
+- rainfall: expected total over the 30 days centred on the day, which
+  matches the seasonal rainfall scale the crop model was trained on
+"""
+import glob
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "climate")
+DAYS = 365
+NORMAL_VARIABLES = ("temperature", "humidity", "rainfall")
+MEAN_HALF_WINDOW = 15
+RAIN_WINDOW = 30
+
+
+@dataclass(frozen=True)
+class GridSpec:
+    lat0: float
+    lon0: float
+    dlat: float
+    dlon: float
+    nlat: int
+    nlon: int
+
+    @property
+    def cells(self) -> int:
+        return self.nlat * self.nlon
+
+    def nearest_cell(self, lat: float, lon: float) -> Optional[int]:
+        i = int(round((lat - self.lat0) / self.dlat))
+        j = int(round((lon - self.lon0) / self.dlon))
+        if not (0 <= i < self.nlat and 0 <= j < self.nlon):
+            return None
+        return i * self.nlon + j
+
+    def cells_for(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Nearest cell per point, -1 for points outside the grid (same rule as nearest_cell)."""
+        i = np.rint((lat - self.lat0) / self.dlat).astype(np.int64)
+        j = np.rint((lon - self.lon0) / self.dlon).astype(np.int64)
+        inside = (i >= 0) & (i < self.nlat) & (j >= 0) & (j < self.nlon)
+        return np.where(inside, i * self.nlon + j, -1)
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "grid.json"), "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+
+    @classmethod
+    def load(cls, directory: str) -> "GridSpec":
+        with open(os.path.join(directory, "grid.json"), "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+
+def day_of_year(days: np.ndarray) -> np.ndarray:
+    """0-based day of a 365-day year for dates given as days since the epoch."""
+    dates = days.astype("datetime64[D]")
+    years = dates.astype("datetime64[Y]")
+    doy = (dates - years.astype("datetime64[D]")).astype(np.int64)
+    year = years.astype(np.int64) + 1970
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    # Feb 29 (doy 59 in leap years) joins Feb 28; later days shift back by one
+    return np.where(leap & (doy >= 59), doy - 1, doy)
+
+
+def _circular_window_sum(values: np.ndarray, half_before: int, half_after: int) -> np.ndarray:
+    """Sum of values[d - half_before : d + half_after + 1] (wrapping) for every d, via prefix sums."""
+    padded = np.concatenate([values[-half_before:] if half_before else values[:0], values, values[:half_after]])
+    prefix = np.concatenate([[0.0], np.cumsum(padded)])
+    window = half_before + half_after + 1
+    return prefix[window:window + len(values)] - prefix[:len(values)]
+
+
+def compute_normals(days: np.ndarray, temp: np.ndarray, humidity: np.ndarray, rain: np.ndarray) -> np.ndarray:
+    """(365, 3) normals for one cell's daily series; NaN where there is no data."""
+    doy = day_of_year(days)
+    normals = np.full((DAYS, len(NORMAL_VARIABLES)), np.nan, dtype=np.float32)
+    for k, series in enumerate((temp, humidity, rain)):
+        valid = ~np.isnan(series)
+        sums = np.bincount(doy[valid], weights=series[valid], minlength=DAYS)
+        counts = np.bincount(doy[valid], minlength=DAYS).astype(np.float64)
+        if k < 2:
+            window_sums = _circular_window_sum(sums, MEAN_HALF_WINDOW, MEAN_HALF_WINDOW)
+            window_counts = _circular_window_sum(counts, MEAN_HALF_WINDOW, MEAN_HALF_WINDOW)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                normals[:, k] = window_sums / window_counts
+        else:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                daily_mean = np.where(counts > 0, sums / counts, np.nan)
+            if np.isnan(daily_mean).all():
+                continue
+            # Days with no observations take the cell's overall daily mean
+            daily_mean = np.where(np.isnan(daily_mean), np.nanmean(daily_mean), daily_mean)
+            half = RAIN_WINDOW // 2
+            normals[:, k] = _circular_window_sum(daily_mean, half, RAIN_WINDOW - half - 1)
+    return normals
+
+
+# -----------------------------
+# Archive storage
+# -----------------------------
+def cell_path(directory: str, cell: int) -> str:
+    return os.path.join(directory, "cells", f"{cell}.npz")
+
+
+def write_part(directory: str, cell: int, part: int, days: np.ndarray, temp: np.ndarray,
+               humidity: np.ndarray, rain: np.ndarray) -> None:
+    os.makedirs(os.path.join(directory, "cells"), exist_ok=True)
+    np.savez(os.path.join(directory, "cells", f"{cell}.part{part}.npz"),
+             date=days.astype(np.int32), temp=temp.astype(np.float32),
+             humidity=humidity.astype(np.float32), rain=rain.astype(np.float32))
+
+
+def compact_cell(directory: str, cell: int) -> int:
+    """Merge a cell's part files into its archive (newer rows win per date). Returns row count."""
+    parts = sorted(glob.glob(os.path.join(directory, "cells", f"{cell}.part*.npz")),
+                   key=lambda p: int(p.rsplit(".part", 1)[1].split(".")[0]))
+    existing = cell_path(directory, cell)
+    sources = ([existing] if os.path.exists(existing) else []) + parts
+    if not parts:
+        return 0
+    columns: Dict[str, list] = {"date": [], "temp": [], "humidity": [], "rain": []}
+    for source in sources:
+        with np.load(source) as data:
+            for name in columns:
+                columns[name].append(data[name])
+    merged = {name: np.concatenate(arrays) for name, arrays in columns.items()}
+    # Keep the last occurrence of each date: reverse, take first unique, restore order
+    reversed_dates = merged["date"][::-1]
+    _, first = np.unique(reversed_dates, return_index=True)
+    keep = len(reversed_dates) - 1 - first
+    merged = {name: values[keep] for name, values in merged.items()}
+    tmp = existing + ".tmp.npz"
+    np.savez_compressed(tmp, **merged)
+    os.replace(tmp, existing)
+    for part in parts:
+        os.remove(part)
+    return len(keep)
+
+
+def load_cell(directory: str, cell: int) -> Optional[Dict[str, np.ndarray]]:
+    path = cell_path(directory, cell)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def build_normals(directory: str, cells: Optional[Iterable[int]] = None) -> int:
+    """Recompute normals.npy from the per-cell archives, one cell at a time."""
+    spec = GridSpec.load(directory)
+    tmp_path = os.path.join(directory, ".normals.npy.tmp")
+    normals = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32,
+                                        shape=(spec.cells, DAYS, len(NORMAL_VARIABLES)))
+    normals[:] = np.nan
+    first_year, last_year, built = None, None, 0
+    for cell in (cells if cells is not None else range(spec.cells)):
+        series = load_cell(directory, cell)
+        if series is None or not len(series["date"]):
+            continue
+        normals[cell] = compute_normals(series["date"].astype(np.int64), series["temp"].astype(np.float64),
+                                        series["humidity"].astype(np.float64), series["rain"].astype(np.float64))
+        years = series["date"].astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64) + 1970
+        first_year = int(years.min()) if first_year is None else min(first_year, int(years.min()))
+        last_year = int(years.max()) if last_year is None else max(last_year, int(years.max()))
+        built += 1
+    normals.flush()
+    del normals
+    os.replace(tmp_path, os.path.join(directory, "normals.npy"))
+    with open(os.path.join(directory, "normals.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "variables": list(NORMAL_VARIABLES),
+            "mean_window_days": 2 * MEAN_HALF_WINDOW + 1,
+            "rain_window_days": RAIN_WINDOW,
+            "years": [first_year, last_year],
+            "cells_with_data": built,
+            "built_at": datetime.now(timezone.utc).isoformat(),
+        }, f)
+    return built
+
+
+# -----------------------------
+# Request-time lookups
+# -----------------------------
+class ClimateNormals:
+    """O(1) climatological defaults by location and day of year."""
+
+    def __init__(self, spec: GridSpec, normals: np.ndarray):
+        if normals.shape != (spec.cells, DAYS, len(NORMAL_VARIABLES)):
+            raise ValueError(f"❌ Climate normals shape {normals.shape} does not match grid.json")
+        self.spec = spec
+        self.normals = normals
+
+    @classmethod
+    def open(cls, directory: str = DEFAULT_ARCHIVE_DIR) -> "ClimateNormals":
+        return cls(GridSpec.load(directory), np.load(os.path.join(directory, "normals.npy"), mmap_mode="r"))
+
+    def lookup(self, lat: float, lon: float, on: Optional[date] = None) -> Optional[Dict[str, float]]:
+        """Normals for the grid cell nearest (lat, lon) on a date (default today), or None."""
+        cell = self.spec.nearest_cell(lat, lon)
+        if cell is None:
+            return None
+        on = on or date.today()
+        doy = on.timetuple().tm_yday - 1
+        if (on.year % 4 == 0 and (on.year % 100 != 0 or on.year % 400 == 0)) and doy >= 59:
+            doy -= 1
+        row = self.normals[cell, doy]
+        if np.isnan(row).all():
+            return None
+        return {name: float(row[k]) for k, name in enumerate(NORMAL_VARIABLES) if not np.isnan(row[k])}
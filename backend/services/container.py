@@ -0,0 +1,442 @@
+# services/container.py
+"""
+Service container created in the FastAPI lifespan.
+
+Each service is built once per process, on first use, from a registered
+provider. Providers receive the container, so services share what they
+depend on (one pooled HTTP session, one AlertService, ...). All providers
+are registered in this module, so the service graph lives in one place.
+Routes get services through the `get_*` dependencies below.
+
+Swapping in fakes:
+    app.state.service_overrides = {"weather": FakeWeather()}   # before startup
+    container.override("weather", FakeWeather())                # at runtime
+    app.dependency_overrides[get_weather_service] = FakeWeather # FastAPI-style
+"""
+import asyncio
+import inspect
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from fastapi import HTTPException, Request
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+Provider = Callable[["ServiceContainer"], Any]
+
+PROVIDERS: Dict[str, Provider] = {}
+
+
+def provider(name: str):
+    """Register the factory for a named service (last registration wins)."""
+    def decorator(func: Provider) -> Provider:
+        PROVIDERS[name] = func
+        return func
+    return decorator
+
+
+class ServiceContainer:
+    def __init__(self, providers: Optional[Dict[str, Provider]] = None,
+                 overrides: Optional[Dict[str, Any]] = None):
+        self._providers = dict(providers if providers is not None else PROVIDERS)
+        self._instances: Dict[str, Any] = dict(overrides or {})
+        self._order: List[str] = []
+        self._finalizers: List[Callable[[], Any]] = []
+        self._lock = threading.RLock()
+        self._async_locks: Dict[str, asyncio.Lock] = {}
+
+    def override(self, name: str, instance: Any) -> None:
+        with self._lock:
+            self._instances[name] = instance
+
+    def on_shutdown(self, finalizer: Callable[[], Any]) -> None:
+        """Run `finalizer` (sync or async) when the container shuts down."""
+        self._finalizers.append(finalizer)
+
+    def _provider(self, name: str) -> Provider:
+        if name not in self._providers:
+            raise KeyError(f"❌ No provider registered for service '{name}'")
+        return self._providers[name]
+
+    def get(self, name: str) -> Any:
+        """Build (once) and return a service synchronously."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                build = self._provider(name)
+                if inspect.iscoroutinefunction(build):
+                    raise RuntimeError(f"Service '{name}' needs async initialization; use aget()")
+                self._instances[name] = build(self)
+                self._order.append(name)
+                logger.info(f"Initialized service '{name}'")
+            return self._instances[name]
+
+    async def aget(self, name: str) -> Any:
+        """
+        Build (once) and return a service without blocking the event loop:
+        async providers are awaited, sync ones (model loads) run in a thread.
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        lock = self._async_locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            if name in self._instances:
+                return self._instances[name]
+            build = self._provider(name)
+            if inspect.iscoroutinefunction(build):
+                instance = await build(self)
+                with self._lock:
+                    self._instances[name] = instance
+                    self._order.append(name)
+                logger.info(f"Initialized service '{name}'")
+                return instance
+            return await asyncio.to_thread(self.get, name)
+
+    def optional(self, name: str) -> Optional[Any]:
+        """The service, or None (with a warning) if it cannot be built."""
+        try:
+            return self.get(name)
+        except Exception as e:
+            logger.warning(f"Service '{name}' unavailable: {e}")
+            return None
+
+    async def startup(self, eager: Optional[List[str]] = None) -> None:
+        """Build the listed services now instead of on the first request."""
+        for name in eager or []:
+            try:
+                await self.aget(name)
+            except Exception as e:
+                logger.warning(f"Eager init of '{name}' failed; will retry on first use: {e}")
+
+    async def shutdown(self) -> None:
+        for finalizer in reversed(self._finalizers):
+            try:
+                result = finalizer()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error during service shutdown: {e}")
+        self._finalizers.clear()
+        self._instances.clear()
+        self._order.clear()
+
+
+# -----------------------------
+# Providers
+# -----------------------------
+@provider("http")
+def _http_session(c: ServiceContainer) -> requests.Session:
+    pool_size = int(os.getenv("HTTP_POOL_SIZE", "32"))
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    c.on_shutdown(session.close)
+    return session
+
+
+@provider("weather_grid")
+def _weather_grid(c: ServiceContainer):
+    from services.weather_grid import DEFAULT_GRID_DIR, WeatherGridStore
+    return WeatherGridStore(os.getenv("WEATHER_GRID_DIR", DEFAULT_GRID_DIR),
+                            check_interval=float(os.getenv("WEATHER_GRID_CHECK_INTERVAL", "60")))
+
+
+@provider("weather")
+def _weather(c: ServiceContainer):
+    from services.weather_service import WeatherService
+    return WeatherService(session=c.get("http"), timeout=float(os.getenv("WEATHER_TIMEOUT", "10")),
+                          grid=c.optional("weather_grid"))
+
+
+@provider("alerts")
+def _alerts(c: ServiceContainer):
+    from services.alert_service import AlertService
+    return AlertService()
+
+
+@provider("climate")
+def _climate(c: ServiceContainer):
+    from services.climate_archive import DEFAULT_ARCHIVE_DIR, ClimateNormals
+    return ClimateNormals.open(os.getenv("CLIMATE_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR))
+
+
+@provider("alert_ledger")
+def _alert_ledger(c: ServiceContainer):
+    from services.alert_service import AlertLedger
+    from utils.firebase_config import COLLECTIONS, get_firestore_backend, get_firestore_client
+    from utils.firestore_writer import get_firestore_writer
+    # Shared through Firestore so every worker (and the next one after a recycle) sees what was sent
+    stored = get_firestore_backend() != "disabled"
+    return AlertLedger(max_farms=int(os.getenv("ALERT_LEDGER_MAX_FARMS", "100000")),
+                       writer=get_firestore_writer() if stored else None,
+                       client_factory=get_firestore_client if stored else None,
+                       collection=COLLECTIONS["alert_ledger"])
+
+
+@provider("ml")
+def _ml(c: ServiceContainer):
+    from services.ml_service import MLService
+    return MLService(climate=c.optional("climate"))
+
+
+@provider("soil")
+def _soil(c: ServiceContainer):
+    from services.soil_service import SoilService
+    return SoilService()
+
+
+@provider("market")
+def _market(c: ServiceContainer):
+    from services.market_service import MarketService
+    return MarketService()
+
+
+@provider("voice")
+def _voice(c: ServiceContainer):
+    from services.voice_service import VoiceService
+    return VoiceService()
+
+
+@provider("profiles")
+def _profiles(c: ServiceContainer):
+    from services.profile_service import FarmerProfileService
+    from utils.firebase_config import COLLECTIONS, get_firestore_backend, get_firestore_client
+    service = FarmerProfileService(get_firestore_client, COLLECTIONS["farmers"],
+                                   watch_all=os.getenv("PROFILE_WATCH_ALL", "0") == "1")
+    if get_firestore_backend() != "disabled":
+        service.start_listener()
+        c.on_shutdown(service.stop_listener)
+    return service
+
+
+@provider("sessions")
+async def _session_store(c: ServiceContainer):
+    from services.session_store import ChatInteractionPersistence, ChatSessionStore
+    from utils.firebase_config import COLLECTIONS, get_firestore_backend, get_firestore_client
+    from utils.firestore_writer import get_firestore_writer
+    stored = get_firestore_backend() != "disabled"
+    persistence = None
+    # Chat interactions are persisted to Firestore only when CHAT_PERSISTENCE=firestore
+    if os.getenv("CHAT_PERSISTENCE", "").lower() == "firestore":
+        if not stored:
+            logger.warning("CHAT_PERSISTENCE=firestore but no Firestore backend is configured")
+        else:
+            persistence = ChatInteractionPersistence(get_firestore_writer(), COLLECTIONS["chat_interactions"])
+    # With Firestore the session context is shared between workers
+    store = ChatSessionStore(
+        ttl_seconds=float(os.getenv("CHAT_SESSION_TTL", "1800")),
+        max_bytes=int(os.getenv("CHAT_SESSION_MAX_BYTES", str(32 * 1024 * 1024))),
+        persistence=persistence,
+        writer=get_firestore_writer() if stored else None,
+        client_factory=get_firestore_client if stored else None,
+        collection=COLLECTIONS["chat_sessions"],
+        purge_interval=float(os.getenv("CHAT_SESSION_PURGE_SECONDS", "300"))
+    )
+    await store.start()
+    c.on_shutdown(store.stop)
+    return store
+
+
+@provider("chatbot")
+async def _chatbot(c: ServiceContainer):
+    from services.chatbot_service import ChatbotService
+    from utils.content_catalog import get_catalog
+    catalog = get_catalog()
+    # Weather and ML are optional data sources; answer without them if unavailable
+    return ChatbotService(
+        weather_service=c.optional("weather"),
+        market_service=c.get("market"),
+        soil_service=c.get("soil"),
+        ml_service=c.optional("ml"),
+        # Fallback replies and follow-ups per category come from the content catalog
+        canned_responses=catalog.chatbot_responses,
+        follow_up_questions=catalog.follow_up_questions,
+        session_store=await c.aget("sessions"),
+        catalog=catalog
+    )
+
+
+@provider("sync")
+def _sync(c: ServiceContainer):
+    from services.sync_service import SyncCursorStore, SyncService
+    from utils.content_catalog import get_catalog
+    from utils.firebase_config import COLLECTIONS, get_firestore_backend, get_firestore_client
+    from utils.firestore_writer import get_firestore_writer
+    stored = get_firestore_backend() != "disabled"
+    # Weather is optional: a sync without it still carries prices and catalog changes
+    return SyncService(
+        market_service=c.get("market"),
+        alert_service=c.get("alerts"),
+        catalog=get_catalog(),
+        weather_service=c.optional("weather"),
+        cursors=SyncCursorStore(
+            max_users=int(os.getenv("SYNC_MAX_USERS", "100000")),
+            # Stored per user so any worker can continue a client's deltas
+            writer=get_firestore_writer() if stored else None,
+            client_factory=get_firestore_client if stored else None,
+            collection=COLLECTIONS["sync_cursors"]
+        ),
+        weather_timeout=float(os.getenv("SYNC_WEATHER_TIMEOUT", "5"))
+    )
+
+
+@provider("pest_learning")
+async def _pest_learning(c: ServiceContainer):
+    from services.pest_learning import DEFAULT_PEST_DIR, PestLearningService, PestModelRegistry, TrainingShardStore
+    from utils.content_catalog import get_catalog
+    directory = os.getenv("PEST_LEARNING_DIR", DEFAULT_PEST_DIR)
+    service = PestLearningService(
+        store=await asyncio.to_thread(TrainingShardStore, directory),
+        registry=await asyncio.to_thread(PestModelRegistry, directory),
+        labels=list(get_catalog().pests),
+        confidence_threshold=float(os.getenv("PEST_CONFIDENCE_THRESHOLD", "0.6")),
+        min_new_examples=int(os.getenv("PEST_TRAIN_MIN_NEW", "20")),
+        min_references=int(os.getenv("PEST_MIN_REFERENCES", "50")),
+        match_precision=float(os.getenv("PEST_MATCH_PRECISION", "0.95"))
+    )
+    await service.start(train_interval=float(os.getenv("PEST_TRAIN_INTERVAL", "600")))
+    c.on_shutdown(service.stop)
+    return service
+
+
+@provider("feedback")
+async def _feedback(c: ServiceContainer):
+    from services.feedback_service import FeedbackService
+    from utils.firebase_config import COLLECTIONS, get_firestore_backend, get_firestore_client
+    from utils.firestore_writer import get_firestore_writer
+    stored = get_firestore_backend() != "disabled"
+    service = FeedbackService(
+        writer=get_firestore_writer() if stored else None,
+        client_factory=get_firestore_client if stored else None,
+        collection=COLLECTIONS["feedback"],
+        stats_collection=COLLECTIONS["feedback_stats"],
+        farmers_collection=COLLECTIONS["feedback_farmers"],
+        max_queue=int(os.getenv("FEEDBACK_QUEUE_SIZE", "50000")),
+        flush_interval=float(os.getenv("FEEDBACK_FLUSH_SECONDS", "30"))
+    )
+    await service.start()
+    c.on_shutdown(service.stop)
+    return service
+
+
+@provider("analytics")
+async def _analytics(c: ServiceContainer):
+    from services.analytics_service import UsageAggregator
+    from utils.firebase_config import COLLECTIONS, get_firestore_backend, get_firestore_client
+    from utils.firestore_writer import get_firestore_writer
+    stored = get_firestore_backend() != "disabled"
+    aggregator = UsageAggregator(
+        writer=get_firestore_writer() if stored else None,
+        client_factory=get_firestore_client if stored else None,
+        collection=COLLECTIONS["analytics"],
+        farmer_collection=COLLECTIONS["farmer_analytics"],
+        bucket_seconds=int(os.getenv("ANALYTICS_BUCKET_SECONDS", "3600")),
+        flush_interval=float(os.getenv("ANALYTICS_FLUSH_SECONDS", "60")),
+        session_gap=float(os.getenv("ANALYTICS_SESSION_GAP", "1800"))
+    )
+    await aggregator.start()
+    # Runs before the writer stops (lifespan), so the final rollups are flushed
+    c.on_shutdown(aggregator.stop)
+    return aggregator
+
+
+@provider("devices")
+def _devices(c: ServiceContainer):
+    from services.notification_service import DeviceRegistry
+    from utils.firebase_config import COLLECTIONS, get_firestore_backend, get_firestore_client
+    if get_firestore_backend() == "disabled":
+        # Registrations then live only in this worker's memory
+        return DeviceRegistry()
+    registry = DeviceRegistry(get_firestore_client, COLLECTIONS["devices"])
+    registry.load()
+    registry.start_listener()
+    c.on_shutdown(registry.stop_listener)
+    return registry
+
+
+@provider("audience")
+def _audience(c: ServiceContainer):
+    from services.audience_index import AudienceIndex
+    from utils.firebase_config import COLLECTIONS, get_firestore_backend, get_firestore_client
+    if get_firestore_backend() == "disabled":
+        return AudienceIndex()
+    index = AudienceIndex(get_firestore_client, COLLECTIONS["farmers"])
+    index.start_listener()   # before the full load, so no change is missed in between
+    c.on_shutdown(index.stop_listener)
+    index.load()
+    return index
+
+
+def _notification_transport():
+    from services.notification_service import FCMTransport, StubTransport
+    from utils.firebase_config import get_firestore_backend
+    name = os.getenv("NOTIFICATION_TRANSPORT") or ("fcm" if get_firestore_backend() == "firebase" else "stub")
+    if name == "fcm":
+        return FCMTransport()
+    return StubTransport(latency=float(os.getenv("NOTIFICATION_STUB_LATENCY", "0")))
+
+
+@provider("notifications")
+async def _notifications(c: ServiceContainer):
+    from services.notification_service import NotificationDispatcher, UserRateLimiter
+    from utils.firebase_config import COLLECTIONS
+    from utils.firestore_writer import get_firestore_writer
+    dispatcher = NotificationDispatcher(
+        registry=await c.aget("devices"),
+        transport=await asyncio.to_thread(_notification_transport),
+        concurrency=int(os.getenv("NOTIFICATION_CONCURRENCY", "8")),
+        rate_limiter=UserRateLimiter(per_hour=float(os.getenv("NOTIFICATION_RATE_PER_HOUR", "6")),
+                                     burst=int(os.getenv("NOTIFICATION_BURST", "6"))),
+        max_attempts=int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5")),
+        writer=get_firestore_writer(),
+        collection=COLLECTIONS["notifications"],
+        audience=await c.aget("audience")
+    )
+    await dispatcher.start()
+    c.on_shutdown(dispatcher.stop)
+    return dispatcher
+
+
+# -----------------------------
+# FastAPI dependencies
+# -----------------------------
+def get_container(request: Request) -> ServiceContainer:
+    return request.app.state.container
+
+
+def _dependency(name: str):
+    async def dependency(request: Request):
+        try:
+            return await get_container(request).aget(name)
+        except Exception as e:
+            logger.error(f"Service '{name}' unavailable: {e}")
+            raise HTTPException(status_code=503, detail=f"{name} service unavailable")
+    dependency.__name__ = f"get_{name}_service"
+    return dependency
+
+
+get_weather_service = _dependency("weather")
+get_alert_service = _dependency("alerts")
+get_alert_ledger = _dependency("alert_ledger")
+get_ml_service = _dependency("ml")
+get_soil_service = _dependency("soil")
+get_market_service = _dependency("market")
+get_voice_service = _dependency("voice")
+get_profile_service = _dependency("profiles")
+get_chatbot_service = _dependency("chatbot")
+get_session_store = _dependency("sessions")
+get_sync_service = _dependency("sync")
+get_device_registry = _dependency("devices")
+get_audience_index = _dependency("audience")
+get_notification_dispatcher = _dependency("notifications")
+get_analytics_service = _dependency("analytics")
+get_feedback_service = _dependency("feedback")
+get_pest_learning_service = _dependency("pest_learning")
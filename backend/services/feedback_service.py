@@ -0,0 +1,338 @@
+# services/feedback_service.py
+"""
+Farmer feedback ingestion and per-category rating rollups.
+
+POST /feedback only validates and drops the item on an in-process queue,
+so a burst of ratings after an advisory broadcast costs the API nothing
+but a queue append. A background consumer drains the queue in batches:
+
+- each feedback document is handed to the Firestore write-behind writer
+  (`feedback` collection), which commits in batches
+- per FeedbackCategory and UTC day, the worker keeps a 1-5 rating
+  histogram, would-recommend counts and hourly (sum, count) pairs, and
+  periodically rewrites them as its own shard document
+  (`feedback_stats/<day>:<shard>`)
+- per farmer and UTC day, it keeps a (rating sum, count) pair, written
+  the same way (`feedback_farmers/<user_id>:<day>:<shard>`)
+
+The dashboard summary merges the shard documents of the window - no
+feedback documents are read - and derives averages, histograms and
+rolling 24h / 7d / 30d averages from them. A farmer's satisfaction score
+likewise sums that farmer's per-day pairs over the window.
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from models.farmer_models import FeedbackCategory, FeedbackData
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ROLLING_WINDOWS = {"24h": 24, "7d": 24 * 7, "30d": 24 * 30}
+
+
+def _day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+@dataclass(slots=True)
+class CategoryStats:
+    histogram: List[int] = field(default_factory=lambda: [0] * 5)
+    recommend_yes: int = 0
+    recommend_no: int = 0
+    hourly: Dict[int, List[float]] = field(default_factory=dict)   # hour start -> [rating sum, count]
+
+    def add(self, rating: int, would_recommend: Optional[bool], ts: float) -> None:
+        self.histogram[rating - 1] += 1
+        if would_recommend is not None:
+            if would_recommend:
+                self.recommend_yes += 1
+            else:
+                self.recommend_no += 1
+        hour = self.hourly.setdefault(int(ts // 3600) * 3600, [0.0, 0])
+        hour[0] += rating
+        hour[1] += 1
+
+    def merge(self, other: "CategoryStats") -> "CategoryStats":
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.recommend_yes += other.recommend_yes
+        self.recommend_no += other.recommend_no
+        for hour, (total, count) in other.hourly.items():
+            entry = self.hourly.setdefault(hour, [0.0, 0])
+            entry[0] += total
+            entry[1] += count
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Firestore map keys must be strings
+        return {"histogram": list(self.histogram), "recommend_yes": self.recommend_yes,
+                "recommend_no": self.recommend_no,
+                "hourly": {str(h): [s, c] for h, (s, c) in self.hourly.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CategoryStats":
+        return cls(histogram=[int(v) for v in data.get("histogram", [0] * 5)],
+                   recommend_yes=int(data.get("recommend_yes", 0)), recommend_no=int(data.get("recommend_no", 0)),
+                   hourly={int(h): [float(v[0]), int(v[1])] for h, v in (data.get("hourly") or {}).items()})
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        count = sum(self.histogram)
+        rolling = {}
+        for name, hours in ROLLING_WINDOWS.items():
+            since = now - hours * 3600
+            total = sum(s for h, (s, c) in self.hourly.items() if h + 3600 > since)
+            n = sum(c for h, (s, c) in self.hourly.items() if h + 3600 > since)
+            rolling[name] = round(total / n, 2) if n else None
+        answered = self.recommend_yes + self.recommend_no
+        return {
+            "count": count,
+            "average": round(sum((i + 1) * n for i, n in enumerate(self.histogram)) / count, 2) if count else None,
+            "histogram": {str(i + 1): n for i, n in enumerate(self.histogram)},
+            "rolling_average": rolling,
+            "would_recommend_rate": round(self.recommend_yes / answered, 3) if answered else None,
+        }
+
+
+class FeedbackService:
+    def __init__(self, writer=None, client_factory: Optional[Callable[[], Any]] = None,
+                 collection: str = "feedback", stats_collection: str = "feedback_stats",
+                 farmers_collection: str = "feedback_farmers",
+                 max_queue: int = 50_000, batch_size: int = 500, flush_interval: float = 30.0,
+                 retention_days: int = 30, shard: Optional[str] = None):
+        self.writer = writer
+        self._client_factory = client_factory
+        self._client = None
+        self.collection = collection
+        self.stats_collection = stats_collection
+        self.farmers_collection = farmers_collection
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.shard = shard or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._days: Dict[str, Dict[str, CategoryStats]] = {}
+        self._dirty: set = set()
+        self._farmers: Dict[str, Dict[str, List[float]]] = {}   # day -> user_id -> [rating sum, count]
+        self._dirty_farmers: set = set()                        # (day, user_id)
+        self._lock = threading.Lock()
+        self._cache = TTLCache(maxsize=64, ttl=flush_interval, name="feedback_summary")
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped_writes = 0
+
+    @property
+    def client(self):
+        if self._client is None and self._client_factory is not None:
+            self._client = self._client_factory()
+        return self._client
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    # -----------------------------
+    # Ingestion
+    # -----------------------------
+    def submit(self, user_id: str, feedback: FeedbackData) -> bool:
+        """Queue feedback for the consumer; False if the queue is full. Never waits."""
+        if self._queue is None:
+            raise RuntimeError("Feedback service is not running")
+        try:
+            self._queue.put_nowait((user_id, feedback, time.time()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Whatever is still queued is written before the writer shuts down
+        while self._queue is not None and not self._queue.empty():
+            self._consume(self._take_batch())
+        self.flush()
+
+    def _take_batch(self) -> List[Tuple[str, FeedbackData, float]]:
+        batch = []
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=max(next_flush - time.monotonic(), 0.01))
+                batch = [first] + self._take_batch()
+                self._consume(batch)
+            except asyncio.TimeoutError:
+                pass
+            except Exception as e:
+                logger.error(f"Feedback batch failed: {e}")
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self.flush_interval
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Feedback stats flush failed: {e}")
+            # Yield between batches so a backlog never monopolizes the event loop
+            await asyncio.sleep(0)
+
+    def _consume(self, batch: List[Tuple[str, FeedbackData, float]]) -> None:
+        with self._lock:
+            for user_id, feedback, ts in batch:
+                day = _day(ts)
+                stats = self._days.setdefault(day, {})
+                category = feedback.category.value
+                if category not in stats:
+                    stats[category] = CategoryStats()
+                stats[category].add(feedback.rating, feedback.would_recommend, ts)
+                self._dirty.add(day)
+                farmer = self._farmers.setdefault(day, {}).setdefault(user_id, [0.0, 0])
+                farmer[0] += feedback.rating
+                farmer[1] += 1
+                self._dirty_farmers.add((day, user_id))
+        if self.writer is None:
+            return
+        for user_id, feedback, ts in batch:
+            doc = {**feedback.model_dump(mode="json"), "user_id": user_id,
+                   "created_at": datetime.fromtimestamp(ts, tz=timezone.utc)}
+            if not self.writer.write_nowait(self.collection, doc):
+                self.dropped_writes += 1
+
+    def flush(self, now: Optional[float] = None) -> int:
+        """Write changed per-day shard documents; forget days that can no longer change."""
+        now = time.time() if now is None else now
+        today = _day(now)
+        with self._lock:
+            docs = [(day, {c: s.to_dict() for c, s in self._days[day].items()}) for day in self._dirty]
+            farmer_docs = [(day, user_id, list(self._farmers[day][user_id])) for day, user_id in self._dirty_farmers]
+            self._dirty.clear()
+            self._dirty_farmers.clear()
+        written = 0
+        if self.writer is not None:
+            updated_at = datetime.now(timezone.utc)
+            failed = set()
+            for day, categories in docs:
+                doc = {"day": day, "shard": self.shard, "categories": categories, "updated_at": updated_at}
+                if self.writer.write_nowait(self.stats_collection, doc, doc_id=f"{day}:{self.shard}"):
+                    written += 1
+                else:
+                    failed.add(day)
+            failed_farmers = set()
+            for day, user_id, (total, count) in farmer_docs:
+                # farmer_day is the one field a farmer's window is read by (a single-field range query)
+                doc = {"user_id": user_id, "day": day, "farmer_day": f"{user_id}:{day}", "shard": self.shard,
+                       "sum": total, "count": count, "updated_at": updated_at}
+                if self.writer.write_nowait(self.farmers_collection, doc, doc_id=f"{user_id}:{day}:{self.shard}"):
+                    written += 1
+                else:
+                    failed_farmers.add((day, user_id))
+            with self._lock:
+                self._dirty |= failed
+                self._dirty_farmers |= failed_farmers
+        oldest = _day(now - (self.retention_days - 1) * 86400)
+        with self._lock:
+            dirty_farmer_days = {day for day, _ in self._dirty_farmers}
+            for days, dirty in ((self._days, self._dirty), (self._farmers, dirty_farmer_days)):
+                for day in list(days):
+                    stored = self.writer is not None and day < today and day not in dirty
+                    if stored or day < oldest:
+                        del days[day]
+            self._dirty_farmers = {(day, u) for day, u in self._dirty_farmers if day in self._farmers}
+        return written
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    def _stored(self, since: str) -> List[Dict[str, Any]]:
+        if self.client is None:
+            return []
+        source = self.client.collection(self.stats_collection)
+        if hasattr(source, "where"):
+            return [s.to_dict() for s in source.where("day", ">=", since).stream()]
+        return [d for d in (s.to_dict() for s in source.stream()) if d and d.get("day", "") >= since]
+
+    def summary(self, days: int = 30, now: Optional[float] = None) -> Dict[str, Any]:
+        """Per-category histograms, averages and rolling averages over the last `days` days."""
+        now = time.time() if now is None else now
+        since = _day(now - (days - 1) * 86400)
+        cached = self._cache.get(since)
+        if cached is not None:
+            return cached
+        with self._lock:
+            local = {day: {c: s.to_dict() for c, s in stats.items()}
+                     for day, stats in self._days.items() if day >= since}
+        shards = list(local.values())
+        for doc in self._stored(since):
+            # This worker's in-memory days are newer than its stored documents
+            if doc.get("shard") != self.shard or doc.get("day") not in local:
+                shards.append(doc.get("categories") or {})
+
+        merged: Dict[str, CategoryStats] = {}
+        for categories in shards:
+            for category, data in categories.items():
+                stats = CategoryStats.from_dict(data)
+                if category in merged:
+                    merged[category].merge(stats)
+                else:
+                    merged[category] = stats
+        overall = CategoryStats()
+        for stats in merged.values():
+            overall.merge(CategoryStats.from_dict(stats.to_dict()))
+
+        result = {
+            "since": since,
+            "overall": overall.summary(now),
+            "categories": {c.value: merged[c.value].summary(now) if c.value in merged else CategoryStats().summary(now)
+                           for c in FeedbackCategory},
+        }
+        self._cache.set(since, result)
+        return result
+
+    def farmer_satisfaction(self, user_id: str, days: int = 30, now: Optional[float] = None) -> Optional[float]:
+        """Average rating of one farmer's feedback over the last `days` days, or None."""
+        now = time.time() if now is None else now
+        since = _day(now - (days - 1) * 86400)
+        with self._lock:
+            local = {day: tuple(users[user_id]) for day, users in self._farmers.items()
+                     if day >= since and user_id in users}
+        pairs = list(local.values())
+        if self.client is not None:
+            source = self.client.collection(self.farmers_collection)
+            if hasattr(source, "where"):
+                query = (source.where("farmer_day", ">=", f"{user_id}:{since}")
+                         .where("farmer_day", "<", f"{user_id};"))
+                stored = [s.to_dict() for s in query.stream()]
+            else:
+                stored = [d for d in (s.to_dict() for s in source.stream())
+                          if d and d.get("user_id") == user_id and d.get("day", "") >= since]
+            for doc in stored:
+                # This worker's in-memory days are newer than its stored documents
+                if doc.get("shard") != self.shard or doc.get("day") not in local:
+                    pairs.append((doc.get("sum", 0), doc.get("count", 0)))
+        total = sum(p[0] for p in pairs)
+        count = sum(p[1] for p in pairs)
+        return round(total / count, 2) if count else None
@@ -1,8 +1,14 @@
 import logging
-from typing import Dict
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# When the mock prices were published (epoch ms); identical in every worker
+MOCK_PRICES_AS_OF = 1_767_225_600_000   # 2026-01-01T00:00:00Z
+
+
 class MarketService:
     def __init__(self):
         # 📊 Mock market data (Ludhiana only for now)
@@ -12,6 +18,34 @@ class MarketService:
             "maize": {"mandi": "Ludhiana", "min_price": 1600, "max_price": 2000},
             "cotton": {"mandi": "Ludhiana", "min_price": 5200, "max_price": 6200},
         }
+        # Each price carries the time it was published (epoch ms), so sync
+        # clients can ask for "what changed since T" without diffing prices.
+        # Being data rather than a counter, it means the same in every worker.
+        self._changed_at: Dict[str, int] = {crop: MOCK_PRICES_AS_OF for crop in self.mock_data}
+        self._lock = threading.Lock()
+
+    @property
+    def latest(self) -> int:
+        return max(self._changed_at.values(), default=0)
+
+    def update_price(self, crop_name: str, min_price: int, max_price: int,
+                     mandi: Optional[str] = None) -> int:
+        """Record a new price range for a crop; returns its publication time (epoch ms)."""
+        crop = crop_name.lower()
+        with self._lock:
+            current = self.mock_data.get(crop, {"mandi": mandi or "Ludhiana"})
+            self.mock_data[crop] = {"mandi": mandi or current["mandi"],
+                                    "min_price": min_price, "max_price": max_price}
+            # Strictly after every earlier change, so a cursor taken before it never skips it
+            self._changed_at[crop] = max(int(time.time() * 1000), self.latest + 1)
+            return self._changed_at[crop]
+
+    def changed_since(self, since: int, crops: Optional[Iterable[str]] = None) -> Tuple[int, list]:
+        """Latest publication time, and the crops (optionally limited to `crops`) published after `since`."""
+        with self._lock:
+            wanted = {c.lower() for c in crops} if crops is not None else self._changed_at.keys()
+            changed = [c for c in wanted if self._changed_at.get(c, 0) > since]
+            return self.latest, sorted(changed)
 
     async def get_crop_prices(self, crop_name: str) -> Dict:
         crop = crop_name.lower()
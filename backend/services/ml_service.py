@@ -1,30 +1,62 @@
 # services/ml_service.py
 import os
 import joblib
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Optional
 from models.farmer_models import SoilData
+from utils.metrics import ML_INFERENCE_SECONDS
+
+CROP_MODEL_PATH = os.path.join("models", "crop_model.pkl")
+
+
+@lru_cache(maxsize=None)
+def _load_model(model_path: str):
+    if not os.path.exists(model_path):
+        raise FileNotFoundError("❌ Crop model not found. Run train_crop_model.py first.")
+    return joblib.load(model_path)
+
+
+def load_crop_model(model_path: str = CROP_MODEL_PATH):
+    """Load the model once per process; forked workers share the preloaded copy."""
+    return _load_model(os.path.abspath(model_path))
+
+
+# Used when neither the request nor the climate normals provide a value
+DEFAULT_CLIMATE = {"temperature": 25.0, "humidity": 60.0, "rainfall": 100.0}
+
 
 class MLService:
-    def __init__(self):
-        # Path to trained model
-        model_path = os.path.join("models", "crop_model.pkl")
-        if not os.path.exists(model_path):
-            raise FileNotFoundError("❌ Crop model not found. Run train_crop_model.py first.")
-        self.crop_model = joblib.load(model_path)
-
-    def _normalize_input(self, soil_data: SoilData):
+    def __init__(self, model_path: str = CROP_MODEL_PATH, climate=None):
+        self.crop_model = load_crop_model(model_path)
+        # Optional ClimateNormals: seasonal, location-specific defaults
+        self.climate = climate
+
+    def _climate_defaults(self, soil_data: SoilData, on: Optional[date] = None) -> Dict[str, float]:
+        location = soil_data.location or {}
+        lat = location.get("lat")
+        lon = location.get("lng", location.get("lon"))
+        if self.climate is None or lat is None or lon is None:
+            return DEFAULT_CLIMATE
+        normals = self.climate.lookup(lat, lon, on)
+        return {**DEFAULT_CLIMATE, **normals} if normals else DEFAULT_CLIMATE
+
+    def _normalize_input(self, soil_data: SoilData, on: Optional[date] = None):
         """
         Normalize soil data into the 7 features required by the ML model:
         [Nitrogen, Phosphorus, Potassium, Temperature, Humidity, pH, Rainfall]
-        If fields are missing, safe defaults are used.
+        Missing weather fields come from the climate normals for the sample's
+        location and date when available, else fixed defaults.
         """
+        climate = self._climate_defaults(soil_data, on)
         return [[
             soil_data.nitrogen,
             soil_data.phosphorus,
             soil_data.potassium,
-            soil_data.temperature or 25,       # default 25°C
-            soil_data.humidity or 60,          # default 60%
+            soil_data.temperature if soil_data.temperature is not None else climate["temperature"],
+            soil_data.humidity if soil_data.humidity is not None else climate["humidity"],
             soil_data.ph or soil_data.ph_level or 6.5,  # default pH
-            soil_data.rainfall or 100          # default 100 mm
+            soil_data.rainfall if soil_data.rainfall is not None else climate["rainfall"]
         ]]
 
     def predict_crop(self, soil_data: SoilData):
@@ -33,7 +65,22 @@ class MLService:
         """
         try:
             features = self._normalize_input(soil_data)
-            prediction = self.crop_model.predict(features)
+            with ML_INFERENCE_SECONDS.time("crop_model"):
+                prediction = self.crop_model.predict(features)
             return {"recommended_crop": str(prediction[0])}
         except Exception as e:
-            raise RuntimeError(f"❌ Crop prediction failed: {str(e)}")
\ No newline at end of file
+            raise RuntimeError(f"❌ Crop prediction failed: {str(e)}")
+
+    def predict_crops(self, soil_data_list: List[SoilData]) -> List[Dict[str, str]]:
+        """
+        Predict crops for many soil samples in one model call (batch jobs).
+        """
+        if not soil_data_list:
+            return []
+        try:
+            features = [self._normalize_input(soil_data)[0] for soil_data in soil_data_list]
+            with ML_INFERENCE_SECONDS.time("crop_model_batch"):
+                predictions = self.crop_model.predict(features)
+            return [{"recommended_crop": str(p)} for p in predictions]
+        except Exception as e:
+            raise RuntimeError(f"❌ Batch crop prediction failed: {str(e)}")
\ No newline at end of file
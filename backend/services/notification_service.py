@@ -0,0 +1,592 @@
+# services/notification_service.py
+"""
+Push notification dispatch.
+
+- DeviceRegistry: device tokens per user (with quiet hours), persisted in
+  the `devices` collection and kept in sync across workers by a
+  snapshot listener.
+- NotificationDispatcher: submit() only queues a job and returns, so API
+  workers never wait on a broadcast. A background task expands each job
+  into per-device batches (up to 500 tokens, the FCM multicast limit),
+  applying expiry, per-user rate limits and quiet hours. Sender tasks
+  drain a priority queue ordered by priority and NotificationType, so a
+  district weather alert overtakes queued tips and market updates.
+- Targeting: target_crops / target_regions are resolved through the
+  AudienceIndex (services/audience_index.py) rather than by reading
+  profiles.
+- Transports: FCMTransport (firebase_admin.messaging) or StubTransport for
+  local runs and load tests. Transient failures are retried with
+  exponential backoff and jitter; unregistered tokens are removed.
+
+Urgent weather alerts (priority "high" or "critical") bypass quiet hours
+and rate limits.
+"""
+import asyncio
+import hashlib
+import itertools
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from models.farmer_models import NotificationData, NotificationType
+from utils.metrics import NOTIFICATION_BATCH_SECONDS, NOTIFICATIONS
+
+logger = logging.getLogger(__name__)
+
+MULTICAST_LIMIT = 500
+
+PRIORITY_RANK = {"critical": 0, "high": 0, "medium": 1, "low": 2}
+TYPE_RANK = {
+    NotificationType.WEATHER_ALERT: 0,
+    NotificationType.PEST_WARNING: 1,
+    NotificationType.MARKET_UPDATE: 2,
+    NotificationType.FERTILIZER_REMINDER: 3,
+    NotificationType.GENERAL_TIP: 4,
+}
+
+
+def _is_urgent(notification: NotificationData) -> bool:
+    return notification.type == NotificationType.WEATHER_ALERT and PRIORITY_RANK.get(notification.priority, 1) == 0
+
+
+def _minutes(hhmm: Optional[str]) -> Optional[int]:
+    if not hhmm:
+        return None
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+# -----------------------------
+# Device registry
+# -----------------------------
+@dataclass(slots=True)
+class Device:
+    token: str
+    user_id: str
+    platform: str = "android"
+    quiet_start: Optional[int] = None   # minutes after local midnight
+    quiet_end: Optional[int] = None
+    tz_offset: int = 330                # minutes east of UTC
+
+    def quiet_remaining(self, now: float) -> float:
+        """Seconds until quiet hours end, or 0 if not in quiet hours."""
+        if self.quiet_start is None or self.quiet_end is None or self.quiet_start == self.quiet_end:
+            return 0.0
+        local = ((now / 60.0) + self.tz_offset) % 1440
+        start, end = self.quiet_start, self.quiet_end
+        inside = start <= local < end if start < end else (local >= start or local < end)
+        if not inside:
+            return 0.0
+        return ((end - local) % 1440) * 60.0
+
+
+def _doc_id(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:40]
+
+
+class DeviceRegistry:
+    def __init__(self, client_factory: Optional[Callable[[], Any]] = None, collection: str = "devices"):
+        self._client_factory = client_factory
+        self._client = None
+        self.collection = collection
+        self._devices: Dict[str, Device] = {}
+        self._by_user: Dict[str, Dict[str, None]] = {}
+        self._by_doc: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._watch = None
+
+    @property
+    def client(self):
+        if self._client is None and self._client_factory is not None:
+            self._client = self._client_factory()
+        return self._client
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def _put(self, device: Device) -> None:
+        with self._lock:
+            previous = self._devices.get(device.token)
+            if previous is not None and previous.user_id != device.user_id:
+                self._by_user.get(previous.user_id, {}).pop(device.token, None)
+            self._devices[device.token] = device
+            self._by_user.setdefault(device.user_id, {})[device.token] = None
+            self._by_doc[_doc_id(device.token)] = device.token
+
+    def _drop(self, token: str) -> Optional[Device]:
+        with self._lock:
+            device = self._devices.pop(token, None)
+            if device is not None:
+                self._by_doc.pop(_doc_id(token), None)
+                tokens = self._by_user.get(device.user_id, {})
+                tokens.pop(token, None)
+                if not tokens:
+                    self._by_user.pop(device.user_id, None)
+            return device
+
+    @staticmethod
+    def _from_doc(data: Dict[str, Any]) -> Device:
+        return Device(token=data["token"], user_id=data["user_id"], platform=data.get("platform", "android"),
+                      quiet_start=data.get("quiet_start"), quiet_end=data.get("quiet_end"),
+                      tz_offset=data.get("tz_offset", 330))
+
+    def register(self, user_id: str, token: str, platform: str = "android",
+                 quiet_hours: Tuple[Optional[str], Optional[str]] = (None, None),
+                 tz_offset_minutes: int = 330) -> Device:
+        device = Device(token, user_id, platform, _minutes(quiet_hours[0]), _minutes(quiet_hours[1]),
+                        tz_offset_minutes)
+        self._put(device)
+        if self.client is not None:
+            self.client.collection(self.collection).document(_doc_id(token)).set({
+                "token": token, "user_id": user_id, "platform": platform,
+                "quiet_start": device.quiet_start, "quiet_end": device.quiet_end,
+                "tz_offset": tz_offset_minutes, "updated_at": datetime.now(timezone.utc),
+            })
+        return device
+
+    def unregister(self, token: str, user_id: Optional[str] = None) -> bool:
+        device = self._devices.get(token)
+        if device is None or (user_id is not None and device.user_id != user_id):
+            return False
+        self._drop(token)
+        if self.client is not None:
+            self.client.collection(self.collection).document(_doc_id(token)).delete()
+        return True
+
+    def tokens_for(self, user_id: str) -> List[str]:
+        return list(self._by_user.get(user_id, ()))
+
+    def device(self, token: str) -> Optional[Device]:
+        return self._devices.get(token)
+
+    def users(self) -> List[str]:
+        return list(self._by_user)
+
+    def load(self) -> int:
+        """Read every registered device (run once at startup)."""
+        if self.client is None:
+            return 0
+        for snapshot in self.client.collection(self.collection).stream():
+            data = snapshot.to_dict()
+            if data and data.get("token") and data.get("user_id"):
+                self._put(self._from_doc(data))
+        logger.info(f"Loaded {len(self._devices)} notification devices")
+        return len(self._devices)
+
+    def _on_snapshot(self, docs, changes, read_time) -> None:
+        for change in changes:
+            data = change.document.to_dict()
+            if change.type.name == "REMOVED" or not data:
+                # REMOVED snapshots may carry no data; find the token by document id
+                token = self._by_doc.get(change.document.id)
+                if token:
+                    self._drop(token)
+            elif data.get("token") and data.get("user_id"):
+                self._put(self._from_doc(data))
+
+    def start_listener(self) -> None:
+        if self._watch is None and self.client is not None:
+            self._watch = self.client.collection(self.collection).on_snapshot(self._on_snapshot)
+            logger.info(f"Listening for changes on '{self.collection}'")
+
+    def stop_listener(self) -> None:
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+
+# -----------------------------
+# Rate limiting
+# -----------------------------
+class UserRateLimiter:
+    """Token bucket per user: `burst` notifications, refilled at `per_hour`."""
+
+    def __init__(self, per_hour: float = 6.0, burst: int = 6, max_users: int = 500_000):
+        self.rate = per_hour / 3600.0
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def allow(self, user_id: str, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.get(user_id, (float(self.burst), now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1.0
+        self._buckets[user_id] = (tokens - 1.0 if allowed else tokens, now)
+        self._buckets.move_to_end(user_id)
+        if len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return allowed
+
+
+# -----------------------------
+# Transports
+# -----------------------------
+class SendResult(NamedTuple):
+    sent: int
+    retry: List[str]      # transient failures, worth retrying
+    invalid: List[str]    # unregistered / mismatched tokens, to be removed
+
+
+class StubTransport:
+    """Records multicasts instead of sending them (dev, tests, load runs)."""
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, keep: int = 1000):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent: List[Tuple[Dict[str, Any], int]] = []
+        self.keep = keep
+        self.calls = 0
+
+    def send_multicast(self, message: Dict[str, Any], tokens: List[str]) -> SendResult:
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        retry = [t for t in tokens if self.failure_rate and random.random() < self.failure_rate]
+        if len(self.sent) < self.keep:
+            self.sent.append((message, len(tokens) - len(retry)))
+        return SendResult(len(tokens) - len(retry), retry, [])
+
+
+class FCMTransport:
+    """Firebase Cloud Messaging multicast (one HTTP call per 500 tokens)."""
+    name = "fcm"
+
+    def __init__(self):
+        from firebase_admin import messaging
+        from utils.firebase_config import init_firebase
+        init_firebase()
+        self.messaging = messaging
+
+    def send_multicast(self, message: Dict[str, Any], tokens: List[str]) -> SendResult:
+        messaging = self.messaging
+        multicast = messaging.MulticastMessage(
+            tokens=tokens,
+            notification=messaging.Notification(title=message["title"], body=message["body"]),
+            data={k: str(v) for k, v in message.get("data", {}).items()},
+            android=messaging.AndroidConfig(priority="high" if message.get("urgent") else "normal",
+                                            ttl=message.get("ttl")),
+        )
+        response = messaging.send_each_for_multicast(multicast)
+        retry, invalid = [], []
+        for token, result in zip(tokens, response.responses):
+            if result.success:
+                continue
+            if isinstance(result.exception, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+                invalid.append(token)
+            else:
+                retry.append(token)
+        return SendResult(response.success_count, retry, invalid)
+
+
+# -----------------------------
+# Dispatcher
+# -----------------------------
+@dataclass(slots=True)
+class NotificationJob:
+    job_id: str
+    notification: NotificationData
+    user_ids: Optional[List[str]]
+    created_at: float = field(default_factory=time.time)
+    status: str = "queued"
+    recipients: int = 0
+    devices: int = 0
+    sent: int = 0
+    failed: int = 0
+    deferred: int = 0
+    rate_limited: int = 0
+    expired: int = 0
+    outstanding: int = 0
+    on_done: Optional[Callable[["NotificationJob"], None]] = None   # called once every batch is settled (or failed)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id, "type": self.notification.type.value, "priority": self.notification.priority,
+            "status": self.status, "recipients": self.recipients, "devices": self.devices, "sent": self.sent,
+            "failed": self.failed, "deferred": self.deferred, "rate_limited": self.rate_limited,
+            "expired": self.expired,
+            "created_at": datetime.fromtimestamp(self.created_at, tz=timezone.utc).isoformat(),
+        }
+
+
+@dataclass(slots=True)
+class _Batch:
+    job: NotificationJob
+    tokens: List[str]
+    attempt: int = 0
+
+
+class NotificationDispatcher:
+    def __init__(self, registry: DeviceRegistry, transport, concurrency: int = 8,
+                 rate_limiter: Optional[UserRateLimiter] = None, max_attempts: int = 5,
+                 backoff_base: float = 2.0, backoff_max: float = 300.0,
+                 writer=None, collection: str = "notifications", max_jobs: int = 1000,
+                 audience=None):
+        self.registry = registry
+        self.audience = audience
+        self.transport = transport
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter or UserRateLimiter()
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.writer = writer
+        self.collection = collection
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, NotificationJob]" = OrderedDict()
+        self._seq = itertools.count()
+        self._jobs_queue: Optional[asyncio.PriorityQueue] = None
+        self._batches: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._timers: List[asyncio.TimerHandle] = []
+        self._in_flight = 0
+
+    @staticmethod
+    def _rank(notification: NotificationData) -> Tuple[int, int]:
+        return PRIORITY_RANK.get(notification.priority, 1), TYPE_RANK.get(notification.type, len(TYPE_RANK))
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._jobs_queue = asyncio.PriorityQueue()
+        self._batches = asyncio.PriorityQueue()
+        self._tasks.append(asyncio.create_task(self._expand_loop()))
+        self._tasks += [asyncio.create_task(self._send_loop()) for _ in range(self.concurrency)]
+        logger.info(f"Notification dispatcher started ({self.transport.name}, {self.concurrency} senders)")
+
+    async def stop(self) -> None:
+        for timer in self._timers:
+            timer.cancel()
+        pending = self._batches.qsize() if self._batches else 0
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if pending:
+            logger.warning(f"Notification dispatcher stopped with {pending} batches unsent")
+
+    # -----------------------------
+    # Submit
+    # -----------------------------
+    def submit(self, notification: NotificationData, user_ids: Optional[Iterable[str]] = None,
+               on_done: Optional[Callable[[NotificationJob], None]] = None) -> NotificationJob:
+        """Queue a notification for the given users (all registered users if None). Returns immediately."""
+        if self._jobs_queue is None:
+            raise RuntimeError("Notification dispatcher is not running")
+        job = NotificationJob(uuid.uuid4().hex, notification, list(user_ids) if user_ids is not None else None,
+                              on_done=on_done)
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+        self._jobs_queue.put_nowait((*self._rank(notification), next(self._seq), job))
+        return job
+
+    def submit_episodes(self, user_id: str, episodes: List[Dict[str, Any]], ledger) -> Optional[NotificationJob]:
+        """
+        Notify a farmer of alert episodes not already sent to them (see AlertLedger).
+        They are reserved while the job runs (quiet hours can defer it for
+        hours), so later rounds do not queue them again. They count as sent
+        once the job reached at least one device; a job that failed, expired
+        or was rate-limited releases them for the next round.
+        """
+        unsent = ledger.filter_unsent(user_id, episodes)
+        if not unsent:
+            return None
+        ledger.reserve(user_id, unsent)
+        top = unsent[0]   # episodes arrive ranked, most severe first
+        title = top["type"] if len(unsent) == 1 else f"{top['type']} (+{len(unsent) - 1} more)"
+        notification = NotificationData(
+            type=NotificationType.WEATHER_ALERT,
+            title=title[:100],
+            message=" ".join(e["message"] for e in unsent)[:500],
+            priority="high" if top["severity"] in ("high", "critical") else "medium",
+        )
+        def delivered(job: NotificationJob) -> None:
+            if job.sent:
+                ledger.mark_sent(user_id, unsent)
+            else:
+                ledger.release(user_id, unsent)
+
+        return self.submit(notification, [user_id], on_done=delivered)
+
+    def _message(self, job: NotificationJob) -> Dict[str, Any]:
+        notification = job.notification
+        ttl = None
+        if notification.expires_at is not None:
+            ttl = max(int((notification.expires_at - datetime.now(timezone.utc)).total_seconds()), 0)
+        return {
+            "title": notification.title,
+            "body": notification.message,
+            "data": {"type": notification.type.value, "job_id": job.job_id, "priority": notification.priority},
+            "urgent": _is_urgent(notification),
+            "ttl": ttl,
+        }
+
+    def _expired(self, notification: NotificationData) -> bool:
+        expires_at = notification.expires_at
+        if expires_at is None:
+            return False
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at <= datetime.now(timezone.utc)
+
+    async def _expand(self, job: NotificationJob) -> None:
+        """Resolve recipients to device batches, applying rate limits and quiet hours."""
+        notification = job.notification
+        urgent = _is_urgent(notification)
+        if notification.target_crops or notification.target_regions:
+            if self.audience is None:
+                raise RuntimeError("targeted notification but no audience index is configured")
+            # Matching farmers without a registered device are skipped below
+            user_ids = await asyncio.to_thread(
+                self.audience.resolve, notification.target_crops, notification.target_regions, job.user_ids)
+        else:
+            user_ids = job.user_ids if job.user_ids is not None else self.registry.users()
+        job.recipients = len(user_ids)
+        rank = self._rank(notification)
+        now = time.time()
+
+        ready: List[str] = []
+        deferred: Dict[int, List[str]] = {}
+        for index, user_id in enumerate(user_ids):
+            if index and index % 5000 == 0:
+                await asyncio.sleep(0)   # let senders start on the first batches
+            tokens = self.registry.tokens_for(user_id)
+            if not tokens:
+                continue
+            if not urgent and not self.rate_limiter.allow(user_id):
+                job.rate_limited += 1
+                continue
+            for token in tokens:
+                device = self.registry.device(token)
+                wait = 0.0 if urgent or device is None else device.quiet_remaining(now)
+                if wait:
+                    deferred.setdefault(int(wait // 60) + 1, []).append(token)
+                else:
+                    ready.append(token)
+                if len(ready) >= MULTICAST_LIMIT:
+                    self._enqueue(rank, _Batch(job, ready))
+                    ready = []
+        if ready:
+            self._enqueue(rank, _Batch(job, ready))
+
+        for minutes, tokens in deferred.items():
+            job.deferred += len(tokens)
+            for start in range(0, len(tokens), MULTICAST_LIMIT):
+                job.outstanding += 1
+                self._schedule(minutes * 60, rank, _Batch(job, tokens[start:start + MULTICAST_LIMIT]))
+
+        job.devices = job.devices + job.deferred
+        if job.outstanding:
+            job.status = "sending"
+            self._record(job)
+        else:
+            self._complete(job)
+
+    def _enqueue(self, rank: Tuple[int, int], batch: _Batch) -> None:
+        batch.job.outstanding += 1
+        batch.job.devices += len(batch.tokens)
+        self._batches.put_nowait((*rank, next(self._seq), batch))
+
+    def _schedule(self, delay: float, rank: Tuple[int, int], batch: _Batch) -> None:
+        """Queue a batch (already counted as outstanding) after `delay` seconds."""
+        loop = asyncio.get_running_loop()
+        self._timers = [t for t in self._timers if not t.cancelled() and t.when() > loop.time()]
+        self._timers.append(loop.call_later(delay, lambda: self._batches.put_nowait((*rank, next(self._seq), batch))))
+
+    async def _expand_loop(self) -> None:
+        while True:
+            *_, job = await self._jobs_queue.get()
+            try:
+                await self._expand(job)
+            except Exception as e:
+                logger.error(f"Expanding notification job {job.job_id} failed: {e}")
+                self._complete(job, "failed")
+
+    # -----------------------------
+    # Send
+    # -----------------------------
+    async def _send_loop(self) -> None:
+        while True:
+            rank_priority, rank_type, _, batch = await self._batches.get()
+            self._in_flight += 1
+            try:
+                await self._send(batch, (rank_priority, rank_type))
+            except Exception as e:
+                logger.error(f"Notification batch for job {batch.job.job_id} failed: {e}")
+                self._retry_or_fail(batch, batch.tokens, (rank_priority, rank_type))
+            finally:
+                self._in_flight -= 1
+
+    async def _send(self, batch: _Batch, rank: Tuple[int, int]) -> None:
+        job = batch.job
+        type_label = job.notification.type.value
+        if self._expired(job.notification):
+            job.expired += len(batch.tokens)
+            NOTIFICATIONS.inc(type_label, "expired", amount=len(batch.tokens))
+            self._finish_batch(job)
+            return
+        start = time.perf_counter()
+        result = await asyncio.to_thread(self.transport.send_multicast, self._message(job), batch.tokens)
+        NOTIFICATION_BATCH_SECONDS.observe(time.perf_counter() - start, self.transport.name)
+
+        job.sent += result.sent
+        NOTIFICATIONS.inc(type_label, "sent", amount=result.sent)
+        for token in result.invalid:
+            self.registry.unregister(token)
+        if result.invalid:
+            job.failed += len(result.invalid)
+            NOTIFICATIONS.inc(type_label, "invalid_token", amount=len(result.invalid))
+        if result.retry:
+            self._retry_or_fail(batch, result.retry, rank)
+        else:
+            self._finish_batch(job)
+
+    def _retry_or_fail(self, batch: _Batch, tokens: List[str], rank: Tuple[int, int]) -> None:
+        job = batch.job
+        if batch.attempt + 1 >= self.max_attempts:
+            job.failed += len(tokens)
+            NOTIFICATIONS.inc(job.notification.type.value, "failed", amount=len(tokens))
+            self._finish_batch(job)
+            return
+        delay = min(self.backoff_max, self.backoff_base * (2 ** batch.attempt)) * random.uniform(0.5, 1.0)
+        retry = _Batch(job, tokens, batch.attempt + 1)
+        self._schedule(delay, rank, retry)
+        logger.info(f"Retrying {len(tokens)} tokens of job {job.job_id} in {delay:.1f}s "
+                    f"(attempt {retry.attempt + 1}/{self.max_attempts})")
+
+    def _finish_batch(self, job: NotificationJob) -> None:
+        job.outstanding -= 1
+        if job.outstanding <= 0 and job.status == "sending":
+            self._complete(job)
+
+    def _complete(self, job: NotificationJob, status: str = "done") -> None:
+        job.status = status
+        self._record(job)
+        if job.on_done is not None:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                logger.error(f"Completion callback of notification job {job.job_id} failed: {e}")
+
+    def _record(self, job: NotificationJob) -> None:
+        if self.writer is not None:
+            self.writer.write_nowait(self.collection, job.summary(), doc_id=job.job_id, merge=True)
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Wait until queued jobs and ready batches are sent (deferred and backoff batches excluded)."""
+        async def _wait():
+            while (not self._jobs_queue.empty() or not self._batches.empty() or self._in_flight
+                   or any(job.status == "queued" for job in self.jobs.values())):
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(_wait(), timeout)
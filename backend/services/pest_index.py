@@ -0,0 +1,199 @@
+# services/pest_index.py
+"""
+Nearest-neighbour lookup of pest images against labeled reference images,
+the first stage of /pest/detect.
+
+Every labeled image in the training shard store (farmer-confirmed or
+corrected detections) is a reference. Its 200-value descriptor
+(services.pest_learning.image_features) is projected with PCA to a
+compact 32-value float32 embedding and normalized, so cosine distance is
+one dot product. The embeddings sit in an IVF index: spherical k-means
+centroids plus one contiguous slice of embeddings per centroid. A query
+scores the centroids, scans only the closest `nprobe` slices and takes
+the k nearest references; small indexes (under IVF_MIN_REFERENCES) are
+scanned exhaustively.
+
+A match is confident when the k neighbours mostly agree and the nearest
+one is within `max_distance`. That threshold is calibrated at build time
+by leave-one-out over a sample of the references: it is the largest
+distance up to which agreeing matches were right at least
+`target_precision` of the time. Anything else is ambiguous and goes to
+the classifier.
+
+The index is rebuilt by the training round and saved as one .npz file;
+workers reload it when the file changes.
+"""
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IVF_MIN_REFERENCES = 2000
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-12)
+
+
+def _spherical_kmeans(x: np.ndarray, nlist: int, rng: np.random.Generator,
+                      iterations: int = 8, chunk: int = 16384) -> np.ndarray:
+    centroids = x[rng.choice(len(x), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.concatenate([np.argmax(x[i:i + chunk] @ centroids.T, axis=1)
+                                 for i in range(0, len(x), chunk)])
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        # Re-seed empty lists with random points so every list stays in use
+        sums[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+class PestReferenceIndex:
+    def __init__(self, mean: np.ndarray, components: np.ndarray, embeddings: np.ndarray, labels: np.ndarray,
+                 centroids: np.ndarray, offsets: np.ndarray, max_distance: float = -1.0, k: int = 5,
+                 min_agreement: float = 0.8, nprobe: int = 1, fingerprint: str = "",
+                 feature_version: int = 0, built_at: float = 0.0):
+        self.mean = mean
+        self.components = components            # (dim, features)
+        self.embeddings = embeddings            # (n, dim), grouped by list
+        self.labels = labels                    # (n,), same order
+        self.centroids = centroids              # (nlist, dim)
+        self.offsets = offsets                  # list i is embeddings[offsets[i]:offsets[i + 1]]
+        self.max_distance = max_distance
+        self.k = k
+        self.min_agreement = min_agreement
+        self.nprobe = min(nprobe, len(centroids))
+        self.fingerprint = fingerprint
+        self.feature_version = feature_version
+        self.built_at = built_at
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    # -----------------------------
+    # Build
+    # -----------------------------
+    @classmethod
+    def build(cls, features: np.ndarray, labels: Sequence[str], dim: int = 32, k: int = 5,
+              min_agreement: float = 0.8, target_precision: float = 0.95, calibration_size: int = 1000,
+              fingerprint: str = "", feature_version: int = 0, seed: int = 0) -> "PestReferenceIndex":
+        rng = np.random.default_rng(seed)
+        features = np.asarray(features, dtype=np.float32)
+        labels = np.asarray(labels)
+        n = len(features)
+        mean = features.mean(axis=0)
+        # PCA basis from (a sample of) the references
+        sample = features[rng.choice(n, size=min(n, 20000), replace=False)] - mean
+        _, _, vt = np.linalg.svd(sample, full_matrices=False)
+        components = vt[:min(dim, len(vt))].astype(np.float32)
+        embeddings = _normalize((features - mean) @ components.T).astype(np.float32)
+
+        if n < IVF_MIN_REFERENCES:
+            centroids = _normalize(embeddings.mean(axis=0, keepdims=True)).astype(np.float32)
+            assign = np.zeros(n, dtype=np.int64)
+        else:
+            nlist = int(4 * np.sqrt(n))
+            train = embeddings[rng.choice(n, size=min(n, 64 * nlist), replace=False)]
+            centroids = _spherical_kmeans(train, nlist, rng)
+            assign = np.argmax(embeddings @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))])
+        index = cls(mean, components, embeddings[order], labels[order], centroids, offsets,
+                    k=k, min_agreement=min_agreement, nprobe=max(4, len(centroids) // 10),
+                    fingerprint=fingerprint, feature_version=feature_version, built_at=time.time())
+        index.max_distance = index._calibrate(target_precision, calibration_size, rng)
+        return index
+
+    def _calibrate(self, target_precision: float, size: int, rng: np.random.Generator) -> float:
+        """Leave-one-out: the largest nearest distance up to which agreeing matches were right."""
+        sample = rng.choice(len(self), size=min(len(self), size), replace=False)
+        hits = []
+        for i in sample.tolist():
+            ids, distances = self.search(self.embeddings[i], self.k + 1)
+            keep = ids != i
+            label, agreement = self._vote(ids[keep][:self.k])
+            if agreement >= self.min_agreement:
+                hits.append((float(distances[keep][0]), label == self.labels[i]))
+        if len(hits) < 20:
+            return -1.0   # too little evidence: every lookup is ambiguous
+        hits.sort()
+        precision = np.cumsum([ok for _, ok in hits]) / np.arange(1, len(hits) + 1)
+        good = np.flatnonzero(precision >= target_precision)
+        return hits[int(good[-1])][0] if len(good) else -1.0
+
+    # -----------------------------
+    # Query
+    # -----------------------------
+    def embed(self, features: np.ndarray) -> np.ndarray:
+        return _normalize((np.asarray(features, dtype=np.float32) - self.mean) @ self.components.T)
+
+    def search(self, embedding: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions and cosine distances of (approximately) the k nearest references."""
+        if len(self.centroids) == 1:
+            candidates = np.arange(len(self))
+        else:
+            scores = self.centroids @ embedding
+            probe = np.argpartition(-scores, self.nprobe - 1)[:self.nprobe]
+            starts, ends = self.offsets[probe], self.offsets[probe + 1]
+            sizes = ends - starts
+            # Concatenated ranges of the probed lists, without a Python loop
+            candidates = np.arange(int(sizes.sum())) + np.repeat(starts - np.cumsum(sizes) + sizes, sizes)
+        if not len(candidates):
+            return candidates, np.empty(0, dtype=np.float32)
+        distances = 1.0 - self.embeddings[candidates] @ embedding
+        k = min(k, len(candidates))
+        nearest = np.argpartition(distances, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+        return candidates[nearest], distances[nearest]
+
+    def _vote(self, ids: np.ndarray) -> Tuple[Optional[str], float]:
+        if not len(ids):
+            return None, 0.0
+        votes = Counter(self.labels[ids].tolist())
+        best = max(votes.values())
+        # Ties go to the label of the nearest neighbour among the leaders
+        label = next(l for l in self.labels[ids].tolist() if votes[l] == best)
+        return str(label), best / len(ids)
+
+    def match(self, features: np.ndarray) -> Dict[str, Any]:
+        """Label, agreement and nearest distance for an image descriptor; `confident` if usable as is."""
+        ids, distances = self.search(self.embed(features), self.k)
+        label, agreement = self._vote(ids)
+        distance = float(distances[0]) if len(distances) else 2.0
+        return {"label": label, "confidence": agreement, "distance": distance,
+                "confident": label is not None and agreement >= self.min_agreement
+                             and distance <= self.max_distance}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"references": len(self), "dim": int(self.components.shape[0]), "lists": len(self.centroids),
+                "nprobe": self.nprobe, "max_distance": round(self.max_distance, 4),
+                "labels": dict(Counter(self.labels.tolist())), "built_at": self.built_at}
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, mean=self.mean, components=self.components, embeddings=self.embeddings,
+                 labels=self.labels, centroids=self.centroids, offsets=self.offsets,
+                 params=np.array([self.max_distance, self.k, self.min_agreement, self.nprobe,
+                                  self.feature_version, self.built_at]),
+                 fingerprint=np.array(self.fingerprint))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PestReferenceIndex":
+        with np.load(path) as data:
+            max_distance, k, min_agreement, nprobe, feature_version, built_at = data["params"].tolist()
+            return cls(data["mean"], data["components"], data["embeddings"], data["labels"], data["centroids"],
+                       data["offsets"], max_distance=max_distance, k=int(k), min_agreement=min_agreement,
+                       nprobe=int(nprobe), fingerprint=str(data["fingerprint"]),
+                       feature_version=int(feature_version), built_at=built_at)
@@ -0,0 +1,515 @@
+# services/pest_learning.py
+"""
+Active learning for pest detection.
+
+Detections and farmer verdicts flow back into a CPU-trained image
+classifier:
+
+- Features: a 200-dimension descriptor computed with Pillow/numpy from a
+  64x64 thumbnail (hue/saturation and brightness histograms plus a 4x4
+  grid of gradient-orientation histograms), cheap enough for the request
+  path.
+- TrainingShardStore: append-only .npz shards of (image hash, features,
+  label, weight), deduplicated by image content hash; a later row for the
+  same image (e.g. a farmer correction of an uncertain detection) wins.
+  Low-confidence detections are stored unlabeled, so they can be labeled
+  later; verdicts are stored labeled.
+- PestModelRegistry: versioned model files plus a current.json pointer
+  replaced atomically. Serving reopens the pointer when it changes, so a
+  new version is hot-swapped between requests, in every worker.
+- PestLearningService.train_once: incremental SGDClassifier.partial_fit
+  on the labeled rows not yet trained on, mixed with a replay sample of
+  older rows, published only if it does at least as well as the current
+  version on a fixed holdout (every 10th image by hash). One worker
+  trains at a time (file lock); it runs in a thread off the event loop.
+  The same round rebuilds the reference index (services.pest_index).
+- PestLearningService.analyze: two stages. A nearest-neighbour lookup
+  among the labeled reference images answers confident matches; only
+  ambiguous ones run the classifier (or, before the first model, the
+  caller's fallback).
+
+Layout of the directory (PEST_LEARNING_DIR):
+
+    shards/<worker>-<seq>.npz   training rows
+    models/<version>.joblib     published classifiers
+    current.json                the serving version and its metadata
+    reference_index.npz         labeled reference embeddings (first stage)
+"""
+import asyncio
+import copy
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+from PIL import Image, ImageOps
+
+from services.pest_index import PestReferenceIndex
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PEST_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "pest_learning")
+FEATURE_VERSION = 1
+NO_PEST = "none"
+UNLABELED = ""
+
+
+# -----------------------------
+# Image features
+# -----------------------------
+def image_features(data: bytes) -> np.ndarray:
+    """L2-normalized colour + texture descriptor (float32, 200 values) of an image."""
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", (128, 128))   # JPEG: decode at reduced scale
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        small = img.resize((64, 64), Image.BILINEAR)
+    hsv = np.asarray(small.convert("HSV"), dtype=np.float32) / 256.0
+    pixels = 64 * 64
+    hue = (hsv[..., 0] * 12).astype(np.int64)
+    sat = (hsv[..., 1] * 4).astype(np.int64)
+    val = (hsv[..., 2] * 8).astype(np.int64)
+    color = np.bincount((hue * 4 + sat).ravel(), minlength=48) / pixels
+    value = np.bincount(val.ravel(), minlength=8) / pixels
+
+    gray = np.asarray(small.convert("L"), dtype=np.float32) / 255.0
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    magnitude = np.hypot(gx, gy)
+    orientation = np.minimum((np.mod(np.arctan2(gy, gx), np.pi) / np.pi * 9).astype(np.int64), 8)
+    rows, cols = np.indices(gray.shape)
+    cell = (rows // 16) * 4 + cols // 16
+    texture = np.bincount((cell * 9 + orientation).ravel(), weights=magnitude.ravel(), minlength=144)
+    texture = texture.reshape(16, 9)
+    texture /= np.linalg.norm(texture, axis=1, keepdims=True) + 1e-6
+
+    # Square roots turn histogram distances into Hellinger distances
+    vector = np.sqrt(np.concatenate([color, value, texture.ravel() / 4.0]))
+    return (vector / (np.linalg.norm(vector) + 1e-12)).astype(np.float32)
+
+
+def image_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+# -----------------------------
+# Training shards
+# -----------------------------
+class TrainingShardStore:
+    def __init__(self, directory: str = DEFAULT_PEST_DIR, rows_per_shard: int = 1000,
+                 worker: Optional[str] = None):
+        self.directory = os.path.join(directory, "shards")
+        self.rows_per_shard = rows_per_shard
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._seq = 0
+        self._pending: List[Tuple[str, np.ndarray, str, float, str]] = []
+        self._labels: Dict[str, str] = {}       # image hash -> latest label ("" = unlabeled)
+        self._loaded: set = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.refresh()
+
+    def shard_files(self) -> List[str]:
+        # Sorted by modification time so later shards win for the same image
+        paths = [p for p in glob.glob(os.path.join(self.directory, "*.npz")) if not p.endswith(".tmp.npz")]
+        return sorted(paths, key=lambda p: (os.path.getmtime(p), p))
+
+    def refresh(self) -> int:
+        """Index shards written since the last refresh (by any worker)."""
+        added = 0
+        for path in self.shard_files():
+            name = os.path.basename(path)
+            if name in self._loaded:
+                continue
+            with np.load(path) as shard:
+                hashes, labels = shard["hashes"].tolist(), shard["labels"].tolist()
+            with self._lock:
+                for h, label in zip(hashes, labels):
+                    if label or h not in self._labels:
+                        self._labels[h] = label
+                self._loaded.add(name)
+            added += len(hashes)
+        return added
+
+    def __len__(self) -> int:
+        return len(self._labels) + len(self._pending)
+
+    def label_of(self, h: str) -> Optional[str]:
+        return self._labels.get(h)
+
+    def add(self, h: str, features: np.ndarray, label: str = UNLABELED, weight: float = 1.0,
+            source: str = "detection") -> bool:
+        """Queue a row; duplicates are skipped unless they change the image's label."""
+        with self._lock:
+            known = self._labels.get(h)
+            if known is not None and (known == label or not label):
+                return False
+            self._labels[h] = label
+            self._pending.append((h, features.astype(np.float32), label, float(weight), source))
+            full = len(self._pending) >= self.rows_per_shard
+        if full:
+            self.flush()
+        return True
+
+    def flush(self) -> Optional[str]:
+        """Write pending rows as a new shard file."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if not rows:
+                return None
+            self._seq += 1
+            name = f"{self.worker}-{int(time.time())}-{self._seq:05d}.npz"
+            self._loaded.add(name)
+        path = os.path.join(self.directory, name)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, hashes=np.array([r[0] for r in rows]), features=np.stack([r[1] for r in rows]),
+                 labels=np.array([r[2] for r in rows]), weights=np.array([r[3] for r in rows], dtype=np.float32),
+                 sources=np.array([r[4] for r in rows]), feature_version=np.array(FEATURE_VERSION))
+        os.replace(tmp, path)
+        return name
+
+    def labeled(self, files: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Latest labeled row per image across the given shard files (default all):
+        hashes, features, labels, weights and the file each row came from.
+        """
+        names = set(files) if files is not None else None
+        latest: Dict[str, Tuple[np.ndarray, str, float, str]] = {}
+        for path in self.shard_files():
+            name = os.path.basename(path)
+            if names is not None and name not in names:
+                continue
+            with np.load(path) as shard:
+                if int(shard["feature_version"]) != FEATURE_VERSION:
+                    continue
+                for h, x, label, w in zip(shard["hashes"].tolist(), shard["features"],
+                                          shard["labels"].tolist(), shard["weights"].tolist()):
+                    if label:
+                        latest[h] = (x, label, w, name)
+        hashes = list(latest)
+        return {
+            "hashes": hashes,
+            "features": np.stack([latest[h][0] for h in hashes]) if hashes else np.empty((0, 200), np.float32),
+            "labels": np.array([latest[h][1] for h in hashes]),
+            "weights": np.array([latest[h][2] for h in hashes], dtype=np.float64),
+            "files": [latest[h][3] for h in hashes],
+        }
+
+
+def _try_lock(lock_file) -> bool:
+    """Non-blocking exclusive lock on an open file; False if another process holds it."""
+    try:
+        import fcntl
+    except ImportError:   # Windows
+        import msvcrt
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+# -----------------------------
+# Model registry
+# -----------------------------
+class PestModelRegistry:
+    """Published classifier versions and hot-swap loading of the current one."""
+
+    def __init__(self, directory: str = DEFAULT_PEST_DIR, check_interval: float = 10.0, keep: int = 5):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.keep = keep
+        self._current: Tuple[Optional[Any], Dict[str, Any]] = (None, {})
+        self._mtime = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "models"), exist_ok=True)
+        self._reload()
+
+    @property
+    def pointer(self) -> str:
+        return os.path.join(self.directory, "current.json")
+
+    def _reload(self) -> None:
+        try:
+            mtime = os.stat(self.pointer).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.pointer, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            model = joblib.load(os.path.join(self.directory, "models", f"{meta['version']}.joblib"))
+            # One reference assignment: requests see the old or the new version, never a mix
+            self._current = (model, meta)
+            self._mtime = mtime
+            logger.info(f"Serving pest model {meta['version']}")
+        except Exception as e:
+            logger.error(f"❌ Failed to load pest model from {self.pointer}: {e}")
+
+    def current(self) -> Tuple[Optional[Any], Dict[str, Any]]:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    self._reload()
+        return self._current
+
+    def publish(self, model: Any, meta: Dict[str, Any]) -> str:
+        versions = sorted(glob.glob(os.path.join(self.directory, "models", "v*.joblib")))
+        number = int(os.path.basename(versions[-1])[1:].split(".")[0]) + 1 if versions else 1
+        version = f"v{number:04d}"
+        path = os.path.join(self.directory, "models", f"{version}.joblib")
+        joblib.dump(model, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        meta = {**meta, "version": version, "published_at": datetime.now(timezone.utc).isoformat()}
+        with open(self.pointer + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(self.pointer + ".tmp", self.pointer)
+        for old in versions[:-self.keep] if len(versions) >= self.keep else []:
+            os.remove(old)
+        with self._lock:
+            self._reload()
+        return version
+
+
+# -----------------------------
+# Collection, serving and training
+# -----------------------------
+class PestLearningService:
+    def __init__(self, store: TrainingShardStore, registry: PestModelRegistry, labels: Sequence[str],
+                 confidence_threshold: float = 0.6, min_new_examples: int = 20, replay_size: int = 2000,
+                 epochs: int = 5, tolerance: float = 0.02, pending_ttl: float = 7 * 24 * 3600,
+                 min_references: int = 50, match_precision: float = 0.95):
+        self.store = store
+        self.registry = registry
+        self.labels = sorted(set(labels) | {NO_PEST})
+        self.confidence_threshold = confidence_threshold
+        self.min_new_examples = min_new_examples
+        self.replay_size = replay_size
+        self.epochs = epochs
+        self.tolerance = tolerance
+        # detection id -> what verdicts need (features and the served prediction)
+        self._detections = TTLCache(maxsize=100_000, ttl=pending_ttl, name="pest_detections")
+        self._train_lock_path = os.path.join(registry.directory, "train.lock")
+        self._task: Optional[asyncio.Task] = None
+        self.last_trained_at: Optional[float] = None
+        self.min_references = min_references
+        self.match_precision = match_precision
+        self.index_path = os.path.join(registry.directory, "reference_index.npz")
+        self._index: Optional[PestReferenceIndex] = None
+        self._index_mtime = 0.0
+        self._index_checked_at = 0.0
+        self.stages = {"reference": 0, "classifier": 0, "none": 0}
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.registry.current()[1].get("version")
+
+    # Serving -------------------------------------------------------
+    def reference_index(self) -> Optional[PestReferenceIndex]:
+        """The current reference index, reloaded when another worker rebuilds it."""
+        now = time.monotonic()
+        if now - self._index_checked_at >= self.registry.check_interval:
+            self._index_checked_at = now
+            try:
+                mtime = os.stat(self.index_path).st_mtime
+                if mtime != self._index_mtime:
+                    index = PestReferenceIndex.load(self.index_path)
+                    self._index_mtime = mtime
+                    self._index = index if index.feature_version == FEATURE_VERSION else None
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"❌ Failed to load pest reference index: {e}")
+        return self._index
+
+    def analyze(self, data: bytes) -> Dict[str, Any]:
+        """
+        Features of an upload and a prediction: from the reference lookup
+        when it is confident, else from the published model (if any).
+        """
+        features = image_features(data)
+        model, meta = self.registry.current()
+        result: Dict[str, Any] = {"hash": image_hash(data), "features": features, "label": None,
+                                  "confidence": None, "model_version": meta.get("version"), "stage": None}
+        index = self.reference_index()
+        if index is not None:
+            match = index.match(features)
+            result["match_distance"] = round(match["distance"], 4)
+            if match["confident"]:
+                result.update(label=match["label"], confidence=match["confidence"], stage="reference")
+                self.stages["reference"] += 1
+                return result
+        if model is not None:
+            proba = model.predict_proba(features[None, :])[0]
+            best = int(np.argmax(proba))
+            result.update(label=str(model.classes_[best]), confidence=float(proba[best]), stage="classifier")
+            self.stages["classifier"] += 1
+        else:
+            self.stages["none"] += 1
+        return result
+
+    def record_detection(self, analysis: Dict[str, Any], label: str, confidence: float,
+                         user_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Remember a served detection for later verdicts by the uploader
+        (`user_id`). Uncertain ones - below the confidence threshold, or not
+        answered by any stage (mock results before the first model) - go to
+        the shard store unlabeled and are flagged for farmer feedback.
+        """
+        detection_id = f"{analysis['hash'][:16]}-{uuid.uuid4().hex[:8]}"
+        uncertain = analysis.get("stage") is None or confidence < self.confidence_threshold
+        entry = {"hash": analysis["hash"], "features": analysis["features"], "label": label,
+                 "confidence": confidence, "model_version": analysis.get("model_version"), "user_id": user_id}
+        self._detections.set(detection_id, entry)
+        if uncertain:
+            self.store.add(analysis["hash"], analysis["features"], UNLABELED, source="uncertain")
+        return {"detection_id": detection_id, "feedback_requested": uncertain, **entry}
+
+    def remember(self, detection_id: str, entry: Dict[str, Any]) -> None:
+        """Restore a detection recorded by another worker (see pest_detections)."""
+        self._detections.set(detection_id, entry)
+
+    def detection(self, detection_id: str) -> Optional[Dict[str, Any]]:
+        return self._detections.get(detection_id)
+
+    def verdict(self, detection_id: str, correct: bool, label: Optional[str] = None) -> Optional[str]:
+        """Store a farmer's verdict as a labeled example. Returns the label, or None if unknown."""
+        entry = self._detections.get(detection_id)
+        if entry is None:
+            return None
+        final = entry["label"] if correct else label
+        if final not in self.labels:
+            raise ValueError(f"Unknown pest label '{final}'; expected one of {self.labels}")
+        # Corrections of the model's mistakes are the most informative examples
+        weight = 1.0 if correct else 2.0
+        self.store.add(entry["hash"], np.asarray(entry["features"], dtype=np.float32), final, weight,
+                       source="confirmed" if correct else "corrected")
+        return final
+
+    # Background loop -----------------------------------------------
+    async def start(self, train_interval: float = 600.0, flush_interval: float = 30.0) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(train_interval, flush_interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.store.flush)
+
+    async def _run(self, train_interval: float, flush_interval: float) -> None:
+        next_train = time.monotonic() + train_interval
+        while True:
+            await asyncio.sleep(min(flush_interval, train_interval))
+            try:
+                await asyncio.to_thread(self.store.flush)
+                if time.monotonic() >= next_train:
+                    next_train = time.monotonic() + train_interval
+                    # CPU-bound, so it runs in a thread; serving keeps using the current version
+                    await asyncio.to_thread(self.train_once)
+                    self.last_trained_at = time.time()
+            except Exception as e:
+                logger.error(f"Pest model training round failed: {e}")
+
+    # Training ------------------------------------------------------
+    def _new_classifier(self):
+        from sklearn.linear_model import SGDClassifier
+        return SGDClassifier(loss="log_loss", alpha=1e-4, random_state=0)
+
+    def train_once(self) -> Optional[str]:
+        """One incremental training round; returns the published version, if any."""
+        with open(self._train_lock_path, "w") as lock_file:
+            if not _try_lock(lock_file):
+                return None   # another worker is training
+            self.store.flush()
+            self.store.refresh()
+            data = self.store.labeled()
+            version = self._train(data, *self.registry.current())
+            self._build_index(data)
+            return version
+
+    def _build_index(self, data: Dict[str, Any]) -> bool:
+        """Rebuild the reference index if the labeled rows changed since the last build."""
+        if len(data["hashes"]) < self.min_references:
+            return False
+        fingerprint = hashlib.sha256("\n".join(sorted(set(data["files"]))).encode("utf-8")).hexdigest()[:16]
+        fingerprint = f"{len(data['hashes'])}:{fingerprint}"
+        current = self.reference_index()
+        if current is not None and current.fingerprint == fingerprint:
+            return False
+        start = time.perf_counter()
+        index = PestReferenceIndex.build(data["features"], data["labels"], target_precision=self.match_precision,
+                                         fingerprint=fingerprint, feature_version=FEATURE_VERSION)
+        index.save(self.index_path)
+        self._index, self._index_mtime = index, os.stat(self.index_path).st_mtime
+        logger.info(f"✅ Rebuilt pest reference index ({index.stats()['references']} references, "
+                    f"max distance {index.max_distance:.3f}) in {time.perf_counter() - start:.1f}s")
+        return True
+
+    def _train(self, data: Dict[str, Any], current, meta: Dict[str, Any]) -> Optional[str]:
+        start = time.perf_counter()
+        trained = set(meta.get("trained_shards", []))
+        if current is not None and meta.get("classes") != self.labels:
+            current, trained = None, set()   # label set changed: start over
+        holdout = np.array([int(h[:2], 16) % 10 == 0 for h in data["hashes"]], dtype=bool)
+        is_new = np.array([f not in trained for f in data["files"]], dtype=bool)
+        new = is_new & ~holdout
+        if new.sum() < self.min_new_examples:
+            return None
+
+        X, y, w = data["features"], data["labels"], data["weights"]
+        old = np.flatnonzero(~is_new & ~holdout)
+        rng = np.random.default_rng(len(data["hashes"]))
+        replay = rng.choice(old, size=min(len(old), self.replay_size), replace=False) if len(old) else old
+        rows = np.concatenate([np.flatnonzero(new), replay])
+
+        candidate = copy.deepcopy(current) if current is not None else self._new_classifier()
+        for _ in range(self.epochs):
+            order = rng.permutation(rows)
+            candidate.partial_fit(X[order], y[order], classes=np.array(self.labels), sample_weight=w[order])
+
+        metrics: Dict[str, Any] = {"train_rows": int(len(rows)), "new_rows": int(new.sum()),
+                                   "holdout_rows": int(holdout.sum())}
+        if holdout.any():
+            metrics["holdout_accuracy"] = round(float((candidate.predict(X[holdout]) == y[holdout]).mean()), 4)
+            if current is not None:
+                baseline = float((current.predict(X[holdout]) == y[holdout]).mean())
+                metrics["previous_accuracy"] = round(baseline, 4)
+                if metrics["holdout_accuracy"] < baseline - self.tolerance:
+                    logger.warning(f"Pest model candidate rejected: holdout accuracy "
+                                   f"{metrics['holdout_accuracy']:.3f} < {baseline:.3f}")
+                    return None
+        version = self.registry.publish(candidate, {
+            "classes": self.labels,
+            "feature_version": FEATURE_VERSION,
+            "trained_shards": sorted(trained | {f for f, n in zip(data["files"], is_new) if n}),
+            "metrics": metrics,
+            "parent": meta.get("version"),
+        })
+        logger.info(f"✅ Published pest model {version} ({metrics}) in {time.perf_counter() - start:.1f}s")
+        return version
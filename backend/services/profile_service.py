@@ -0,0 +1,186 @@
+# services/profile_service.py
+import asyncio
+import itertools
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from models.farmer_models import FarmerProfile
+from utils.cache import TTLCache
+from utils.metrics import track_cache
+
+logger = logging.getLogger(__name__)
+
+# Marker cached for farmers with no profile, so repeated misses stay cheap
+_NO_PROFILE = object()
+
+# Firestore get_all is most efficient in moderate chunks
+PREFETCH_CHUNK = 300
+
+
+class FarmerProfileService:
+    """
+    Read-through cache of `farmers` documents.
+
+    Entries expire after a TTL as a safety net, but are normally invalidated
+    as soon as the document changes through a collection snapshot listener
+    (works against Firestore, the emulator and the in-memory fake).
+
+    By default the listener only watches documents whose `updated_at` moves
+    forward (save_profile sets it), so it never streams the whole collection;
+    writers outside this service must set `updated_at` too, or run with
+    watch_all=True (PROFILE_WATCH_ALL=1) to watch every document.
+
+    A read that was in flight while its key was invalidated is returned but
+    not cached, so it cannot overwrite a newer invalidation with stale data.
+    """
+
+    def __init__(self, client_factory: Callable[[], Any], collection: str = "farmers",
+                 maxsize: int = 100000, ttl: float = 900.0, negative_ttl: float = 60.0,
+                 watch_all: bool = False):
+        self._client_factory = client_factory
+        self._client = None
+        self.collection = collection
+        self.negative_ttl = negative_ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, name="farmer_profiles")
+        track_cache(self._cache)
+        self._watch = None
+        self.watch_all = watch_all
+        # Generation counter; farmer id -> generation of its last invalidation
+        self._generation = itertools.count(1)
+        self._invalidated = TTLCache(maxsize=maxsize, ttl=300.0, name="farmer_profile_invalidations")
+        self._gen_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    @property
+    def cache(self) -> TTLCache:
+        return self._cache
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    def _from_snapshot(self, snapshot) -> Optional[FarmerProfile]:
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict()
+        data.pop("updated_at", None)
+        try:
+            return FarmerProfile(**data)
+        except Exception as e:
+            logger.warning(f"Invalid farmer profile {snapshot.id}: {e}")
+            return None
+
+    def _begin_read(self) -> int:
+        with self._gen_lock:
+            return next(self._generation)
+
+    def _store(self, farmer_id: str, profile: Optional[FarmerProfile], generation: int = 0) -> None:
+        with self._gen_lock:
+            if generation and (self._invalidated.get(farmer_id) or 0) > generation:
+                return   # changed while we were reading; the next read fetches it again
+            if profile is None:
+                self._cache.set(farmer_id, _NO_PROFILE, ttl=self.negative_ttl)
+            else:
+                self._cache.set(farmer_id, profile)
+
+    def get_cached(self, farmer_id: str) -> Optional[FarmerProfile]:
+        """Cache-only lookup; never touches Firestore."""
+        cached = self._cache.get(farmer_id)
+        return None if cached is _NO_PROFILE else cached
+
+    def get_profile(self, farmer_id: str) -> Optional[FarmerProfile]:
+        cached = self._cache.get(farmer_id)
+        if cached is not None:
+            return None if cached is _NO_PROFILE else cached
+
+        generation = self._begin_read()
+        snapshot = self.client.collection(self.collection).document(farmer_id).get()
+        profile = self._from_snapshot(snapshot)
+        self._store(farmer_id, profile, generation)
+        return profile
+
+    async def aget_profile(self, farmer_id: str) -> Optional[FarmerProfile]:
+        """Async variant: cache hits return inline, misses read Firestore off the event loop."""
+        cached = self._cache.get(farmer_id)
+        if cached is not None:
+            return None if cached is _NO_PROFILE else cached
+        return await asyncio.to_thread(self.get_profile, farmer_id)
+
+    def prefetch(self, farmer_ids: Iterable[str]) -> Dict[str, FarmerProfile]:
+        """
+        Warm the cache for a batch job with bulk `get_all` reads.
+        Returns the profiles that exist, keyed by farmer id.
+        """
+        profiles: Dict[str, FarmerProfile] = {}
+        missing: List[str] = []
+        for farmer_id in dict.fromkeys(farmer_ids):
+            cached = self._cache.get(farmer_id)
+            if cached is None:
+                missing.append(farmer_id)
+            elif cached is not _NO_PROFILE:
+                profiles[farmer_id] = cached
+
+        collection = self.client.collection(self.collection)
+        for start in range(0, len(missing), PREFETCH_CHUNK):
+            chunk = missing[start:start + PREFETCH_CHUNK]
+            found = set()
+            generation = self._begin_read()
+            for snapshot in self.client.get_all([collection.document(fid) for fid in chunk]):
+                found.add(snapshot.id)
+                profile = self._from_snapshot(snapshot)
+                self._store(snapshot.id, profile, generation)
+                if profile is not None:
+                    profiles[snapshot.id] = profile
+            for farmer_id in chunk:
+                if farmer_id not in found:
+                    self._store(farmer_id, None, generation)
+
+        logger.info(f"Prefetched {len(missing)} farmer profiles ({len(profiles)} available)")
+        return profiles
+
+    # -----------------------------
+    # Writes
+    # -----------------------------
+    def save_profile(self, farmer_id: str, profile: FarmerProfile) -> FarmerProfile:
+        """Write-through: persist, then cache the new value."""
+        data = profile.model_dump()
+        data["updated_at"] = datetime.now(timezone.utc)
+        self.client.collection(self.collection).document(farmer_id).set(data)
+        self.invalidate(farmer_id)
+        self._cache.set(farmer_id, profile)
+        return profile
+
+    def invalidate(self, farmer_id: str) -> None:
+        with self._gen_lock:
+            self._invalidated.set(farmer_id, next(self._generation))
+            self._cache.pop(farmer_id)
+
+    # -----------------------------
+    # Change listener
+    # -----------------------------
+    def _on_snapshot(self, docs, changes, read_time) -> None:
+        for change in changes:
+            self.invalidate(change.document.id)
+
+    def start_listener(self) -> None:
+        if self._watch is None:
+            collection = self.client.collection(self.collection)
+            # Only watch documents changed from now on; a bare collection listener
+            # would stream the whole farmers collection into memory first.
+            if hasattr(collection, "where") and not self.watch_all:
+                source = collection.where("updated_at", ">", datetime.now(timezone.utc))
+            else:
+                source = collection
+            self._watch = source.on_snapshot(self._on_snapshot)
+            logger.info(f"Listening for changes on '{self.collection}'")
+
+    def stop_listener(self) -> None:
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
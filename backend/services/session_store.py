@@ -0,0 +1,252 @@
+# services/session_store.py
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Only these context keys are kept server-side; anything else is per-turn only
+SESSION_CONTEXT_KEYS = ("location", "lat", "lon", "lng", "crop", "crops_grown",
+                        "soil_data", "region", "district", "season")
+
+# Rough per-record overhead (object headers, dict/deque slots) used for the memory cap
+_RECORD_OVERHEAD = 400
+_TURN_OVERHEAD = 120
+_MESSAGE_PREVIEW = 200
+
+
+@dataclass(slots=True)
+class ChatSession:
+    """Compact server-side chat state for one user."""
+    user_id: str
+    context: Dict[str, Any] = field(default_factory=dict)
+    turns: Deque[Tuple[float, str, str]] = field(default_factory=deque)  # (timestamp, intent, message)
+    last_intent: Optional[str] = None
+    updated_at: float = 0.0
+    size: int = 0
+
+    def estimate_size(self) -> int:
+        context_size = sum(len(k) + len(repr(v)) for k, v in self.context.items())
+        turns_size = sum(_TURN_OVERHEAD + len(msg) for _, _, msg in self.turns)
+        return _RECORD_OVERHEAD + len(self.user_id) + context_size + turns_size
+
+
+class ChatSessionStore:
+    """
+    In-memory chat sessions keyed by user, with TTL expiry and a global
+    memory cap enforced by evicting least-recently-used sessions.
+
+    Without Firestore the stored context lives in one worker's memory. With
+    a writer and client_factory each turn also writes the user's context and
+    last intent to their document, and load() (blocking) pulls it when
+    another worker saved a newer one, so follow-ups can land on any worker
+    once the write buffer has flushed.
+    """
+
+    def __init__(self, ttl_seconds: float = 1800, max_bytes: int = 32 * 1024 * 1024,
+                 max_turns: int = 10, persistence: Optional["ChatInteractionPersistence"] = None,
+                 writer=None, client_factory: Optional[Callable[[], Any]] = None,
+                 collection: str = "chat_sessions", purge_interval: float = 300.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        self.persistence = persistence
+        self.writer = writer
+        self._client_factory = client_factory
+        self._client = None
+        self.collection = collection
+        self.purge_interval = purge_interval
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    @property
+    def shared(self) -> bool:
+        return self.writer is not None and self._client_factory is not None
+
+    @property
+    def client(self):
+        if self._client is None and self._client_factory is not None:
+            self._client = self._client_factory()
+        return self._client
+
+    def get(self, user_id: str) -> Optional[ChatSession]:
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                return None
+            if time.time() - session.updated_at > self.ttl_seconds:
+                self._remove(user_id)
+                return None
+            self._sessions.move_to_end(user_id)
+            return session
+
+    def load(self, user_id: str) -> None:
+        """Take the user's stored context if another worker saved a newer one."""
+        if not self.shared:
+            return
+        snapshot = self.client.collection(self.collection).document(user_id).get()
+        data = snapshot.to_dict() if snapshot.exists else None
+        if not data:
+            return
+        try:
+            updated_at = float(data["updated_at"])
+            context = {k: v for k, v in (data.get("context") or {}).items() if k in SESSION_CONTEXT_KEYS}
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring malformed chat session of {user_id}: {e}")
+            return
+        if time.time() - updated_at > self.ttl_seconds:
+            return
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None and session.updated_at >= updated_at:
+                return
+            if session is None:
+                session = self._sessions[user_id] = ChatSession(user_id=user_id)
+            else:
+                self._sessions.move_to_end(user_id)
+            session.context = context
+            session.last_intent = data.get("last_intent")
+            session.updated_at = updated_at
+            self._resize(session)
+
+    def merge_context(self, user_id: str, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the stored context overlaid with whatever the client sent this turn.
+        Clients only need to send what changed.
+        """
+        session = self.get(user_id)
+        merged = dict(session.context) if session else {}
+        if context:
+            merged.update(context)
+        return merged
+
+    def last_intent(self, user_id: str) -> Optional[str]:
+        session = self.get(user_id)
+        return session.last_intent if session else None
+
+    def record_turn(self, user_id: str, intent: str, message: str, response: str,
+                    context: Optional[Dict[str, Any]] = None) -> ChatSession:
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None or now - session.updated_at > self.ttl_seconds:
+                if session is not None:
+                    self._remove(user_id)
+                session = ChatSession(user_id=user_id)
+                self._sessions[user_id] = session
+            else:
+                self._sessions.move_to_end(user_id)
+
+            if context:
+                session.context.update({k: v for k, v in context.items()
+                                        if k in SESSION_CONTEXT_KEYS and v is not None})
+            session.turns.append((time.time(), intent, message[:_MESSAGE_PREVIEW]))
+            while len(session.turns) > self.max_turns:
+                session.turns.popleft()
+            session.last_intent = intent
+            session.updated_at = now
+            self._resize(session)
+            stored = {"user_id": user_id, "context": dict(session.context),
+                      "last_intent": intent, "updated_at": now}
+
+        if self.writer is not None:
+            self.writer.write_nowait(self.collection, stored, doc_id=user_id)
+        if self.persistence:
+            self.persistence.record(user_id, intent, message, response)
+        return session
+
+    def clear(self, user_id: str) -> None:
+        with self._lock:
+            self._remove(user_id)
+        if self.writer is not None:
+            # An empty, newer document also replaces the context other workers hold
+            self.writer.write_nowait(self.collection, {
+                "user_id": user_id, "context": {}, "last_intent": None, "updated_at": time.time(),
+            }, doc_id=user_id)
+
+    def purge_expired(self) -> int:
+        """Drop all expired sessions; returns how many were removed."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [uid for uid, s in self._sessions.items() if s.updated_at < cutoff]
+            for uid in expired:
+                self._remove(uid)
+        return len(expired)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        # get() only expires the sessions it touches; idle users are dropped here
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            purged = self.purge_expired()
+            if purged:
+                logger.debug(f"Purged {purged} expired chat sessions")
+
+    def _resize(self, session: ChatSession) -> None:
+        new_size = session.estimate_size()
+        self._total_bytes += new_size - session.size
+        session.size = new_size
+        self._evict()
+
+    def _remove(self, user_id: str) -> None:
+        session = self._sessions.pop(user_id, None)
+        if session is not None:
+            self._total_bytes -= session.size
+
+    def _evict(self) -> None:
+        # Least recently used sessions sit at the front of the OrderedDict
+        while self._total_bytes > self.max_bytes and len(self._sessions) > 1:
+            user_id, session = self._sessions.popitem(last=False)
+            self._total_bytes -= session.size
+            logger.debug(f"Evicted chat session for {user_id} (memory cap)")
+
+
+class ChatInteractionPersistence:
+    """
+    Hands chat interactions to the Firestore write-behind buffer, which writes
+    them to `chat_interactions` in batches instead of once per message.
+    """
+
+    def __init__(self, writer, collection: str = "chat_interactions"):
+        self.writer = writer
+        self.collection = collection
+
+    def record(self, user_id: str, intent: str, message: str, response: str) -> None:
+        accepted = self.writer.write_nowait(self.collection, {
+            "user_id": user_id,
+            "intent": intent,
+            "message": message,
+            "response": response,
+            "timestamp": datetime.now(timezone.utc),
+        })
+        if not accepted:
+            logger.warning("Write buffer full; chat interaction not persisted")
+
+    async def flush(self) -> None:
+        await self.writer.flush()
@@ -1,12 +1,15 @@
 # services/soil_service.py
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from models.farmer_models import SoilData, CropRecommendation, CropRecommendationResponse
+from utils.content_catalog import ContentCatalog, get_catalog
 
 logger = logging.getLogger(__name__)
 
 class SoilService:
-    def __init__(self):
+    def __init__(self, catalog: ContentCatalog = None):
+        # Farmer-facing text (reasons, advice) is rendered from catalog templates
+        self.catalog = catalog or get_catalog()
         self.crop_database = self._initialize_crop_database()
         self.seasonal_crops = self._initialize_seasonal_crops()
 
@@ -70,13 +73,14 @@ class SoilService:
             "organic_carbon": soil_data.organic_carbon or 0.7,
         }
 
-    async def get_crop_recommendations(self, soil_data: SoilData) -> CropRecommendationResponse:
+    async def get_crop_recommendations(self, soil_data: SoilData, lang: Optional[str] = None) -> CropRecommendationResponse:
         """
         Recommend crops based on normalized soil parameters.
         """
         try:
             normalized = self._normalize_input(soil_data)
             recommendations = []
+            precautions = self.catalog.texts(self.catalog.soil["precautions"], lang)
 
             for crop_name, crop_info in self.crop_database.items():
                 score = self._calculate_suitability_score(normalized, crop_info)
@@ -87,15 +91,16 @@ class SoilService:
                         suitability_score=round(score, 1),
                         expected_yield=self._estimate_yield(crop_info, score),
                         season="N/A",
-                        reasons=[f"pH {normalized['ph']} in range {crop_info['ph_range']}"],
-                        precautions=["Ensure irrigation as per crop needs"],
+                        reasons=[self.catalog.render("soil.reason.ph", lang, ph=normalized["ph"],
+                                                     ph_min=crop_info["ph_range"][0], ph_max=crop_info["ph_range"][1])],
+                        precautions=precautions,
                     )
                     recommendations.append(recommendation)
 
             return CropRecommendationResponse(
                 recommendations=recommendations,
                 soil_health_status=self._assess_soil_health(normalized),
-                general_advice=["Use organic compost", "Perform soil test every season"]
+                general_advice=self.catalog.texts(self.catalog.soil["general_advice"], lang)
             )
         except Exception as e:
             logger.error(f"Error generating crop recommendations: {e}")
@@ -134,7 +139,7 @@ class SoilService:
             return "Good"
         return "Needs Improvement"
 
-    async def get_seasonal_recommendations(self, season: str, region: str) -> Dict[str, Any]:
+    async def get_seasonal_recommendations(self, season: str, region: str, lang: Optional[str] = None) -> Dict[str, Any]:
         """
         Recommend crops based on season and region (simplified farmer-friendly).
         """
@@ -159,7 +164,8 @@ class SoilService:
                         "ideal_ph": info["ph_range"],
                         "water_requirement": info["water_requirement"],
                         "yield_potential": info["yield_potential"],
-                        "suitability_reason": f"Traditionally grown in {region.title()} during {season.title()} season."
+                        "suitability_reason": self.catalog.render("soil.seasonal.reason", lang,
+                                                                  region=region.title(), season=season.title())
                     })
                 else:
                     recommendations.append({"crop_name": crop, "note": "Basic seasonal crop"})
@@ -0,0 +1,265 @@
+# services/sync_service.py
+"""
+Delta sync for intermittently connected clients.
+
+One /sync call replaces the app's separate dashboard, weather, market and
+alert requests. The client sends back the opaque token from its previous
+sync and receives only what changed since then:
+
+- market prices for its crops whose change sequence moved past the token
+- the forecast, if it differs from the one the client already has
+- alert episodes that are new or changed since the last sync
+- the catalog version/ETag, if the catalog changed
+
+The token itself carries the cheap cursors (publication time of the
+newest price, forecast digest, catalog version). The set of alerts
+already delivered is kept server-side per user, keyed by a generation
+number that the token echoes.
+
+Whenever that alert cursor cannot be used - no token, a malformed one, a
+client retrying with an older token after a lost response, or a cursor
+that expired - the response is a full sync: every section is sent and
+`full` is true, so the client replaces what it holds instead of merging.
+
+With a writer and client_factory, alert cursors are stored per user
+(`sync_cursors/<user_id>`) and any worker can continue any client's
+deltas. Without them they live in the worker's memory, and a token from
+another worker or an earlier process (its epoch) means a full sync.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from services.alert_service import EpisodeRef, continue_episodes, episode_ref
+
+logger = logging.getLogger(__name__)
+
+TOKEN_VERSION = 1
+# Token field -> accepted types; with in-memory cursors "g" is only valid within the issuing epoch "e"
+TOKEN_FIELDS = {"e": (str,), "g": (int,), "m": (int,), "k": (str,), "f": (str, type(None)), "c": (str,)}
+
+
+@dataclass(slots=True)
+class SyncCursor:
+    """Server-side state from the last sync sent to one user."""
+    generation: int
+    alert_keys: FrozenSet[str]
+    updated_at: float
+    episodes: Tuple[EpisodeRef, ...] = ()   # the episodes behind alert_keys, for continue_episodes()
+
+
+class SyncCursorStore:
+    """
+    Per-user sync cursors with TTL expiry and an LRU cap on the number of
+    users. With a writer and client_factory every cursor is also written
+    to its user's document, and get() (blocking) prefers whichever of the
+    stored and local copies is newer, so workers share cursors.
+    """
+
+    def __init__(self, ttl_seconds: float = 7 * 24 * 3600, max_users: int = 100_000, writer=None,
+                 client_factory: Optional[Callable[[], Any]] = None, collection: str = "sync_cursors"):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.writer = writer
+        self._client_factory = client_factory
+        self._client = None
+        self.collection = collection
+        self._cursors: "OrderedDict[str, SyncCursor]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cursors)
+
+    @property
+    def shared(self) -> bool:
+        return self.writer is not None and self._client_factory is not None
+
+    @property
+    def client(self):
+        if self._client is None and self._client_factory is not None:
+            self._client = self._client_factory()
+        return self._client
+
+    def _stored(self, user_id: str) -> Optional[SyncCursor]:
+        snapshot = self.client.collection(self.collection).document(user_id).get()
+        data = snapshot.to_dict() if snapshot.exists else None
+        if not data:
+            return None
+        try:
+            return SyncCursor(int(data["generation"]), frozenset(data.get("alert_keys") or ()),
+                              float(data["updated_at"]), tuple(EpisodeRef(*e) for e in data.get("episodes") or ()))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Ignoring malformed sync cursor of {user_id}: {e}")
+            return None
+
+    def get(self, user_id: str) -> Optional[SyncCursor]:
+        stored = self._stored(user_id) if self.shared else None
+        with self._lock:
+            cursor = self._cursors.get(user_id)
+            if stored is not None and (cursor is None or stored.generation > cursor.generation):
+                cursor = self._cursors[user_id] = stored
+            if cursor is None:
+                return None
+            if time.time() - cursor.updated_at > self.ttl_seconds:
+                del self._cursors[user_id]
+                return None
+            self._cursors.move_to_end(user_id)
+            return cursor
+
+    def advance(self, user_id: str, alert_keys: FrozenSet[str], episodes: Tuple[EpisodeRef, ...] = ()) -> int:
+        """Store the alerts just sent and return the new generation (call get() first)."""
+        with self._lock:
+            previous = self._cursors.get(user_id)
+            generation = previous.generation + 1 if previous else 1
+            cursor = SyncCursor(generation, alert_keys, time.time(), episodes)
+            self._cursors[user_id] = cursor
+            self._cursors.move_to_end(user_id)
+            while len(self._cursors) > self.max_users:
+                self._cursors.popitem(last=False)
+        if self.writer is not None:
+            self.writer.write_nowait(self.collection, {
+                "user_id": user_id, "generation": generation, "alert_keys": sorted(alert_keys),
+                "episodes": [list(e) for e in episodes], "updated_at": cursor.updated_at,
+            }, doc_id=user_id)
+        return generation
+
+    def clear(self, user_id: str) -> None:
+        with self._lock:
+            self._cursors.pop(user_id, None)
+
+
+def encode_token(state: Dict[str, Any]) -> str:
+    raw = json.dumps(state, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_token(token: Optional[str]) -> Dict[str, Any]:
+    """Token state, or {} for a missing or malformed token (full sync)."""
+    if not token:
+        return {}
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw)
+    except (ValueError, TypeError):
+        return {}
+    if not isinstance(state, dict) or state.get("v") != TOKEN_VERSION:
+        return {}
+    for name, types in TOKEN_FIELDS.items():
+        value = state.get(name)
+        if name in state and (not isinstance(value, types) or isinstance(value, bool)):
+            return {}
+    return state
+
+
+def forecast_digest(forecast: List[Dict[str, Any]]) -> str:
+    raw = json.dumps(forecast, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def alert_key(alert: Dict[str, Any]) -> str:
+    """Changes when an episode is new or its severity or message changed."""
+    return f"{alert['episode_id']}:{alert['fingerprint']}"
+
+
+class SyncService:
+    def __init__(self, market_service, alert_service, catalog, weather_service=None,
+                 cursors: Optional[SyncCursorStore] = None, weather_timeout: float = 5.0):
+        self.market_service = market_service
+        self.alert_service = alert_service
+        self.weather_service = weather_service
+        self.catalog = catalog
+        self.cursors = cursors if cursors is not None else SyncCursorStore()
+        self.weather_timeout = weather_timeout
+        # In-memory alert cursors do not survive a restart;
+        # tokens from another epoch then fall back to a full sync
+        self.epoch = secrets.token_hex(4)
+
+    async def _market_delta(self, since: int, crops: List[str]) -> Dict[str, Any]:
+        latest, changed = self.market_service.changed_since(since, crops)
+        prices = await asyncio.gather(*(self.market_service.get_crop_prices(c) for c in changed))
+        return {"latest": latest, "prices": {p["crop"]: p for p in prices if "error" not in p}}
+
+    async def _forecast(self, lat: float, lon: float, days: int) -> Optional[Dict[str, Any]]:
+        if self.weather_service is None:
+            return None
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(self.weather_service.get_weather_forecast, lat, lon, days),
+                timeout=self.weather_timeout)
+        except Exception as e:
+            logger.warning(f"Sync forecast unavailable for ({lat}, {lon}): {e}")
+            return None
+
+    async def sync(self, user_id: str, token: Optional[str], crops: List[str],
+                   lat: Optional[float] = None, lon: Optional[float] = None,
+                   days: int = 5, lang: Optional[str] = None) -> Dict[str, Any]:
+        state = decode_token(token)
+        if self.cursors.shared:
+            cursor = await asyncio.to_thread(self.cursors.get, user_id)
+        else:
+            cursor = self.cursors.get(user_id)
+        # In-memory cursors of another worker (or an earlier process) mean nothing here
+        same_process = self.cursors.shared or state.get("e") == self.epoch
+        full = not (state and same_process and cursor is not None and cursor.generation == state.get("g"))
+        if full:
+            # Every section is sent, so the client can replace what it holds
+            state = {}
+        crops = sorted({c.lower() for c in crops})
+        crops_digest = hashlib.blake2b(",".join(crops).encode("utf-8"), digest_size=4).hexdigest()
+        # A changed crop list needs every price again, not just changed ones
+        market_since = state.get("m", 0) if state.get("k") == crops_digest else 0
+
+        # Market and weather are independent; fetch them concurrently
+        lookups = [self._market_delta(market_since, crops)]
+        if lat is not None and lon is not None:
+            lookups.append(self._forecast(lat, lon, days))
+        results = await asyncio.gather(*lookups)
+        market = results[0]
+        forecast = results[1] if len(results) > 1 else None
+
+        sent = frozenset() if full else cursor.alert_keys
+        # Episode identity follows the latest cursor whatever token came back, so a resend keeps its ids
+        previous = cursor.episodes if cursor else ()
+
+        delta: Dict[str, Any] = {"full": full, "prices": market["prices"]}
+        digest = state.get("f")
+        current_keys, current_episodes = sent, previous
+        if forecast is not None:
+            daily = forecast["forecast"]
+            new_digest = forecast_digest(daily)
+            if new_digest != digest:
+                delta["forecast"] = {"city": forecast["city"], "forecast": daily}
+            digest = new_digest
+
+            # Alert episodes are re-derived from the current forecast; only new or changed ones are sent
+            keys = set()
+            refs = []
+            alerts = []
+            for crop in crops:
+                raw = self.alert_service.generate_weather_alerts(daily, crop, lang)
+                for episode in continue_episodes(self.alert_service.merge_episodes(raw, crop), previous):
+                    key = alert_key(episode)
+                    keys.add(key)
+                    refs.append(episode_ref(episode))
+                    if key not in sent:
+                        alerts.append(episode)
+            delta["alerts"] = alerts
+            current_keys, current_episodes = frozenset(keys), tuple(refs)
+
+        if state.get("c") != self.catalog.version:
+            delta["catalog"] = {"version": self.catalog.version, "etag": self.catalog.etag}
+
+        generation = self.cursors.advance(user_id, current_keys, current_episodes)
+        delta["sync_token"] = encode_token({
+            "v": TOKEN_VERSION, "e": self.epoch, "g": generation,
+            "m": market["latest"], "k": crops_digest, "f": digest, "c": self.catalog.version,
+        })
+        return delta
@@ -0,0 +1,295 @@
+# services/voice_service.py
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import wave
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
+
+from models.farmer_models import TTSRequest
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CHUNK_SIZE = 32 * 1024
+
+
+# -----------------------------
+# Speech engines
+# -----------------------------
+class SpeechEngine(ABC):
+    """Pluggable text-to-speech / speech-to-text backend."""
+    name = "base"
+    audio_format = "wav"
+    media_type = "audio/wav"
+
+    @abstractmethod
+    def synthesize(self, text: str, language: str, voice_type: str) -> bytes:
+        """Return encoded audio for the given text."""
+
+    @abstractmethod
+    def transcribe(self, audio: bytes, language: str) -> str:
+        """Return the transcript of the given audio."""
+
+
+class OfflineSpeechEngine(SpeechEngine):
+    """
+    CPU-only engine for deployments without network access.
+    TTS uses the espeak-ng binary; STT uses a local Vosk model (VOSK_MODEL_DIR).
+    """
+    name = "offline"
+
+    VOICE_VARIANTS = {"female": "+f3", "male": "+m3"}
+
+    def __init__(self, espeak_binary: Optional[str] = None, vosk_model_dir: Optional[str] = None):
+        self.espeak_binary = espeak_binary or shutil.which("espeak-ng") or shutil.which("espeak")
+        self.vosk_model_dir = vosk_model_dir or os.getenv("VOSK_MODEL_DIR")
+        self._vosk_models: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def synthesize(self, text: str, language: str, voice_type: str) -> bytes:
+        if not self.espeak_binary:
+            raise RuntimeError("❌ espeak-ng not installed; offline TTS unavailable.")
+        voice = language + self.VOICE_VARIANTS.get(voice_type or "female", "")
+        # Write to a file rather than stdout so the WAV header carries the real length
+        with tempfile.NamedTemporaryFile(suffix=".wav") as out:
+            result = subprocess.run(
+                [self.espeak_binary, "-v", voice, "-w", out.name, text],
+                capture_output=True, timeout=30, check=False
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"❌ espeak-ng failed: {result.stderr.decode(errors='ignore')}")
+            return out.read()
+
+    def _vosk_model(self, language: str):
+        from vosk import Model  # optional dependency
+
+        with self._lock:
+            if language not in self._vosk_models:
+                path = os.path.join(self.vosk_model_dir, language)
+                if not os.path.isdir(path):
+                    path = self.vosk_model_dir
+                self._vosk_models[language] = Model(path)
+            return self._vosk_models[language]
+
+    def transcribe(self, audio: bytes, language: str) -> str:
+        if not self.vosk_model_dir:
+            raise RuntimeError("❌ VOSK_MODEL_DIR not set; offline STT unavailable.")
+        from vosk import KaldiRecognizer
+
+        with wave.open(io.BytesIO(audio), "rb") as wav:
+            recognizer = KaldiRecognizer(self._vosk_model(language), wav.getframerate())
+            while True:
+                frames = wav.readframes(4000)
+                if not frames:
+                    break
+                recognizer.AcceptWaveform(frames)
+        return json.loads(recognizer.FinalResult()).get("text", "")
+
+
+class GoogleSpeechEngine(SpeechEngine):
+    """Google Cloud Text-to-Speech / Speech-to-Text engine."""
+    name = "google"
+
+    LANGUAGE_CODES = {"hi": "hi-IN", "en": "en-IN", "pa": "pa-IN", "mr": "mr-IN",
+                      "ta": "ta-IN", "te": "te-IN", "bn": "bn-IN", "gu": "gu-IN"}
+
+    def __init__(self):
+        from google.cloud import speech, texttospeech
+
+        self._tts_module = texttospeech
+        self._stt_module = speech
+        self._tts = texttospeech.TextToSpeechClient()
+        self._stt = speech.SpeechClient()
+
+    def _language_code(self, language: str) -> str:
+        return self.LANGUAGE_CODES.get(language, language)
+
+    def synthesize(self, text: str, language: str, voice_type: str) -> bytes:
+        tts = self._tts_module
+        gender = (tts.SsmlVoiceGender.MALE if voice_type == "male"
+                  else tts.SsmlVoiceGender.FEMALE)
+        response = self._tts.synthesize_speech(
+            input=tts.SynthesisInput(text=text),
+            voice=tts.VoiceSelectionParams(language_code=self._language_code(language),
+                                           ssml_gender=gender),
+            audio_config=tts.AudioConfig(audio_encoding=tts.AudioEncoding.LINEAR16)
+        )
+        return response.audio_content
+
+    def transcribe(self, audio: bytes, language: str) -> str:
+        stt = self._stt_module
+        response = self._stt.recognize(
+            config=stt.RecognitionConfig(language_code=self._language_code(language)),
+            audio=stt.RecognitionAudio(content=audio)
+        )
+        return " ".join(r.alternatives[0].transcript for r in response.results if r.alternatives)
+
+
+def create_speech_engine(name: Optional[str] = None) -> SpeechEngine:
+    """Build the engine named by VOICE_ENGINE (default: offline)."""
+    name = (name or os.getenv("VOICE_ENGINE", "offline")).lower()
+    if name == "google":
+        return GoogleSpeechEngine()
+    if name == "offline":
+        return OfflineSpeechEngine()
+    raise ValueError(f"Unknown voice engine: {name}")
+
+
+# -----------------------------
+# On-disk audio cache
+# -----------------------------
+class AudioCache:
+    """
+    Size-bounded on-disk LRU of synthesized audio, keyed by content hash.
+
+    The directory is shared by all workers: file mtimes are the recency
+    (get() touches the file), an index miss falls back to the disk, and
+    every put() rescans the directory and evicts the least recently used
+    files until the directory itself fits in max_bytes. The in-memory
+    index is only this worker's view of that directory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, extension: str = "wav"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def make_key(text: str, language: str, voice_type: str, engine: str) -> str:
+        raw = "\0".join([engine, language, voice_type or "", text.strip()])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def _scan(self) -> None:
+        """Rebuild the index from the directory (oldest first) and evict down to max_bytes."""
+        files = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith("." + self.extension):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:   # evicted by another worker meanwhile
+                        continue
+                    files.append((stat.st_mtime, entry.name[:-len(self.extension) - 1], stat.st_size))
+        files.sort()
+        total = sum(size for _, _, size in files)
+        while total > self.max_bytes and len(files) > 1:
+            _, key, size = files.pop(0)
+            total -= size
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._entries = OrderedDict((key, size) for _, key, size in files)
+            self._total_bytes = total
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.{self.extension}")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+            # Possibly written by another worker since this one last scanned
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+            return None
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = size
+                self._total_bytes += size
+            self._entries.move_to_end(key)
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # atomic, readers never see partial files
+        # Other workers write here too: bound the directory, not this worker's share of it
+        self._scan()
+        return path
+
+
+# -----------------------------
+# Voice service
+# -----------------------------
+class VoiceService:
+    """Text-to-speech and speech-to-text with cached synthesis."""
+
+    def __init__(self, engine: Optional[SpeechEngine] = None, cache: Optional[AudioCache] = None):
+        self.engine = engine or create_speech_engine()
+        self.cache = cache or AudioCache(
+            os.getenv("VOICE_CACHE_DIR", os.path.join("cache", "tts")),
+            max_bytes=int(os.getenv("VOICE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            extension=self.engine.audio_format
+        )
+        # Concurrent requests for the same sentence share one synthesis
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def synthesize(self, request: TTSRequest) -> Tuple[str, str]:
+        """Return (cache_key, path) for the request, synthesizing only on a cache miss."""
+        voice_type = request.voice_type or "female"
+        key = AudioCache.make_key(request.text, request.language, voice_type, self.engine.name)
+
+        path = self.cache.get(key)
+        if path:
+            return key, path
+
+        if key in self._in_flight:
+            return key, await asyncio.shield(self._in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            audio = await asyncio.to_thread(self.engine.synthesize, request.text,
+                                            request.language, voice_type)
+            path = await asyncio.to_thread(self.cache.put, key, audio)
+            future.set_result(path)
+            return key, path
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def transcribe(self, audio: bytes, language: str) -> str:
+        return await asyncio.to_thread(self.engine.transcribe, audio, language)
+
+    def audio_path(self, key: str) -> Optional[str]:
+        return self.cache.get(key)
+
+    @staticmethod
+    def duration(path: str) -> Optional[float]:
+        """Duration in seconds for WAV files; None for other formats."""
+        try:
+            with wave.open(path, "rb") as wav:
+                return round(wav.getnframes() / float(wav.getframerate()), 2)
+        except (wave.Error, EOFError):
+            return None
+
+    @staticmethod
+    def iter_file(path: str, chunk_size: int = AUDIO_CHUNK_SIZE) -> Iterator[bytes]:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
@@ -0,0 +1,285 @@
+# services/weather_grid.py
+"""
+Local gridded weather store.
+
+Bulk forecast files for a regular lat/lon grid are ingested offline
+(see ingest_weather_grid.py). Each ingestion writes a new version
+directory, and a one-line CURRENT file names the published one:
+
+    CURRENT                      version name, replaced atomically
+    versions/<version>/
+        values.npy  float32 array of shape (cells, times, variables),
+                    cell = lat_index * nlon + lon_index
+        meta.json   grid origin/spacing, forecast times (unix seconds, UTC),
+                    variable names and optional per-cell place names
+
+Switching CURRENT is the only publish step, so a reader always opens a
+values/meta pair from the same ingestion. (A directory holding values.npy
+and meta.json directly, from before versioning, is still read.)
+
+values.npy is opened memory-mapped, so every worker shares the page
+cache and a point lookup touches only the four surrounding cells.
+Forecast and current conditions for any lat/lon are bilinear
+interpolations of those cells, shaped like WeatherService's upstream
+responses. Points outside the grid, or a grid whose forecast window no
+longer covers the request, return None and the caller falls back to
+the upstream API.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRID_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "weather_grid")
+VALUES_FILE = "values.npy"
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+KEEP_VERSIONS = 3
+
+# Variables every grid must provide, in the order stored on the last axis
+VARIABLES = ("temp", "humidity", "rain_3h", "pressure", "wind_speed")
+STEP_SECONDS = 3 * 3600
+
+
+class WeatherGrid:
+    def __init__(self, values: np.ndarray, meta: Dict[str, Any]):
+        self.values = values
+        self.lat0 = float(meta["lat0"])
+        self.lon0 = float(meta["lon0"])
+        self.dlat = float(meta["dlat"])
+        self.dlon = float(meta["dlon"])
+        self.nlat = int(meta["nlat"])
+        self.nlon = int(meta["nlon"])
+        self.times = np.asarray(meta["times"], dtype=np.int64)
+        self.names: Optional[List[Optional[str]]] = meta.get("names")
+        self.ingested_at = meta.get("ingested_at")
+        self._var = {name: i for i, name in enumerate(meta["variables"])}
+        missing = [v for v in VARIABLES if v not in self._var]
+        if missing:
+            raise ValueError(f"❌ Weather grid is missing variables: {missing}")
+        if values.shape != (self.nlat * self.nlon, len(self.times), len(meta["variables"])):
+            raise ValueError(f"❌ Weather grid shape {values.shape} does not match meta.json")
+        self._dt_txt = [datetime.fromtimestamp(int(t), tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                        for t in self.times]
+
+    @classmethod
+    def open(cls, directory: str) -> "WeatherGrid":
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        values = np.load(os.path.join(directory, VALUES_FILE), mmap_mode="r")
+        return cls(values, meta)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.values.shape
+
+    def _corners(self, lat: float, lon: float) -> Optional[Tuple[np.ndarray, np.ndarray, int]]:
+        """Cell indices and bilinear weights of the four surrounding cells, plus the nearest cell."""
+        y = (lat - self.lat0) / self.dlat
+        x = (lon - self.lon0) / self.dlon
+        if not (0 <= y <= self.nlat - 1 and 0 <= x <= self.nlon - 1):
+            return None
+        i0 = min(int(y), max(self.nlat - 2, 0))
+        j0 = min(int(x), max(self.nlon - 2, 0))
+        i1 = min(i0 + 1, self.nlat - 1)
+        j1 = min(j0 + 1, self.nlon - 1)
+        fy = y - i0
+        fx = x - j0
+        cells = np.array([i0 * self.nlon + j0, i0 * self.nlon + j1,
+                          i1 * self.nlon + j0, i1 * self.nlon + j1])
+        weights = np.array([(1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx])
+        nearest = int(round(y)) * self.nlon + int(round(x))
+        return cells, weights, nearest
+
+    def interpolate(self, lat: float, lon: float, time_slice: slice = slice(None)) -> Optional[np.ndarray]:
+        """
+        (times, variables) series at a point. Corners with missing data (NaN)
+        are dropped and the remaining weights renormalized.
+        """
+        corners = self._corners(lat, lon)
+        if corners is None:
+            return None
+        cells, weights, _ = corners
+        block = np.asarray(self.values[cells, time_slice, :], dtype=np.float64)   # (4, T, V)
+        present = ~np.isnan(block)
+        w = weights[:, None, None] * present
+        total = w.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            series = (np.where(present, block, 0.0) * w).sum(axis=0) / total
+        return series
+
+    def place_name(self, lat: float, lon: float) -> Optional[str]:
+        corners = self._corners(lat, lon)
+        if corners is None or not self.names:
+            return None
+        return self.names[corners[2]]
+
+    def _window(self, now: float) -> int:
+        """Index of the forecast slot covering `now`."""
+        return max(int(np.searchsorted(self.times, now, side="right")) - 1, 0)
+
+    def current(self, lat: float, lon: float, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        now = time.time() if now is None else now
+        if not len(self.times) or now < self.times[0] or now >= self.times[-1] + STEP_SECONDS:
+            return None
+        index = self._window(now)
+        series = self.interpolate(lat, lon, slice(index, index + 1))
+        if series is None or np.isnan(series).any():
+            return None
+        row = series[0]
+        rain = float(row[self._var["rain_3h"]])
+        return {
+            "temperature": round(float(row[self._var["temp"]]), 1),
+            "humidity": int(round(float(row[self._var["humidity"]]))),
+            "pressure": int(round(float(row[self._var["pressure"]]))),
+            "weather_condition": "moderate rain" if rain >= 2.5 else "light rain" if rain > 0.1 else "clear sky",
+            "wind_speed": round(float(row[self._var["wind_speed"]]), 1),
+            "city": self.place_name(lat, lon) or "Unknown",
+        }
+
+    def forecast_entries(self, lat: float, lon: float, days: int,
+                         now: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Remaining 3-hourly entries in the upstream "list" format, or None if
+        the point is off-grid or the grid covers fewer than `days` dates.
+        """
+        now = time.time() if now is None else now
+        if not len(self.times) or now >= self.times[-1] + STEP_SECONDS:
+            return None
+        start = self._window(now)
+        dates = {t[:10] for t in self._dt_txt[start:]}
+        if len(dates) < days:
+            return None
+        series = self.interpolate(lat, lon, slice(start, None))
+        if series is None or np.isnan(series).any():
+            return None
+        temp, humidity, rain = (series[:, self._var[v]] for v in ("temp", "humidity", "rain_3h"))
+        return [
+            {
+                "dt_txt": self._dt_txt[start + k],
+                "main": {"temp": round(float(temp[k]), 2), "humidity": int(round(float(humidity[k])))},
+                "rain": {"3h": round(float(rain[k]), 2)},
+            }
+            for k in range(len(series))
+        ]
+
+
+def published_dir(directory: str) -> Optional[str]:
+    """Directory of the published grid version, or None if nothing is published."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        return os.path.join(directory, VERSIONS_DIR, version)
+    except FileNotFoundError:
+        legacy = os.path.join(directory, META_FILE)
+        return directory if os.path.exists(legacy) else None
+
+
+class WeatherGridStore:
+    """
+    The current WeatherGrid for a directory. Ingestion publishes a new
+    version by replacing CURRENT; the store notices and reopens, checking
+    at most every `check_interval` seconds.
+    """
+
+    def __init__(self, directory: str = DEFAULT_GRID_DIR, check_interval: float = 60.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._grid: Optional[WeatherGrid] = None
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reload()
+
+    def _reload(self) -> None:
+        path = published_dir(self.directory)
+        if path is None:
+            self._grid = None
+            return
+        try:
+            # Unversioned grids are told apart by meta.json's mtime
+            version = path if path != self.directory else f"{path}@{os.stat(os.path.join(path, META_FILE)).st_mtime}"
+            if version == self._version and self._grid is not None:
+                return
+            self._grid = WeatherGrid.open(path)
+            self._version = version
+            logger.info(f"Loaded weather grid {self._grid.shape} from {path}")
+        except Exception as e:
+            logger.error(f"❌ Failed to load weather grid from {path}: {e}")
+
+    @property
+    def grid(self) -> Optional[WeatherGrid]:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    self._reload()
+        return self._grid
+
+    def current(self, lat: float, lon: float) -> Optional[Dict[str, Any]]:
+        grid = self.grid
+        return grid.current(lat, lon) if grid else None
+
+    def forecast(self, lat: float, lon: float, days: int) -> Optional[Tuple[Optional[str], List[Dict[str, Any]]]]:
+        """(place name, upstream-style 3-hourly entries) or None."""
+        grid = self.grid
+        if grid is None:
+            return None
+        entries = grid.forecast_entries(lat, lon, days)
+        return (grid.place_name(lat, lon), entries) if entries is not None else None
+
+
+def allocate_values(directory: str, ncells: int, ntimes: int,
+                    nvars: int = len(VARIABLES)) -> np.ndarray:
+    """
+    NaN-filled, disk-backed array in a new (unpublished) version directory
+    to ingest into; published by publish_grid().
+    """
+    version = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(directory, VERSIONS_DIR, version)
+    os.makedirs(path)
+    values = np.lib.format.open_memmap(os.path.join(path, VALUES_FILE), mode="w+",
+                                       dtype=np.float32, shape=(ncells, ntimes, nvars))
+    values[:] = np.nan
+    return values
+
+
+def publish_grid(directory: str, values: np.ndarray, lats: Sequence[float], lons: Sequence[float],
+                 times: Sequence[int], names: Optional[List[Optional[str]]] = None,
+                 variables: Sequence[str] = VARIABLES) -> None:
+    """Atomically replace the published grid with an allocated one."""
+    values.flush()
+    path = os.path.dirname(os.path.abspath(values.filename))
+    meta = {
+        "lat0": float(lats[0]), "dlat": float(lats[1] - lats[0]) if len(lats) > 1 else 1.0, "nlat": len(lats),
+        "lon0": float(lons[0]), "dlon": float(lons[1] - lons[0]) if len(lons) > 1 else 1.0, "nlon": len(lons),
+        "times": [int(t) for t in times],
+        "variables": list(variables),
+        "names": names,
+        "ingested_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    # The only step readers can observe: CURRENT now names the complete version
+    tmp_current = os.path.join(directory, f".{CURRENT_FILE}.tmp")
+    with open(tmp_current, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(path) + "\n")
+    os.replace(tmp_current, os.path.join(directory, CURRENT_FILE))
+
+    # Old versions go once a few newer ones exist (open memory maps keep their files alive)
+    versions = sorted(os.listdir(os.path.join(directory, VERSIONS_DIR)))
+    for old in versions[:-KEEP_VERSIONS]:
+        if old != os.path.basename(path):
+            shutil.rmtree(os.path.join(directory, VERSIONS_DIR, old), ignore_errors=True)
@@ -2,8 +2,11 @@
 import os
 import requests
 import logging
+import time
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from utils.metrics import WEATHER_LOOKUPS, WEATHER_UPSTREAM_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -11,22 +14,46 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 class WeatherService:
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None, timeout: float = 10.0, grid=None):
         self.api_key = os.getenv("OPENWEATHER_API_KEY")
-        if not self.api_key:
+        # Lookups are served from the local WeatherGridStore when it covers the
+        # point; OpenWeather is the fallback
+        self.grid = grid
+        if not self.api_key and grid is None:
             raise ValueError("❌ OPENWEATHER_API_KEY not found in environment.")
-        self.base_url = "https://api.openweathermap.org/data/2.5"
+        self.base_url = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+        # A shared session reuses pooled keep-alive connections across requests
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def _get(self, endpoint: str, params: dict):
+        """Call the OpenWeather API, recording upstream latency."""
+        if not self.api_key:
+            raise Exception("No local weather data for this location and no OPENWEATHER_API_KEY")
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = self.session.get(f"{self.base_url}/{endpoint}", params=params, timeout=self.timeout)
+            status = str(response.status_code)
+            return response
+        finally:
+            WEATHER_UPSTREAM_SECONDS.observe(time.perf_counter() - start, endpoint, status)
 
     def get_current_weather(self, latitude: float, longitude: float):
         """Fetch current weather data (formatted)."""
-        url = f"{self.base_url}/weather"
+        if self.grid is not None:
+            weather = self.grid.current(latitude, longitude)
+            if weather is not None:
+                WEATHER_LOOKUPS.inc("current", "grid")
+                return weather
+        WEATHER_LOOKUPS.inc("current", "upstream")
         params = {
             "lat": latitude,
             "lon": longitude,
             "appid": self.api_key,
             "units": "metric"
         }
-        response = requests.get(url, params=params)
+        response = self._get("weather", params)
         data = response.json()
 
         if response.status_code != 200:
@@ -45,24 +72,36 @@ class WeatherService:
     def get_weather_forecast(self, latitude: float, longitude: float, days: int = 5):
         """
         Fetch and format weather forecast (3-hourly → daily summary).
-        Uses OpenWeather 5-day forecast API.
+        Uses the local grid when it covers the point, else the OpenWeather 5-day forecast API.
         """
-        url = f"{self.base_url}/forecast"
+        if self.grid is not None:
+            local = self.grid.forecast(latitude, longitude, days)
+            if local is not None:
+                WEATHER_LOOKUPS.inc("forecast", "grid")
+                city, entries = local
+                return {"city": city, "forecast": self.aggregate_daily(entries, days)}
+        WEATHER_LOOKUPS.inc("forecast", "upstream")
         params = {
             "lat": latitude,
             "lon": longitude,
             "appid": self.api_key,
             "units": "metric"
         }
-        response = requests.get(url, params=params)
+        response = self._get("forecast", params)
         data = response.json()
 
         if response.status_code != 200:
             logger.error(f"Forecast API error: {data}")
             raise Exception(data.get("message", "Failed to fetch forecast"))
 
-        # Aggregate into daily forecasts
-        forecast_list = data.get("list", [])
+        return {
+            "city": data.get("city", {}).get("name"),
+            "forecast": self.aggregate_daily(data.get("list", []), days)
+        }
+
+    @staticmethod
+    def aggregate_daily(forecast_list: List[Dict], days: int) -> List[Dict]:
+        """Aggregate 3-hourly forecast entries into per-day min/max temp, rain and mean humidity."""
         daily_data = {}
 
         for entry in forecast_list:
@@ -94,7 +133,4 @@ class WeatherService:
                 "humidity": sum(values["humidity"]) // len(values["humidity"])
             })
 
-        return {
-            "city": data.get("city", {}).get("name"),
-            "forecast": formatted_forecast
-        }
\ No newline at end of file
+        return formatted_forecast
@@ -0,0 +1,195 @@
+# tests/test_alert_service.py
+"""Episode merging, continuation across forecast windows, and the alert ledger."""
+from datetime import date, timedelta
+
+import pytest
+
+from services.alert_service import AlertLedger, AlertService, continue_episodes, episode_ref
+from utils.firestore_memory import InMemoryFirestore
+
+TODAY = date(2026, 10, 19)
+
+
+def _day(offset: int) -> str:
+    return (TODAY + timedelta(days=offset)).isoformat()
+
+
+def _alert(alert_type: str, offset: int, severity: str = "medium") -> dict:
+    return {"type": alert_type, "date": _day(offset), "severity": severity,
+            "message": f"{alert_type} ({severity})", "message_id": f"test.{alert_type}.{severity}"}
+
+
+@pytest.fixture(scope="module")
+def service():
+    return AlertService()
+
+
+# -----------------------------
+# merge_episodes
+# -----------------------------
+def test_consecutive_days_merge_at_worst_severity(service):
+    alerts = [_alert("Heat Stress", 0), _alert("Heat Stress", 1, "high"), _alert("Heat Stress", 2)]
+    [episode] = service.merge_episodes(alerts, "wheat")
+    assert (episode["start_date"], episode["end_date"], episode["days"]) == (_day(0), _day(2), 3)
+    assert episode["severity"] == "high"
+    assert episode["message_id"] == "test.Heat Stress.high"
+
+
+def test_same_family_same_day_keeps_the_more_severe(service):
+    alerts = [_alert("Drought Risk", 0, "low"), _alert("Drought Stress", 0, "high")]
+    [episode] = service.merge_episodes(alerts, "wheat")
+    assert episode["type"] == "Drought Stress"
+    assert episode["family"] == "drought"
+
+
+def test_gap_splits_episodes_and_most_severe_comes_first(service):
+    alerts = [_alert("Heat Stress", 0), _alert("Heat Stress", 2), _alert("Frost Risk", 1, "critical")]
+    episodes = service.merge_episodes(alerts, "wheat")
+    assert [(e["family"], e["start_date"]) for e in episodes] == [
+        ("cold", _day(1)), ("heat", _day(0)), ("heat", _day(2))]
+    assert len({e["episode_id"] for e in episodes}) == 3
+
+
+def test_identity_ignores_end_date_but_fingerprint_tracks_severity(service):
+    [short] = service.merge_episodes([_alert("Heat Stress", 0), _alert("Heat Stress", 1)], "wheat")
+    [longer] = service.merge_episodes([_alert("Heat Stress", d) for d in range(3)], "wheat")
+    [worse] = service.merge_episodes([_alert("Heat Stress", 0, "high")], "wheat")
+    assert short["episode_id"] == longer["episode_id"] == worse["episode_id"]
+    assert short["fingerprint"] == longer["fingerprint"] != worse["fingerprint"]
+
+
+def test_crop_is_part_of_the_episode_identity(service):
+    [wheat] = service.merge_episodes([_alert("Heat Stress", 0)], "wheat")
+    [rice] = service.merge_episodes([_alert("Heat Stress", 0)], "rice")
+    assert wheat["episode_id"] != rice["episode_id"]
+
+
+# -----------------------------
+# continue_episodes
+# -----------------------------
+def test_sliding_window_continues_the_previous_episode(service):
+    [yesterday] = service.merge_episodes([_alert("Heat Stress", d) for d in (0, 1, 2)], "wheat")
+    [today] = service.merge_episodes([_alert("Heat Stress", d) for d in (1, 2, 3)], "wheat")
+    assert today["episode_id"] != yesterday["episode_id"]
+
+    [continued] = continue_episodes([today], [episode_ref(yesterday)])
+    assert continued["episode_id"] == yesterday["episode_id"]
+    assert (continued["start_date"], continued["end_date"], continued["days"]) == (_day(0), _day(3), 4)
+    assert continued["fingerprint"] == today["fingerprint"]
+
+
+def test_touching_dates_continue_but_a_gap_does_not(service):
+    [previous] = service.merge_episodes([_alert("Heat Stress", 0)], "wheat")
+    [touching] = service.merge_episodes([_alert("Heat Stress", 1)], "wheat")
+    [apart] = service.merge_episodes([_alert("Heat Stress", 2)], "wheat")
+    assert continue_episodes([touching], [episode_ref(previous)])[0]["episode_id"] == previous["episode_id"]
+    assert continue_episodes([apart], [episode_ref(previous)]) == [apart]
+
+
+def test_other_crops_and_hazards_are_not_continued(service):
+    [previous] = service.merge_episodes([_alert("Heat Stress", 0)], "wheat")
+    [rice] = service.merge_episodes([_alert("Heat Stress", 0)], "rice")
+    [frost] = service.merge_episodes([_alert("Frost Risk", 0)], "wheat")
+    assert continue_episodes([rice, frost], [episode_ref(previous)]) == [rice, frost]
+
+
+def test_a_previous_episode_is_continued_at_most_once(service):
+    [previous] = service.merge_episodes([_alert("Heat Stress", d) for d in (0, 1, 2)], "wheat")
+    later = service.merge_episodes([_alert("Heat Stress", 1), _alert("Heat Stress", 3)], "wheat")
+    continued = continue_episodes(later, [episode_ref(previous)])
+    assert [e["episode_id"] == previous["episode_id"] for e in continued] == [True, False]
+
+
+# -----------------------------
+# AlertLedger
+# -----------------------------
+def test_sent_episodes_are_not_resent_until_they_change(service):
+    ledger = AlertLedger()
+    episodes = service.merge_episodes([_alert("Heat Stress", 0), _alert("Frost Risk", 1)], "wheat")
+    assert ledger.filter_unsent("farm", episodes) == episodes
+
+    ledger.mark_sent("farm", episodes, today=TODAY)
+    assert ledger.filter_unsent("farm", episodes) == []
+
+    changed = service.merge_episodes([_alert("Heat Stress", 0, "high"), _alert("Frost Risk", 1)], "wheat")
+    [resent] = ledger.filter_unsent("farm", changed)
+    assert resent["family"] == "heat" and resent["severity"] == "high"
+
+
+def test_next_days_forecast_of_a_sent_episode_is_not_resent(service):
+    ledger = AlertLedger()
+    ledger.mark_sent("farm", service.merge_episodes([_alert("Heat Stress", d) for d in (0, 1, 2)], "wheat"),
+                     today=TODAY)
+    slid = service.merge_episodes([_alert("Heat Stress", d) for d in (1, 2, 3)], "wheat")
+    assert ledger.filter_unsent("farm", slid) == []
+
+
+def test_farms_are_tracked_separately(service):
+    ledger = AlertLedger()
+    episodes = service.merge_episodes([_alert("Heat Stress", 0)], "wheat")
+    ledger.mark_sent("farm-a", episodes, today=TODAY)
+    assert ledger.filter_unsent("farm-b", episodes) == episodes
+
+
+def test_episodes_ending_before_yesterday_are_pruned(service):
+    ledger = AlertLedger()
+    ended_yesterday = service.merge_episodes([_alert("Heat Stress", -1)], "wheat")
+    ledger.mark_sent("farm", ended_yesterday, today=TODAY)
+    assert ledger.filter_unsent("farm", ended_yesterday) == []
+
+    # A day later it ended two days ago: the next mark_sent prunes it
+    ledger.mark_sent("farm", service.merge_episodes([_alert("Frost Risk", 1)], "wheat"),
+                     today=TODAY + timedelta(days=1))
+    assert ledger.filter_unsent("farm", ended_yesterday) == ended_yesterday
+
+
+def test_reserved_episodes_are_skipped_until_released(service):
+    ledger = AlertLedger()
+    episodes = service.merge_episodes([_alert("Heat Stress", 0)], "wheat")
+    ledger.reserve("farm", episodes)
+    assert ledger.filter_unsent("farm", episodes) == []
+
+    ledger.release("farm", episodes)
+    assert ledger.filter_unsent("farm", episodes) == episodes
+
+
+def test_reservations_lapse(service):
+    ledger = AlertLedger(reserve_seconds=0)
+    episodes = service.merge_episodes([_alert("Heat Stress", 0)], "wheat")
+    ledger.reserve("farm", episodes)
+    assert ledger.filter_unsent("farm", episodes) == episodes
+
+
+def test_a_reserved_episode_that_changes_is_not_held_back(service):
+    ledger = AlertLedger()
+    ledger.reserve("farm", service.merge_episodes([_alert("Heat Stress", 0)], "wheat"))
+    worse = service.merge_episodes([_alert("Heat Stress", 0, "high")], "wheat")
+    assert ledger.filter_unsent("farm", worse) == worse
+
+
+class _DirectWriter:
+    """Writes straight through to the in-memory client instead of buffering."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def write_nowait(self, collection, data, doc_id=None, merge=False):
+        self.client.collection(collection).document(doc_id).set(data, merge=merge)
+        return True
+
+
+def test_workers_share_the_ledger_through_firestore(service):
+    client = InMemoryFirestore()
+    first, second = (AlertLedger(writer=_DirectWriter(client), client_factory=lambda: client)
+                     for _ in range(2))
+    episodes = service.merge_episodes([_alert("Heat Stress", 0)], "wheat")
+
+    first.reserve("farm", episodes)
+    second.load("farm")
+    assert second.filter_unsent("farm", episodes) == []
+
+    first.mark_sent("farm", episodes, today=TODAY)
+    second.refresh_seconds = 0
+    second.load("farm")
+    assert second.filter_unsent("farm", episodes) == []
+    assert second.filter_unsent("farm", service.merge_episodes([_alert("Heat Stress", 0, "high")], "wheat"))
@@ -0,0 +1,109 @@
+# tests/test_audience_index.py
+"""AudienceIndex.resolve against a brute-force scan, for sparse and dense keys alike."""
+import random
+
+import pytest
+
+from services.audience_index import AudienceIndex
+
+CROPS = ["wheat", "rice", "cotton", "maize"]
+DISTRICTS = {"Ludhiana": "Punjab", "Amritsar": "Punjab", "Karnal": "Haryana", "Hisar": "Haryana"}
+
+
+def _profiles(n: int = 3000):
+    rng = random.Random(7)
+    profiles = {}
+    for i in range(n):
+        district = rng.choice(list(DISTRICTS))
+        # Wheat is common enough to be stored as a bitmap, maize stays a sorted array
+        crops = [c for c, p in zip(CROPS, (0.6, 0.3, 0.2, 0.02)) if rng.random() < p]
+        profiles[f"farmer-{i}"] = {"district": district, "state": DISTRICTS[district], "crops_grown": crops}
+    return profiles
+
+
+PROFILES = _profiles()
+
+
+def _expected(crops=None, regions=None, within=None):
+    def matches(profile):
+        if crops and not set(crops) & set(profile["crops_grown"]):
+            return False
+        if regions and not set(regions) & {profile["district"].lower(), profile["state"].lower()}:
+            return False
+        return True
+    farmers = within if within is not None else PROFILES
+    return sorted(f for f in farmers if matches(PROFILES[f]))
+
+
+@pytest.fixture(params=["bulk_load", "update"])
+def index(request):
+    index = AudienceIndex()
+    if request.param == "bulk_load":
+        index.bulk_load(PROFILES.items())
+    else:
+        for farmer_id, profile in PROFILES.items():
+            index.update(farmer_id, profile)
+    return index
+
+
+def test_keys_use_both_representations(index):
+    stats = index.stats()
+    assert stats["farmers"] == len(PROFILES)
+    assert stats["bitmaps"] and stats["arrays"]
+
+
+@pytest.mark.parametrize("crops, regions", [
+    (["wheat"], None),
+    (["maize"], None),
+    (["wheat", "maize"], None),
+    (None, ["ludhiana"]),
+    (None, ["punjab", "karnal"]),
+    (["wheat"], ["haryana"]),
+    (["maize"], ["punjab"]),
+    (["rice", "maize"], ["amritsar", "hisar"]),
+])
+def test_resolve_matches_a_full_scan(index, crops, regions):
+    assert sorted(index.resolve(crops, regions)) == _expected(crops, regions)
+    assert index.count(crops, regions) == len(_expected(crops, regions))
+
+
+def test_names_are_normalised(index):
+    assert sorted(index.resolve(["  WHEAT "], ["Ludhiana"])) == _expected(["wheat"], ["ludhiana"])
+
+
+def test_region_prefix_restricts_the_kind():
+    index = AudienceIndex()
+    index.update("a", {"district": "Hisar", "state": "Haryana", "crops_grown": ["wheat"]})
+    index.update("b", {"district": "Karnal", "state": "Hisar", "crops_grown": ["wheat"]})
+    assert sorted(index.resolve(regions=["hisar"])) == ["a", "b"]
+    assert index.resolve(regions=["district:hisar"]) == ["a"]
+    assert index.resolve(regions=["state:Hisar"]) == ["b"]
+
+
+def test_unknown_keys_match_nobody(index):
+    assert index.resolve(["saffron"]) == []
+    assert index.resolve(["wheat"], ["nowhere"]) == []
+
+
+def test_within_restricts_the_result(index):
+    within = [f"farmer-{i}" for i in range(0, 3000, 7)] + ["not-indexed"]
+    expected = _expected(["wheat"], ["punjab"], within[:-1])
+    assert sorted(index.resolve(["wheat"], ["punjab"], within=within)) == expected
+
+
+def test_no_filters_returns_within_or_everyone(index):
+    assert index.resolve(within=["x", "y"]) == ["x", "y"]
+    assert sorted(index.resolve()) == sorted(PROFILES)
+
+
+def test_updates_and_removals_are_reflected(index):
+    index.update("farmer-0", {"district": "Hisar", "state": "Haryana", "crops_grown": ["saffron"]})
+    index.remove("farmer-1")
+    assert index.resolve(["saffron"]) == ["farmer-0"]
+    assert "farmer-1" not in index.resolve()
+    assert "farmer-1" not in index.resolve(PROFILES["farmer-1"]["crops_grown"] or ["wheat"])
+    assert len(index) == len(PROFILES) - 1
+
+    # A returning farmer is indexed again
+    index.update("farmer-1", {"district": "Karnal", "state": "Haryana", "crops_grown": ["saffron"]})
+    assert sorted(index.resolve(["saffron"])) == ["farmer-0", "farmer-1"]
@@ -0,0 +1,41 @@
+# tests/test_sync_service.py
+"""Sync tokens: anything the client can tamper with must fall back to a full sync."""
+import base64
+import json
+
+import pytest
+
+from services.sync_service import TOKEN_VERSION, decode_token, encode_token
+
+VALID = {"v": TOKEN_VERSION, "e": "epoch", "g": 3, "m": 1767225600000, "k": "digest", "f": None, "c": "2026.10.3"}
+
+
+def _raw_token(payload) -> str:
+    raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def test_round_trip():
+    assert decode_token(encode_token(VALID)) == VALID
+
+
+def test_missing_fields_are_allowed():
+    assert decode_token(encode_token({"v": TOKEN_VERSION})) == {"v": TOKEN_VERSION}
+
+
+@pytest.mark.parametrize("token", [None, "", "!!!not base64!!!", _raw_token(b"not json"),
+                                   _raw_token(b"\xff\xfe"), _raw_token([1, 2, 3]), _raw_token("string")])
+def test_malformed_tokens_are_rejected(token):
+    assert decode_token(token) == {}
+
+
+@pytest.mark.parametrize("version", [None, TOKEN_VERSION + 1, str(TOKEN_VERSION)])
+def test_other_versions_are_rejected(version):
+    assert decode_token(encode_token({**VALID, "v": version})) == {}
+
+
+@pytest.mark.parametrize("field, value", [
+    ("g", "3"), ("g", 3.0), ("g", True), ("m", None), ("e", 1), ("k", ["digest"]), ("f", 0), ("c", {}),
+])
+def test_mistyped_fields_are_rejected(field, value):
+    assert decode_token(encode_token({**VALID, field: value})) == {}
@@ -0,0 +1,229 @@
+# utils/auth.py
+"""
+Shared FastAPI authentication dependency.
+
+Firebase ID tokens are verified locally: Google's signing certificates are
+fetched once and cached for the `Cache-Control: max-age` they are served
+with, and verified tokens are remembered (by hash) until they expire, so a
+repeat request costs a dictionary lookup instead of a signature check.
+Expired keys keep being served while a background thread refreshes them;
+only a token signed with a key we have never seen waits for a fetch, and
+verify_user runs that wait in a worker thread, off the event loop.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import jwt
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+from fastapi import Header, HTTPException, Request
+
+from utils.cache import TTLCache
+from utils.metrics import track_cache
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = ("https://www.googleapis.com/robot/v1/metadata/x509/"
+                    "securetoken@system.gserviceaccount.com")
+DEV_USER_ID = "user_123"
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class AuthError(Exception):
+    pass
+
+
+def _load_public_key(pem: str):
+    data = pem.encode("utf-8")
+    if b"BEGIN CERTIFICATE" in data:
+        return x509.load_pem_x509_certificate(data).public_key()
+    return load_pem_public_key(data)
+
+
+class PublicKeyCache:
+    """
+    Signing keys by `kid`, refreshed when the cached set's max-age runs out.
+    `fetcher` returns (pem_by_kid, max_age_seconds); tests pass a local key set.
+    `get` never blocks for a known kid; an unknown one fetches synchronously.
+    """
+
+    def __init__(self, fetcher: Optional[Callable[[], Tuple[Dict[str, str], int]]] = None,
+                 min_refresh_interval: float = 30.0):
+        self._fetcher = fetcher or self._fetch_google_certs
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self.min_refresh_interval = min_refresh_interval
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @staticmethod
+    def _fetch_google_certs() -> Tuple[Dict[str, str], int]:
+        response = requests.get(GOOGLE_CERTS_URL, timeout=5)
+        response.raise_for_status()
+        match = _MAX_AGE_RE.search(response.headers.get("Cache-Control", ""))
+        return response.json(), int(match.group(1)) if match else 3600
+
+    def _refresh(self) -> None:
+        pems, max_age = self._fetcher()
+        self._keys = {kid: _load_public_key(pem) for kid, pem in pems.items()}
+        self._last_fetch = time.monotonic()
+        self._expires_at = self._last_fetch + max_age
+        logger.info(f"Loaded {len(self._keys)} token signing keys (valid {max_age}s)")
+
+    def _background_refresh(self) -> None:
+        try:
+            with self._lock:
+                if time.monotonic() >= self._expires_at:
+                    self._refresh()
+        except Exception as e:
+            # Keep serving with the previous keys if the refresh fails
+            logger.error(f"Failed to refresh token signing keys: {e}")
+        finally:
+            self._refreshing = False
+
+    def has(self, kid: str) -> bool:
+        """True if `get(kid)` can answer without waiting for a fetch."""
+        return kid in self._keys
+
+    def get(self, kid: str):
+        key = self._keys.get(kid)
+        if key is not None:
+            if time.monotonic() >= self._expires_at and not self._refreshing:
+                # Expired: serve the stale key, refresh in the background
+                self._refreshing = True
+                threading.Thread(target=self._background_refresh, name="signing-keys", daemon=True).start()
+            return key
+        with self._lock:
+            # Unknown kid (first use, or keys rotated): fetch, but not in a tight loop
+            if kid not in self._keys and (not self._keys or
+                                          time.monotonic() - self._last_fetch > self.min_refresh_interval):
+                try:
+                    self._refresh()
+                except Exception as e:
+                    logger.error(f"Failed to refresh token signing keys: {e}")
+                    if not self._keys:
+                        raise AuthError("Signing keys unavailable") from e
+            key = self._keys.get(kid)
+        if key is None:
+            raise AuthError(f"Unknown signing key: {kid}")
+        return key
+
+
+def local_key_fetcher(path: str) -> Callable[[], Tuple[Dict[str, str], int]]:
+    """Key set from a JSON file of {kid: PEM}, for tests and offline development."""
+    def fetch() -> Tuple[Dict[str, str], int]:
+        with open(path) as f:
+            return json.load(f), 3600
+    return fetch
+
+
+class FirebaseTokenVerifier:
+    def __init__(self, project_id: str, keys: Optional[PublicKeyCache] = None,
+                 cache_size: int = 50000, leeway: int = 60):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.keys = keys or PublicKeyCache()
+        self.leeway = leeway
+        self._verified = TTLCache(maxsize=cache_size, name="verified_tokens")
+        track_cache(self._verified)
+
+    async def averify(self, token: str) -> Dict[str, Any]:
+        """`verify` for the event loop: a signing-key fetch runs in a worker thread."""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid", "")
+        except jwt.PyJWTError as e:
+            raise AuthError(str(e)) from e
+        if not self.keys.has(kid):
+            return await asyncio.to_thread(self.verify, token)
+        return self.verify(token)
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        token_hash = hashlib.sha256(token.encode("utf-8")).digest()
+        claims = self._verified.get(token_hash)
+        if claims is not None:
+            return claims
+
+        try:
+            header = jwt.get_unverified_header(token)
+            if header.get("alg") != "RS256":
+                raise AuthError("Unexpected token algorithm")
+            claims = jwt.decode(
+                token,
+                self.keys.get(header.get("kid", "")),
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={"require": ["exp", "iat", "sub"]}
+            )
+        except jwt.PyJWTError as e:
+            raise AuthError(str(e)) from e
+
+        if not claims.get("sub"):
+            raise AuthError("Token has no subject")
+        if claims.get("auth_time", 0) > time.time() + self.leeway:
+            raise AuthError("Token auth_time is in the future")
+
+        self._verified.set(token_hash, claims, ttl=claims["exp"] - time.time())
+        return claims
+
+
+# -----------------------------
+# FastAPI dependency
+# -----------------------------
+_verifier: Optional[FirebaseTokenVerifier] = None
+
+
+def auth_enabled() -> bool:
+    """Auth is enforced once a Firebase project is configured (AUTH_MODE overrides)."""
+    mode = os.getenv("AUTH_MODE")
+    if mode:
+        return mode.lower() != "disabled"
+    return bool(os.getenv("FIREBASE_PROJECT_ID"))
+
+
+def get_token_verifier() -> FirebaseTokenVerifier:
+    global _verifier
+    if _verifier is None:
+        project_id = os.getenv("FIREBASE_PROJECT_ID")
+        if not project_id:
+            raise RuntimeError("❌ FIREBASE_PROJECT_ID not found in environment.")
+        keys_file = os.getenv("FIREBASE_AUTH_KEYS_FILE")
+        keys = PublicKeyCache(local_key_fetcher(keys_file)) if keys_file else PublicKeyCache()
+        _verifier = FirebaseTokenVerifier(project_id, keys)
+    return _verifier
+
+
+def set_token_verifier(verifier: Optional[FirebaseTokenVerifier]) -> None:
+    """Swap the verifier (tests use one backed by a local key set)."""
+    global _verifier
+    _verifier = verifier
+
+
+async def verify_user(request: Request, authorization: Optional[str] = Header(None)) -> str:
+    """Return the Firebase uid of the caller, or 401."""
+    if not auth_enabled():
+        request.state.user_id = DEV_USER_ID
+        return DEV_USER_ID
+
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing bearer token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = await get_token_verifier().averify(authorization[7:].strip())
+    except AuthError as e:
+        logger.info(f"Token verification failed: {e}")
+        raise HTTPException(status_code=401, detail="Invalid or expired token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+    request.state.user_id = claims["sub"]
+    return claims["sub"]
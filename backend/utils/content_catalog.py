@@ -0,0 +1,124 @@
+# utils/content_catalog.py
+"""
+Versioned advisory content catalog (content/catalog.json).
+
+Pest treatments, alert messages and canned chatbot replies live in one
+JSON file, keyed by stable message IDs with text per language. It is
+loaded once per process into read-only structures (mappings, tuples and
+interned strings) that every request shares. Clients download the whole
+bundle from /content/catalog, cache it by ETag, and render advisories
+from the IDs carried in API responses, including offline.
+
+Translations are bundled in content/locales/<lang>.json. Every
+(message_id, lang) pair is compiled to a Template at load time, with the
+default language filling any gaps, so lookups are a single dict access.
+"""
+import glob
+import hashlib
+import json
+import os
+import sys
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from utils.i18n import Template
+from utils.responses import dumps_json
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "content")
+CATALOG_PATH = os.path.join(CONTENT_DIR, "catalog.json")
+LOCALES_DIR = os.path.join(CONTENT_DIR, "locales")
+
+
+def _freeze(obj: Any) -> Any:
+    """Recursively convert to read-only mappings, tuples and interned strings."""
+    if isinstance(obj, dict):
+        return MappingProxyType({sys.intern(k): _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(v) for v in obj)
+    if isinstance(obj, str):
+        return sys.intern(obj)
+    return obj
+
+
+class ContentCatalog:
+    def __init__(self, data: Dict[str, Any], digest: str):
+        self.version: str = data["version"]
+        self.default_language: str = data.get("default_language", "en")
+        self.etag = f'"{self.version}-{digest[:16]}"'
+        self._data = data
+
+        self.messages: Mapping[str, Mapping[str, str]] = _freeze(data["messages"])
+        self.pests: Mapping[str, Mapping[str, Any]] = _freeze(data["pests"])
+        self.no_detection: Mapping[str, Any] = _freeze(data["no_detection"])
+        self.weather_alerts: Mapping[str, Mapping[str, str]] = _freeze(data["weather_alerts"])
+        self.soil_weather_alerts: Mapping[str, str] = _freeze(data["soil_weather_alerts"])
+        self.soil: Mapping[str, tuple] = _freeze(data["soil"])
+        self.chatbot_responses: Mapping[str, tuple] = _freeze(data["chatbot"]["responses"])
+        self.follow_up_questions: Mapping[str, tuple] = _freeze(data["chatbot"]["follow_up_questions"])
+        self.chatbot_suggestions: Mapping[str, tuple] = _freeze(data["chatbot"]["suggestions"])
+        self.languages = tuple(sorted({lang for texts in self.messages.values() for lang in texts}))
+
+        self._templates: Dict[Tuple[str, str], Template] = {}
+        for message_id, texts in self.messages.items():
+            fallback = Template(texts[self.default_language])
+            for lang in self.languages:
+                text = texts.get(lang)
+                self._templates[(message_id, lang)] = Template(text) if text else fallback
+
+        self._bundles: Dict[Optional[str], bytes] = {}
+
+    @classmethod
+    def load(cls, path: str = CATALOG_PATH, locales_dir: Optional[str] = LOCALES_DIR) -> "ContentCatalog":
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest.update(raw)
+        data = json.loads(raw)
+
+        for locale_path in sorted(glob.glob(os.path.join(locales_dir or "", "*.json"))):
+            with open(locale_path, "rb") as f:
+                raw = f.read()
+            digest.update(raw)
+            locale = json.loads(raw)
+            lang = locale["language"]
+            for message_id, text in locale["messages"].items():
+                if message_id in data["messages"]:
+                    data["messages"][message_id][lang] = text
+        return cls(data, digest.hexdigest())
+
+    def template(self, message_id: str, lang: Optional[str] = None) -> Optional[Template]:
+        return (self._templates.get((message_id, lang or self.default_language))
+                or self._templates.get((message_id, self.default_language)))
+
+    def text(self, message_id: str, lang: Optional[str] = None) -> str:
+        """Text for a message ID, falling back to the default language."""
+        template = self.template(message_id, lang)
+        return template.render() if template else message_id
+
+    def render(self, message_id: str, lang: Optional[str] = None, **params) -> str:
+        """Fill a message template with parameters."""
+        template = self.template(message_id, lang)
+        return template.render(params) if template else message_id
+
+    def texts(self, message_ids: Iterable[str], lang: Optional[str] = None) -> List[str]:
+        return [self.text(message_id, lang) for message_id in message_ids]
+
+    def bundle(self, lang: Optional[str] = None) -> bytes:
+        """Serialized catalog (optionally one language only), rendered once."""
+        body = self._bundles.get(lang)
+        if body is None:
+            data = dict(self._data)
+            if lang:
+                data["messages"] = {
+                    mid: {lang: texts.get(lang) or texts[self.default_language]}
+                    for mid, texts in self._data["messages"].items()
+                }
+            body = self._bundles[lang] = dumps_json(data)
+        return body
+
+
+@lru_cache(maxsize=None)
+def get_catalog() -> ContentCatalog:
+    """Process-wide catalog, loaded on first use (preloaded with the app)."""
+    return ContentCatalog.load(os.getenv("CONTENT_CATALOG_PATH", CATALOG_PATH))
@@ -1,12 +1,35 @@
 import firebase_admin
-from firebase_admin import credentials, firestore, auth, storage
+from firebase_admin import credentials, firestore, storage
 import os
 import json
 from typing import Optional
 
+_memory_client = None
+
+def get_firestore_backend() -> str:
+    """
+    Which Firestore to talk to: 'firebase', 'emulator', 'memory' or 'disabled'.
+    Set explicitly with FIRESTORE_BACKEND, otherwise inferred from the environment.
+    """
+    backend = os.getenv('FIRESTORE_BACKEND')
+    if backend:
+        return backend.lower()
+    if os.getenv('FIRESTORE_EMULATOR_HOST'):
+        return 'emulator'
+    if os.getenv('FIREBASE_CREDENTIALS_PATH') or os.getenv('FIREBASE_CREDENTIALS_JSON'):
+        return 'firebase'
+    return 'disabled'
+
 def init_firebase():
     """Initialize Firebase Admin SDK"""
     if not firebase_admin._apps:
+        if get_firestore_backend() == 'emulator':
+            # The emulator needs no credentials, only a project id
+            firebase_admin.initialize_app(options={
+                'projectId': os.getenv('GCLOUD_PROJECT', 'demo-farm-grow')
+            })
+            print(f"Firebase initialized against emulator at {os.getenv('FIRESTORE_EMULATOR_HOST')}")
+            return
         try:
             # Try to load credentials from environment variable
             cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
@@ -34,7 +57,14 @@ def init_firebase():
             raise e
 
 def get_firestore_client():
-    """Get Firestore client"""
+    """Get Firestore client (or the in-memory stand-in when FIRESTORE_BACKEND=memory)"""
+    global _memory_client
+    if get_firestore_backend() == 'memory':
+        if _memory_client is None:
+            from utils.firestore_memory import InMemoryFirestore
+            _memory_client = InMemoryFirestore()
+        return _memory_client
+    init_firebase()
     return firestore.client()
 
 def get_storage_bucket():
@@ -42,10 +72,10 @@ def get_storage_bucket():
     return storage.bucket()
 
 def verify_firebase_token(token: str) -> Optional[dict]:
-    """Verify Firebase ID token and return decoded token"""
+    """Verify Firebase ID token locally (cached keys and tokens) and return decoded token"""
+    from utils.auth import get_token_verifier
     try:
-        decoded_token = auth.verify_id_token(token)
-        return decoded_token
+        return get_token_verifier().verify(token)
     except Exception as e:
         print(f"Token verification failed: {e}")
         return None
@@ -54,14 +84,21 @@ def verify_firebase_token(token: str) -> Optional[dict]:
 COLLECTIONS = {
     'farmers': 'farmers',
     'chat_interactions': 'chat_interactions',
+    'chat_sessions': 'chat_sessions',
     'soil_recommendations': 'soil_recommendations',
     'fertilizer_guidance': 'fertilizer_guidance',
     'pest_detections': 'pest_detections',
     'weather_alerts': 'weather_alerts',
+    'alert_ledger': 'alert_ledger',
+    'sync_cursors': 'sync_cursors',
     'market_prices': 'market_prices',
     'feedback': 'feedback',
+    'feedback_stats': 'feedback_stats',
+    'feedback_farmers': 'feedback_farmers',
     'notifications': 'notifications',
+    'devices': 'devices',
     'analytics': 'analytics',
+    'farmer_analytics': 'farmer_analytics',
     'usage_logs': 'usage_logs'
 }
 
@@ -0,0 +1,174 @@
+# utils/firestore_memory.py
+"""
+Minimal in-memory stand-in for the Firestore client, for local runs and tests.
+Implements the subset of the API the backend uses: collections, documents,
+batched writes (with the 500-op limit), get_all and collection snapshot
+listeners.
+"""
+import copy
+import threading
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+MAX_BATCH_OPS = 500
+
+
+class InMemorySnapshot:
+    def __init__(self, reference: "InMemoryDocumentRef", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class InMemoryDocumentRef:
+    def __init__(self, client: "InMemoryFirestore", collection: str, doc_id: str):
+        self._client = client
+        self.collection_name = collection
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self.collection_name}/{self.id}"
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        self._client._apply("set", self, data, merge)
+
+    def update(self, data: Dict[str, Any]) -> None:
+        self._client._apply("update", self, data, True)
+
+    def delete(self) -> None:
+        self._client._apply("delete", self, None, False)
+
+    def get(self) -> InMemorySnapshot:
+        return InMemorySnapshot(self, self._client._read(self))
+
+
+class InMemoryCollection:
+    def __init__(self, client: "InMemoryFirestore", name: str):
+        self._client = client
+        self.id = name
+
+    def document(self, doc_id: Optional[str] = None) -> InMemoryDocumentRef:
+        return InMemoryDocumentRef(self._client, self.id, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def on_snapshot(self, callback) -> "InMemoryWatch":
+        """Call `callback(docs, changes, read_time)` after every write to this collection."""
+        return self._client._watch(self.id, callback)
+
+    def stream(self) -> Iterator[InMemorySnapshot]:
+        with self._client._lock:
+            docs = list(self._client._data.get(self.id, {}).items())
+        for doc_id, data in docs:
+            yield InMemorySnapshot(self.document(doc_id), copy.deepcopy(data))
+
+
+class InMemoryChange:
+    def __init__(self, change_type: str, document: InMemorySnapshot):
+        self.type = SimpleNamespace(name=change_type)
+        self.document = document
+
+
+class InMemoryWatch:
+    def __init__(self, client: "InMemoryFirestore", collection: str, callback):
+        self._client = client
+        self.collection = collection
+        self.callback = callback
+
+    def unsubscribe(self) -> None:
+        with self._client._lock:
+            watchers = self._client._watchers.get(self.collection, [])
+            if self in watchers:
+                watchers.remove(self)
+
+
+class InMemoryBatch:
+    def __init__(self, client: "InMemoryFirestore"):
+        self._client = client
+        self._ops: List[tuple] = []
+
+    def _add(self, op: str, ref: InMemoryDocumentRef, data, merge: bool) -> None:
+        if len(self._ops) >= MAX_BATCH_OPS:
+            raise ValueError(f"A batch cannot contain more than {MAX_BATCH_OPS} operations")
+        self._ops.append((op, ref, data, merge))
+
+    def set(self, ref: InMemoryDocumentRef, data: Dict[str, Any], merge: bool = False) -> None:
+        self._add("set", ref, data, merge)
+
+    def update(self, ref: InMemoryDocumentRef, data: Dict[str, Any]) -> None:
+        self._add("update", ref, data, True)
+
+    def delete(self, ref: InMemoryDocumentRef) -> None:
+        self._add("delete", ref, None, False)
+
+    def commit(self) -> list:
+        with self._client._lock:
+            for op, ref, data, merge in self._ops:
+                self._client._apply(op, ref, data, merge)
+            self._client.commit_count += 1
+        committed, self._ops = self._ops, []
+        return committed
+
+
+class InMemoryFirestore:
+    def __init__(self):
+        self._data: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.RLock()
+        self._watchers: Dict[str, List[InMemoryWatch]] = {}
+        self.commit_count = 0
+
+    def collection(self, name: str) -> InMemoryCollection:
+        return InMemoryCollection(self, name)
+
+    def batch(self) -> InMemoryBatch:
+        return InMemoryBatch(self)
+
+    def get_all(self, references: Iterable[InMemoryDocumentRef]) -> Iterator[InMemorySnapshot]:
+        for ref in references:
+            yield ref.get()
+
+    def _watch(self, collection: str, callback) -> InMemoryWatch:
+        watch = InMemoryWatch(self, collection, callback)
+        with self._lock:
+            self._watchers.setdefault(collection, []).append(watch)
+        return watch
+
+    def _notify(self, ref: InMemoryDocumentRef, change_type: str, data) -> None:
+        watchers = list(self._watchers.get(ref.collection_name, []))
+        if not watchers:
+            return
+        change = InMemoryChange(change_type, InMemorySnapshot(ref, copy.deepcopy(data)))
+        read_time = datetime.now(timezone.utc)
+        for watch in watchers:
+            watch.callback([change.document], [change], read_time)
+
+    def _read(self, ref: InMemoryDocumentRef) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._data.get(ref.collection_name, {}).get(ref.id)
+            return copy.deepcopy(data) if data is not None else None
+
+    def _apply(self, op: str, ref: InMemoryDocumentRef, data, merge: bool) -> None:
+        with self._lock:
+            docs = self._data.setdefault(ref.collection_name, {})
+            existed = ref.id in docs
+            if op == "delete":
+                docs.pop(ref.id, None)
+                self._notify(ref, "REMOVED", None)
+                return
+            if op == "update" and not existed:
+                raise KeyError(f"No document to update: {ref.path}")
+            if merge and existed:
+                docs[ref.id].update(copy.deepcopy(data))
+            else:
+                docs[ref.id] = copy.deepcopy(data)
+            self._notify(ref, "MODIFIED" if existed else "ADDED", docs[ref.id])
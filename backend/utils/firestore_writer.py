@@ -0,0 +1,180 @@
+# utils/firestore_writer.py
+"""
+Write-behind buffer for Firestore.
+
+Hot paths hand documents to the writer and return immediately; a background
+task groups them into batched commits (up to 500 operations each) when a
+size or time threshold is reached. When the buffer is full, `write()` waits
+for space (backpressure) and `write_nowait()` reports the drop instead.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_OPS = 500
+
+# (collection, document id or None for auto-id, data, merge, attempts)
+PendingWrite = Tuple[str, Optional[str], Dict[str, Any], bool, int]
+
+
+class BufferedFirestoreWriter:
+    def __init__(self, client_factory: Callable[[], Any], batch_size: int = MAX_BATCH_OPS,
+                 flush_interval: float = 2.0, max_pending: int = 20000, max_attempts: int = 3):
+        self._client_factory = client_factory
+        self._client = None
+        self.batch_size = min(batch_size, MAX_BATCH_OPS)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+
+        self._buffers: Dict[str, Deque[PendingWrite]] = {}
+        self._pending = 0
+        self._flush_requested = asyncio.Event()
+        self._space_available = asyncio.Event()
+        self._space_available.set()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and flush everything still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._pending:
+            if not await self.flush():
+                break
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Firestore write-behind flush failed: {e}")
+
+    # -----------------------------
+    # Enqueue
+    # -----------------------------
+    def write_nowait(self, collection: str, data: Dict[str, Any],
+                     doc_id: Optional[str] = None, merge: bool = False) -> bool:
+        """Buffer a write without waiting. Returns False (and drops it) if the buffer is full."""
+        if self._pending >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._enqueue((collection, doc_id, data, merge, 0))
+        return True
+
+    async def write(self, collection: str, data: Dict[str, Any],
+                    doc_id: Optional[str] = None, merge: bool = False) -> None:
+        """Buffer a write, waiting for the flusher to make room if the buffer is full."""
+        while self._pending >= self.max_pending:
+            self._space_available.clear()
+            self._flush_requested.set()
+            await self._space_available.wait()
+        self._enqueue((collection, doc_id, data, merge, 0))
+
+    def _enqueue(self, item: PendingWrite) -> None:
+        buffer = self._buffers.setdefault(item[0], deque())
+        buffer.append(item)
+        self._pending += 1
+        if len(buffer) >= self.batch_size or self._pending >= self.max_pending:
+            self._flush_requested.set()
+
+    # -----------------------------
+    # Flush
+    # -----------------------------
+    def _drain(self) -> List[PendingWrite]:
+        items: List[PendingWrite] = []
+        for buffer in self._buffers.values():
+            items.extend(buffer)
+            buffer.clear()
+        return items
+
+    def _commit(self, chunk: List[PendingWrite]) -> None:
+        client = self.client
+        batch = client.batch()
+        for collection, doc_id, data, merge, _ in chunk:
+            ref = client.collection(collection).document(doc_id) if doc_id else \
+                client.collection(collection).document()
+            batch.set(ref, data, merge=merge)
+        batch.commit()
+
+    async def flush(self) -> bool:
+        """Commit everything buffered so far. Returns False if any batch failed."""
+        async with self._flush_lock:
+            items = self._drain()
+            if not items:
+                return True
+            ok = True
+            started = time.perf_counter()
+            for start in range(0, len(items), self.batch_size):
+                chunk = items[start:start + self.batch_size]
+                try:
+                    await asyncio.to_thread(self._commit, chunk)
+                    self.written += len(chunk)
+                    self._pending -= len(chunk)
+                except Exception as e:
+                    ok = False
+                    logger.error(f"Firestore batch of {len(chunk)} writes failed: {e}")
+                    self._requeue(chunk)
+                self._space_available.set()
+            logger.debug(f"Flushed {len(items)} Firestore writes in "
+                         f"{(time.perf_counter() - started) * 1000:.1f}ms")
+            return ok
+
+    def _requeue(self, chunk: List[PendingWrite]) -> None:
+        for collection, doc_id, data, merge, attempts in reversed(chunk):
+            self._pending -= 1
+            if attempts + 1 >= self.max_attempts:
+                self.dropped += 1
+                continue
+            self._buffers.setdefault(collection, deque()).appendleft(
+                (collection, doc_id, data, merge, attempts + 1))
+            self._pending += 1
+
+
+_writer: Optional[BufferedFirestoreWriter] = None
+
+
+def get_firestore_writer() -> Optional[BufferedFirestoreWriter]:
+    """Process-wide writer, or None when no Firestore backend is configured."""
+    global _writer
+    from utils.firebase_config import get_firestore_backend, get_firestore_client
+
+    if get_firestore_backend() == "disabled":
+        return None
+    if _writer is None:
+        _writer = BufferedFirestoreWriter(get_firestore_client)
+    return _writer
@@ -0,0 +1,69 @@
+# utils/i18n.py
+"""
+Precompiled message templates and language negotiation.
+
+Templates use str.format syntax ("Forecast for {city}: {days}."). Each one
+is parsed once at load time into literal/field parts, so rendering is a
+join over a short tuple with no format-string parsing per request.
+"""
+from string import Formatter
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+_FORMATTER = Formatter()
+
+# (literal, field name or None, format spec)
+Part = Tuple[str, Optional[str], str]
+
+
+class Template:
+    __slots__ = ("source", "parts", "static")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.parts: Tuple[Part, ...] = tuple(
+            (literal, field, spec or "")
+            for literal, field, spec, _conversion in _FORMATTER.parse(source)
+        )
+        # Messages without fields render to themselves
+        self.static = source if all(field is None for _, field, _ in self.parts) else None
+
+    def render(self, params: Optional[dict] = None) -> str:
+        if self.static is not None:
+            return self.static
+        out: List[str] = []
+        for literal, field, spec in self.parts:
+            out.append(literal)
+            if field is not None:
+                value = params.get(field, "") if params else ""
+                out.append(format(value, spec) if spec else str(value))
+        return "".join(out)
+
+
+def parse_accept_language(header: Optional[str]) -> List[str]:
+    """Primary language subtags from an Accept-Language header, best first."""
+    if not header:
+        return []
+    weighted = []
+    for index, item in enumerate(header.split(",")):
+        tag, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if tag and tag != "*" and q > 0:
+            weighted.append((-q, index, tag.split("-")[0].lower()))
+    return [lang for _, _, lang in sorted(weighted)]
+
+
+def resolve_language(candidates: Iterable[Optional[Any]], supported: Sequence[str], default: str) -> str:
+    """First supported language among candidates ("hi-IN" matches "hi")."""
+    for candidate in candidates:
+        if not candidate:
+            continue
+        lang = str(candidate).split("-")[0].split("_")[0].lower()
+        if lang in supported:
+            return lang
+    return default
@@ -0,0 +1,334 @@
+# utils/profiler.py
+"""
+Opt-in production profiling.
+
+- StackSampler: statistical sampler over all threads (py-spy style) for a
+  fixed window, emitting collapsed stacks ("a;b;c 42") that flamegraph.pl,
+  speedscope and inferno read directly.
+- RequestProfiler: samples the stacks of a configurable fraction of
+  requests per route (PROFILE_ROUTES), in the same collapsed format with
+  the route's path template ("/voice/audio/{key}") as the root frame. A
+  stack is attributed to a sampled request only while its own task (or a
+  task it created) runs on the event loop, or while a worker thread runs
+  something it sent there with asyncio.to_thread / run_in_executor or
+  anyio's to_thread.run_sync (sync endpoints and dependencies).
+  Concurrent requests don't leak into each other's profiles.
+
+Nothing here runs unless PROFILING_ENABLED is set or an admin asks for it.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from starlette.routing import compile_path
+
+logger = logging.getLogger(__name__)
+
+# Sampled request being served in this context (None = not sampled)
+_profiled_request: contextvars.ContextVar[Optional["_SampledRequest"]] = \
+    contextvars.ContextVar("profiled_request", default=None)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class StackSampler:
+    """Samples the stacks of every thread at a fixed interval."""
+
+    _capture_lock = threading.Lock()
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+
+    def _collapse(self, frame) -> str:
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def capture(self, duration: float) -> str:
+        """Block for `duration` seconds sampling; returns collapsed stacks."""
+        if not self._capture_lock.acquire(blocking=False):
+            raise RuntimeError("A profile capture is already running")
+        try:
+            own_thread = threading.get_ident()
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            samples: Counter = Counter()
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    name = thread_names.get(thread_id, str(thread_id))
+                    samples[f"{name};{self._collapse(frame)}"] += 1
+                time.sleep(self.interval)
+            return "\n".join(f"{stack} {count}" for stack, count in samples.most_common()) + "\n"
+        finally:
+            self._capture_lock.release()
+
+
+class _SampledRequest:
+    """Stacks sampled for one request, filed under its route once it has been routed."""
+
+    __slots__ = ("scope", "stacks")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.stacks: Counter = Counter()
+
+
+def route_template(scope) -> str:
+    """Path template of the route that served `scope`, e.g. "/voice/audio/{key}"."""
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+
+
+def parse_route_rates(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "/soil/recommend-crop=0.05,/voice/audio/{key}=0.2" into {route: rate}."""
+    rates: Dict[str, float] = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            route, rate = item.rsplit("=", 1)
+            rates[route.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class _RouteExecutor(ThreadPoolExecutor):
+    """Default executor that tells the profiler which sampled request a worker thread is serving."""
+
+    def __init__(self, profiler: "RequestProfiler"):
+        super().__init__(thread_name_prefix="asyncio")
+        self._profiler = profiler
+
+    def submit(self, fn, /, *args, **kwargs):
+        # Called from the submitting task, so the contextvar is the request's
+        request = _profiled_request.get()
+        if request is None:
+            return super().submit(fn, *args, **kwargs)
+        return super().submit(self._profiler._run_as, request, fn, *args, **kwargs)
+
+
+class RequestProfiler:
+    """
+    Samples the stacks of a fraction of requests per route.
+    Rates are keyed by path template ("/voice/audio/{key}" covers every
+    audio key); "*" sets a default rate. Samples are filed under the
+    template of the route that served the request, so profiles stay one
+    entry per route however many distinct URLs there are.
+    The sampler thread only runs while a sampled request is in flight.
+    """
+
+    def __init__(self, route_rates: Optional[Dict[str, float]] = None, interval: float = 0.005):
+        self.route_rates = route_rates if route_rates is not None else \
+            parse_route_rates(os.getenv("PROFILE_ROUTES"))
+        self._route_patterns = [(compile_path(route)[0], route) for route in self.route_rates if route != "*"]
+        self.sampler = StackSampler(interval)
+        self._samples: Counter = Counter()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._thread_requests: Dict[int, _SampledRequest] = {}   # worker thread id -> request it runs for
+        self._task_requests: Dict[asyncio.Task, _SampledRequest] = {}   # loop task -> request it runs for
+        self.profiled_requests = 0
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Call once on the serving loop. Tasks, executor jobs and anyio worker
+        thread calls started by a sampled request are then attributed to its
+        route too.
+        """
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        loop.set_default_executor(_RouteExecutor(self))
+        self._install_anyio()
+        previous = loop.get_task_factory()
+
+        def task_factory(loop, coro, **kwargs):
+            task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+            # Runs in the creating context, e.g. asyncio.gather inside a sampled handler
+            request = _profiled_request.get()
+            if request is not None:
+                self._track(task, request)
+            return task
+
+        loop.set_task_factory(task_factory)
+
+    def _install_anyio(self) -> None:
+        # Sync endpoints and dependencies run on anyio's own thread pool, not the
+        # loop's default executor. Starlette looks run_sync up on every call.
+        import anyio.to_thread
+
+        run_sync = anyio.to_thread.run_sync
+        if getattr(run_sync, "request_profiler", None) is not None:
+            return
+
+        @functools.wraps(run_sync)
+        async def profiled_run_sync(func, *args, **kwargs):
+            request = _profiled_request.get()
+            if request is not None:
+                func = functools.partial(self._run_as, request, func)
+            return await run_sync(func, *args, **kwargs)
+
+        profiled_run_sync.request_profiler = self
+        anyio.to_thread.run_sync = profiled_run_sync
+
+    def _track(self, task: asyncio.Task, request: _SampledRequest) -> None:
+        self._task_requests[task] = request
+        task.add_done_callback(lambda t: self._task_requests.pop(t, None))
+
+    def should_profile(self, path: str) -> bool:
+        rate = next((self.route_rates[route] for pattern, route in self._route_patterns if pattern.match(path)),
+                    self.route_rates.get("*", 0.0))
+        return rate > 0 and random.random() < rate
+
+    def begin(self, scope) -> contextvars.Token:
+        request = _SampledRequest(scope)
+        token = _profiled_request.set(request)
+        task = asyncio.current_task()
+        if task is not None:
+            self._track(task, request)
+        with self._lock:
+            self._in_flight += 1
+            self.profiled_requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+                self._thread.start()
+        return token
+
+    def end(self, token: contextvars.Token) -> None:
+        request = _profiled_request.get()
+        _profiled_request.reset(token)
+        task = asyncio.current_task()
+        if task is not None:
+            self._task_requests.pop(task, None)
+        # Routing has set scope["route"] by now
+        route = route_template(request.scope)
+        with self._lock:
+            self._in_flight -= 1
+            self._samples.update({f"{route};{stack}": count for stack, count in request.stacks.items()})
+
+    def _run_as(self, request: _SampledRequest, fn, *args, **kwargs):
+        ident = threading.get_ident()
+        self._thread_requests[ident] = request
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._thread_requests.pop(ident, None)
+
+    def _loop_request(self) -> Optional[_SampledRequest]:
+        if self._loop is None:
+            return None
+        task = asyncio.current_task(self._loop)
+        return self._task_requests.get(task) if task is not None else None
+
+    def _sample(self) -> None:
+        while True:
+            with self._lock:
+                if not self._in_flight:
+                    self._thread = None
+                    return
+            # Read the running task first: a stale frame is cheaper than a misattributed one
+            loop_request = self._loop_request()
+            frames = sys._current_frames()
+            batch = []
+            for thread_id, frame in frames.items():
+                request = loop_request if thread_id == self._loop_thread else self._thread_requests.get(thread_id)
+                if request is not None:
+                    batch.append((request, self.sampler._collapse(frame)))
+            if batch:
+                with self._lock:
+                    for request, stack in batch:
+                        request.stacks[stack] += 1
+            time.sleep(self.sampler.interval)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples = Counter()
+            self.profiled_requests = 0
+
+    def collapsed(self) -> str:
+        """Sample counts per route;stack, in collapsed-stack format."""
+        with self._lock:
+            if not self._samples:
+                return ""
+            return "\n".join(f"{stack} {count}" for stack, count in self._samples.most_common()) + "\n"
+
+
+class RequestProfilerMiddleware:
+    """ASGI middleware marking sampled requests for a RequestProfiler."""
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        token = self.profiler.begin(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.end(token)
+
+
+_request_profiler: Optional[RequestProfiler] = None
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+
+
+def install_signal_handler(signum: int = getattr(signal, "SIGUSR2", 0), duration: float = 10.0) -> None:
+    """
+    On `kill -USR2 <pid>`, sample the process for `duration` seconds and write
+    collapsed stacks to PROFILE_DIR (default /tmp).
+    """
+    if not signum:
+        return
+    out_dir = os.getenv("PROFILE_DIR", "/tmp")
+
+    def capture_to_file():
+        try:
+            collapsed = StackSampler().capture(duration)
+        except RuntimeError as e:
+            logger.warning(f"Signal profile skipped: {e}")
+            return
+        path = os.path.join(out_dir, f"profile-{os.getpid()}-{int(time.time())}.collapsed")
+        with open(path, "w") as f:
+            f.write(collapsed)
+        logger.info(f"Wrote stack profile to {path}")
+
+    def handler(_signum, _frame):
+        threading.Thread(target=capture_to_file, name="profile-capture", daemon=True).start()
+
+    try:
+        signal.signal(signum, handler)
+    except ValueError:
+        # Only the main thread may install signal handlers
+        logger.warning("Profiling signal handler not installed (not in main thread)")
+
+
+def get_request_profiler() -> Optional[RequestProfiler]:
+    """Process-wide request profiler, or None unless PROFILING_ENABLED is set."""
+    global _request_profiler
+    if _request_profiler is None and profiling_enabled():
+        _request_profiler = RequestProfiler()
+    return _request_profiler
@@ -0,0 +1,191 @@
+# utils/responses.py
+"""
+Response encoding for low-bandwidth clients.
+
+- FastJSONResponse: default response class; orjson when installed, compact
+  stdlib JSON otherwise. Sends MessagePack instead when the client asks
+  for it with `Accept: application/x-msgpack`. Advisory text is already
+  deduplicated by the catalog message IDs that responses carry.
+- CompressionMiddleware: brotli or gzip for bodies above a size threshold.
+"""
+import gzip
+import json
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from fastapi.responses import JSONResponse
+from utils.metrics import RESPONSE_BYTES, RESPONSE_SERIALIZE_SECONDS
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional encoding
+    brotli = None
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+# Whether the client of the request being served wants MessagePack
+_negotiated: ContextVar[bool] = ContextVar("response_negotiation", default=False)
+
+
+# -----------------------------
+# Serialization
+# -----------------------------
+def dumps_json(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON (or negotiated MessagePack) response with compact encoding."""
+
+    def __init__(self, content: Any = None, *args, **kwargs):
+        super().__init__(content, *args, **kwargs)
+        self.headers.append("Vary", "Accept")
+
+    def render(self, content: Any) -> bytes:
+        if _negotiated.get() and msgpack is not None:
+            self.media_type = MSGPACK_MEDIA_TYPE
+            with RESPONSE_SERIALIZE_SECONDS.time("msgpack"):
+                return msgpack.packb(content, use_bin_type=True)
+        with RESPONSE_SERIALIZE_SECONDS.time("json"):
+            return dumps_json(content)
+
+
+class NegotiationMiddleware:
+    """Records the client's format preference for FastJSONResponse."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = dict(scope["headers"]).get(b"accept", b"").decode("latin-1")
+        token = _negotiated.set(MSGPACK_MEDIA_TYPE in accept)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _negotiated.reset(token)
+
+
+# -----------------------------
+# Compression
+# -----------------------------
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    encodings = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            encodings[name.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete (non-streamed) responses of at least `minimum_size`
+    bytes with brotli when the client accepts it, else gzip. Streams and
+    already-compressed media (audio, images) pass through untouched.
+    """
+
+    SKIP_MEDIA_PREFIXES = ("audio/", "image/", "video/", "application/zip", "application/gzip")
+
+    def __init__(self, app, minimum_size: int = 512, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, self._counting(send, "identity"))
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            response_headers = [(k, v) for k, v in start_message["headers"]]
+            names = {k.lower(): v for k, v in response_headers}
+            media_type = names.get(b"content-type", b"").decode("latin-1")
+            if (message.get("more_body") or b"content-encoding" in names
+                    or len(body) < self.minimum_size or media_type.startswith(self.SKIP_MEDIA_PREFIXES)):
+                # Streaming, already encoded, small or incompressible: send as is
+                passthrough = True
+                RESPONSE_BYTES.observe(len(body), "identity")
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = self._compress(body, encoding)
+            RESPONSE_BYTES.observe(len(compressed), encoding)
+            response_headers = [(k, v) for k, v in response_headers if k.lower() != b"content-length"]
+            response_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send({**start_message, "headers": response_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _counting(send, encoding: str):
+        streamed = False
+
+        async def send_wrapper(message):
+            nonlocal streamed
+            if message["type"] == "http.response.body":
+                if message.get("more_body"):
+                    streamed = True
+                elif not streamed:
+                    RESPONSE_BYTES.observe(len(message.get("body", b"")), encoding)
+            await send(message)
+        return send_wrapper
@@ -0,0 +1,170 @@
+# utils/sketches.py
+"""
+Mergeable streaming sketches for usage rollups.
+
+- HyperLogLog: approximate distinct counts (unique users) in a fixed 4 KB
+  (p=12, ~1.6% standard error); sketches from several workers or time
+  buckets merge by taking the register-wise maximum.
+- TDigest: approximate quantiles (latency p50/p95/p99) from a bounded set
+  of centroids (merging t-digest with the arcsine scale function); digests
+  merge by re-compressing their centroids together.
+
+Both serialize to small JSON/Firestore-friendly dicts or strings, so
+rollups can be persisted per shard and combined at read time.
+"""
+import base64
+import hashlib
+import math
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+# -----------------------------
+# HyperLogLog
+# -----------------------------
+class HyperLogLog:
+    def __init__(self, p: int = 12, registers: Optional[bytearray] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError(f"❌ HyperLogLog expects {self.m} registers, got {len(self.registers)}")
+
+    def add(self, value: str) -> None:
+        h = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("❌ Cannot merge HyperLogLogs of different precision")
+        merged = np.maximum(np.frombuffer(self.registers, dtype=np.uint8),
+                            np.frombuffer(other.registers, dtype=np.uint8))
+        self.registers = bytearray(merged.tobytes())
+        return self
+
+    def count(self) -> int:
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / float(np.sum(np.ldexp(1.0, -registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            # Small-range correction (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_string(self) -> str:
+        """Compact form (mostly-empty registers compress well)."""
+        return f"{self.p}:" + base64.b64encode(zlib.compress(bytes(self.registers))).decode("ascii")
+
+    @classmethod
+    def from_string(cls, value: str) -> "HyperLogLog":
+        p, _, data = value.partition(":")
+        return cls(int(p), bytearray(zlib.decompress(base64.b64decode(data))))
+
+
+# -----------------------------
+# t-digest
+# -----------------------------
+class TDigest:
+    def __init__(self, compression: float = 100.0):
+        self.compression = compression
+        self._means = np.empty(0)
+        self._weights = np.empty(0)
+        self._buffer: List[float] = []
+        self._buffer_weights: List[float] = []
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def count(self) -> float:
+        return float(self._weights.sum()) + sum(self._buffer_weights)
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        self._buffer.append(value)
+        self._buffer_weights.append(weight)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        other._compress()
+        self._buffer.extend(other._means.tolist())
+        self._buffer_weights.extend(other._weights.tolist())
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k(self, q: np.ndarray) -> np.ndarray:
+        return self.compression / (2 * math.pi) * np.arcsin(2 * np.clip(q, 0.0, 1.0) - 1)
+
+    def _compress(self) -> None:
+        if not self._buffer:
+            return
+        means = np.concatenate([self._means, np.asarray(self._buffer, dtype=np.float64)])
+        weights = np.concatenate([self._weights, np.asarray(self._buffer_weights, dtype=np.float64)])
+        self._buffer, self._buffer_weights = [], []
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # A centroid may grow while it spans at most one unit of k-scale
+        k_right = self._k(np.cumsum(weights) / total).tolist()
+        out_means: List[float] = []
+        out_weights: List[float] = []
+        k_left = prev_k = float(self._k(np.array(0.0)))
+        sum_mw, sum_w = 0.0, 0.0
+        for mean, weight, k in zip(means.tolist(), weights.tolist(), k_right):
+            if sum_w and k - k_left > 1.0:
+                out_means.append(sum_mw / sum_w)
+                out_weights.append(sum_w)
+                k_left = prev_k
+                sum_mw, sum_w = 0.0, 0.0
+            sum_mw += mean * weight
+            sum_w += weight
+            prev_k = k
+        if sum_w:
+            out_means.append(sum_mw / sum_w)
+            out_weights.append(sum_w)
+        self._means = np.asarray(out_means)
+        self._weights = np.asarray(out_weights)
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not len(self._means):
+            return None
+        if len(self._means) == 1:
+            return float(self._means[0])
+        total = self._weights.sum()
+        centers = np.cumsum(self._weights) - self._weights / 2
+        positions = np.concatenate([[0.0], centers, [total]])
+        values = np.concatenate([[self.min], self._means, [self.max]])
+        return float(np.interp(q * total, positions, values))
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._compress()
+        return {"compression": self.compression, "means": [round(m, 6) for m in self._means.tolist()],
+                "weights": self._weights.tolist(),
+                "min": self.min if self._means.size else None, "max": self.max if self._means.size else None}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TDigest":
+        digest = cls(data.get("compression", 100.0))
+        digest._means = np.asarray(data.get("means") or [], dtype=np.float64)
+        digest._weights = np.asarray(data.get("weights") or [], dtype=np.float64)
+        if digest._means.size:
+            digest.min, digest.max = data["min"], data["max"]
+        return digest
+
+    @classmethod
+    def of(cls, values: Iterable[float], compression: float = 100.0) -> "TDigest":
+        digest = cls(compression)
+        for value in values:
+            digest.add(value)
+        return digest